@@ -161,11 +161,7 @@ class AstInterpreter(interpreterbase.InterpreterBase):
         with open(absname, encoding='utf8') as f:
             code = f.read()
         assert(isinstance(code, str))
-        try:
-            codeblock = mparser.Parser(code, absname).parse()
-        except mesonlib.MesonException as me:
-            me.file = absname
-            raise me
+        codeblock = self.parse_code(code, absname)
 
         self.subdir = subdir
         for i in self.visitors:
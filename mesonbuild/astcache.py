@@ -0,0 +1,150 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A persistent cache of parsed build files.
+
+Every reconfigure reads and parses all meson.build files again, even though
+most of them did not change. The cache stores the parsed `CodeBlockNode` of
+each file together with a hash of the code it was parsed from, so unchanged
+files are unpickled instead of being lexed and parsed.
+"""
+
+import hashlib
+import os
+import pickle
+import typing as T
+
+from . import mlog
+from . import mparser
+from .coredata import version as coredata_version
+
+# Bump this whenever the layout of the stored entries changes.
+CACHE_FORMAT_VERSION = 1
+# Upper bound of entries kept on disk, least recently used ones are evicted.
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class ASTCache:
+
+    """An on disk store of parsed build files.
+
+    There is one entry per file name, so an entry is replaced as soon as the
+    file is parsed with different contents. Entries start with a small header
+    holding the file name and the hash of its contents, which is checked
+    before the much larger AST is unpickled. Entries of files that are not
+    parsed anymore, for example because they were removed, are evicted least
+    recently used first once there are more than max_entries of them.
+    """
+
+    def __init__(self, directory: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+        self.evict()
+
+    def _path(self, filename: str) -> str:
+        # The file name is also stored in the nodes, relative ones must match
+        # as they are, and in addition refer to the same file.
+        key = '\0'.join([os.path.abspath(filename), filename])
+        digest = hashlib.sha256(key.encode('utf-8', errors='surrogateescape')).hexdigest()
+        return os.path.join(self.directory, digest + '.dat')
+
+    @staticmethod
+    def _header(filename: str, code: str) -> T.Tuple[T.Any, ...]:
+        content = hashlib.sha256(code.encode('utf-8', errors='surrogateescape')).hexdigest()
+        return (CACHE_FORMAT_VERSION, coredata_version, filename, content)
+
+    def get(self, filename: str, code: str) -> T.Optional[mparser.CodeBlockNode]:
+        path = self._path(filename)
+        try:
+            with open(path, 'rb') as f:
+                if pickle.load(f) != self._header(filename, code):
+                    return None
+                ast = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            # Anything can go wrong when unpickling a damaged entry, in which
+            # case the file is simply parsed again.
+            return None
+        if not isinstance(ast, mparser.CodeBlockNode):
+            return None
+        return ast
+
+    def put(self, filename: str, code: str, ast: mparser.CodeBlockNode) -> None:
+        path = self._path(filename)
+        tempfilename = '{}.{}~'.format(path, os.getpid())
+        try:
+            with open(tempfilename, 'wb') as f:
+                pickle.dump(self._header(filename, code), f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(ast, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tempfilename, path)
+        except (OSError, pickle.PicklingError, RecursionError) as e:
+            mlog.debug('Could not store the AST of {!r} in {!r}: {}'.format(filename, self.directory, e))
+            try:
+                os.unlink(tempfilename)
+            except OSError:
+                pass
+
+    def parse(self, code: str, filename: str) -> mparser.CodeBlockNode:
+        """Parse code read from filename, or return the cached result."""
+        ast = self.get(filename, code)
+        if ast is None:
+            warnings = mlog.log_warnings_counter
+            ast = mparser.Parser(code, filename).parse()
+            # Files with warnings are parsed every time, so that the
+            # warnings are not lost on reconfigure.
+            if mlog.log_warnings_counter == warnings:
+                self.put(filename, code, ast)
+        return ast
+
+    def evict(self) -> int:
+        """Remove the least recently used entries above max_entries."""
+        entries = []  # type: T.List[T.Tuple[float, str]]
+        try:
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    try:
+                        entries.append((e.stat().st_mtime, e.path))
+                    except OSError:
+                        pass
+        except OSError:
+            return 0
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return 0
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        return excess
+
+
+_caches = {}  # type: T.Dict[str, T.Optional[ASTCache]]
+
+def get_ast_cache(directory: str) -> T.Optional[ASTCache]:
+    """Return the AST cache stored in directory, or None if it is not usable."""
+    directory = os.path.abspath(directory)
+    try:
+        return _caches[directory]
+    except KeyError:
+        pass
+    try:
+        cache = ASTCache(directory)  # type: T.Optional[ASTCache]
+    except OSError as e:
+        mlog.debug('AST cache {!r} is not usable: {}'.format(directory, e))
+        cache = None
+    _caches[directory] = cache
+    return cache
@@ -34,6 +34,7 @@ from ..mesonlib import (
     File, MachineChoice, MesonException, OrderedSet, OptionOverrideProxy,
     classify_unity_sources, unholder
 )
+from .serialisation import ExecutableSerialisation
 
 if T.TYPE_CHECKING:
     from ..interpreter import Interpreter, Test
@@ -103,19 +104,6 @@ class TargetInstallData:
         self.install_mode = install_mode
         self.optional = optional
 
-class ExecutableSerialisation:
-    def __init__(self, cmd_args, env=None, exe_wrapper=None,
-                 workdir=None, extra_paths=None, capture=None) -> None:
-        self.cmd_args = cmd_args
-        self.env = env or {}
-        if exe_wrapper is not None:
-            assert(isinstance(exe_wrapper, dependencies.ExternalProgram))
-        self.exe_runner = exe_wrapper
-        self.workdir = workdir
-        self.extra_paths = extra_paths
-        self.capture = capture
-        self.pickled = False
-
 class TestSerialisation:
     def __init__(self, name: str, project: str, suite: str, fname: T.List[str],
                  is_cross_built: bool, exe_wrapper: T.Optional[dependencies.ExternalProgram],
@@ -417,8 +405,8 @@ class Backend:
         if not force_serialize:
             if not capture:
                 return None, ''
-            return ((self.environment.get_build_command() +
-                    ['--internal', 'exe', '--capture', capture, '--'] + exe_cmd + cmd_args),
+            return ((self.get_internal_command() +
+                    ['exe', '--capture', capture, '--'] + exe_cmd + cmd_args),
                     ', '.join(reasons))
 
         workdir = workdir or self.environment.get_build_dir()
@@ -443,9 +431,13 @@ class Backend:
                                          exe_wrapper, workdir,
                                          extra_paths, capture)
             pickle.dump(es, f)
-        return (self.environment.get_build_command() + ['--internal', 'exe', '--unpickle', exe_data],
+        return (self.get_internal_command() + ['exe', '--unpickle', exe_data],
                 ', '.join(reasons))
 
+    def get_internal_command(self) -> T.List[str]:
+        """The command prefix of helper scripts run for every target."""
+        return self.environment.get_build_command() + ['--internal']
+
     def serialize_tests(self):
         test_data = os.path.join(self.environment.get_scratch_dir(), 'meson_test_setup.dat')
         with open(test_data, 'wb') as datafile:
@@ -543,7 +535,8 @@ class Backend:
 
     def determine_rpath_dirs(self, target):
         if self.environment.coredata.get_builtin_option('layout') == 'mirror':
-            result = target.get_link_dep_subdirs()
+            # A copy, the set is cached by the target
+            result = OrderedSet(target.get_link_dep_subdirs())
         else:
             result = OrderedSet()
             result.add('meson-out')
@@ -12,12 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import typing as T
+import json
 import os
 import re
 import pickle
 import shlex
+import shutil
+import socket
 import subprocess
+import sys
+import tempfile
+import multiprocessing
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum, unique
 import itertools
 from pathlib import PurePath, Path
@@ -39,15 +46,20 @@ from ..compilers import (
     VisualStudioLikeCompiler,
 )
 from ..linkers import ArLinker, VisualStudioLinker
+from ..scripts import helperclient
 from ..mesonlib import (
     File, LibType, MachineChoice, MesonException, OrderedSet, PerMachine,
     ProgressBar, quote_arg, unholder,
 )
 from ..mesonlib import get_compiler_for_source, has_path_sep
 from .backends import CleanTrees
+from .serialisation import TargetDependencyScannerInfo
 from ..build import InvalidArguments
 from ..interpreter import Interpreter
 
+# Targets below which generating them in another process does not pay off
+GENERATE_TARGETS_PER_JOB = 64
+
 FORTRAN_INCLUDE_PAT = r"^\s*#?include\s*['\"](\w+\.\w+)['\"]"
 FORTRAN_MODULE_PAT = r"^\s*\bmodule\b\s+(\w+)\s*(?:!+.*)*$"
 FORTRAN_SUBMOD_PAT = r"^\s*\bsubmodule\b\s*\((\w+:?\w+)\)\s*(\w+)"
@@ -116,6 +128,7 @@ raw_names = {'DEPFILE_UNQUOTED', 'DESC', 'pool', 'description', 'targetdep', 'dy
 
 NINJA_QUOTE_BUILD_PAT = re.compile(r"[$ :\n]")
 NINJA_QUOTE_VAR_PAT = re.compile(r"[$ \n]")
+NINJA_VAR_PAT = re.compile(r"\$(?:([$ :])|\{([\w-]+)\}|([\w-]+))")
 
 def ninja_quote(text, is_build_line=False):
     if is_build_line:
@@ -134,11 +147,6 @@ Please report this error with a test case to the Meson bug tracker.'''.format(te
         raise MesonException(errmsg)
     return quote_re.sub(r'$\g<0>', text)
 
-class TargetDependencyScannerInfo:
-    def __init__(self, private_dir: str, source2object: T.Dict[str, str]):
-        self.private_dir = private_dir
-        self.source2object = source2object
-
 @unique
 class Quoting(Enum):
     both = 0
@@ -302,6 +310,7 @@ class NinjaBuildElement:
         self.orderdeps = OrderedSet()
         self.elems = []
         self.all_outputs = all_outputs
+        self.use_rspfile = None  # type: T.Optional[bool]
 
     def add_dep(self, dep):
         if isinstance(dep, list):
@@ -344,7 +353,8 @@ class NinjaBuildElement:
 
     def count_rule_references(self):
         if self.rulename != 'phony':
-            if self._should_use_rspfile():
+            self.use_rspfile = self._should_use_rspfile()
+            if self.use_rspfile:
                 self.rule.rsprefcount += 1
             else:
                 self.rule.refcount += 1
@@ -356,7 +366,9 @@ class NinjaBuildElement:
         implicit_outs = ' '.join([ninja_quote(i, True) for i in self.implicit_outfilenames])
         if implicit_outs:
             implicit_outs = ' | ' + implicit_outs
-        use_rspfile = self._should_use_rspfile()
+        use_rspfile = self.use_rspfile
+        if use_rspfile is None:
+            use_rspfile = self._should_use_rspfile()
         if use_rspfile:
             rulename = self.rulename + '_RSP'
             mlog.debug("Command line for building %s is long, using a response file" % self.outfilenames)
@@ -399,12 +411,73 @@ class NinjaBuildElement:
             outfile.write(line)
         outfile.write('\n')
 
+    def evaluate_command(self):
+        '''The command ninja runs for this statement.
+
+        Response files are expanded, as `ninja -t compdb -x` does.
+        '''
+        use_rspfile = self.use_rspfile
+        if use_rspfile is None:
+            use_rspfile = self._should_use_rspfile()
+        if not use_rspfile:
+            qf = quote_func
+        elif self.rule.rspfile_quote_style == 'cl':
+            qf = cmd_quote
+        else:
+            qf = gcc_rsp_quote
+
+        ninja_vars = {
+            'in': ' '.join([quote_func(i.replace('\\', '/')) for i in self.infilenames]),
+            'out': ' '.join([quote_func(i.replace('\\', '/')) for i in self.outfilenames]),
+        }
+        for (name, elems) in self.elems:
+            should_quote = name not in raw_names
+            ninja_vars[name] = ' '.join([qf(i) if should_quote and i != '&&' else i for i in elems])
+
+        def expand(m):
+            if m.group(1):
+                return m.group(1)
+            return ninja_vars.get(m.group(2) or m.group(3), '')
+
+        def evaluate(x, rule_qf):
+            if x.quoting == Quoting.none:
+                return NINJA_VAR_PAT.sub(expand, x.s)
+            elif x.quoting == Quoting.notNinja:
+                return NINJA_VAR_PAT.sub(expand, rule_qf(x.s))
+            elif x.quoting == Quoting.notShell:
+                return x.s
+            return rule_qf(str(x))
+
+        command = [evaluate(x, quote_func) for x in self.rule.command]
+        command += [evaluate(x, qf) for x in self.rule.args]
+        return ' '.join(command)
+
     def check_outputs(self):
         for n in self.outfilenames:
             if n in self.all_outputs:
                 raise MesonException('Multiple producers for Ninja target "{}". Please rename your targets.'.format(n))
             self.all_outputs[n] = True
 
+class GeneratedTarget(T.NamedTuple):
+
+    """Statements and backend state of a target generated by a worker."""
+
+    tid: str
+    elements: T.List[T.Union[NinjaBuildElement, NinjaComment]]
+    rules: T.List[T.Union[NinjaRule, NinjaComment]]
+    introspection_data: T.Optional[T.Dict[T.Tuple[str, T.Tuple[str, ...]], T.Dict[str, T.Any]]]
+    fortran_deps: T.Optional[T.Dict[str, File]]
+    rpath_dirs_to_remove: T.Optional[T.Set[bytes]]
+
+# The backend generating targets in parallel, inherited by the forked workers
+_forked_backend = None  # type: T.Optional[NinjaBackend]
+
+def _init_generate_worker() -> None:
+    _forked_backend.init_generate_worker()
+
+def _generate_targets_in_worker(tids: T.List[str]) -> T.List[GeneratedTarget]:
+    return _forked_backend.generate_targets_in_worker(tids)
+
 class NinjaBackend(backends.Backend):
 
     def __init__(self, build: T.Optional[build.Build], interpreter: T.Optional[Interpreter]):
@@ -514,14 +587,35 @@ int dummy;
 
 '''.format(num_pools))
 
-        with self.detect_vs_dep_prefix(tempfilename) as outfile:
+        with self.detect_vs_dep_prefix(tempfilename) as outfile, \
+                tempfile.TemporaryFile('w+', encoding='utf-8', dir=self.environment.get_build_dir()) as builds:
             self.generate_rules()
 
+            # Statements are written out as soon as their target has been
+            # generated and only collected in build_elements in between.
+            # Rules are written last, once it is known which of them need
+            # their response file variant.
             self.build_elements = []
+            self.subninja_files = OrderedDict()  # type: T.Dict[str, str]
+            use_subninja = self.environment.coredata.backend_options['backend_subninja'].value
             self.generate_phony()
             self.add_build_comment(NinjaComment('Build rules for targets'))
-            for t in ProgressBar(self.build.get_targets().values(), desc='Generating targets'):
-                self.generate_target(t)
+            self.write_builds(builds)
+            targets = list(self.build.get_targets().values())
+            jobs = self.get_generate_jobs(len(targets))
+            if jobs > 1:
+                generated = self.generate_targets_parallel(targets, jobs)
+            else:
+                generated = self.generate_targets_serial(targets)
+            self.compdb_rules = self.get_compdb_rules()
+            self.compdb_entries = []  # type: T.List[T.Tuple[str, T.Dict[str, str]]]
+            for t, elements in generated:
+                if use_subninja:
+                    # The statements of the target go to its subdir's file
+                    self.write_subninja_elements(t.get_subdir(), elements)
+                else:
+                    self.write_elements(builds, elements)
+                self.add_compdb_entries(t, elements)
             self.add_build_comment(NinjaComment('Test rules'))
             self.generate_tests()
             self.add_build_comment(NinjaComment('Install rules'))
@@ -534,9 +628,12 @@ int dummy;
             self.add_build_comment(NinjaComment('Suffix'))
             self.generate_utils()
             self.generate_ending()
+            self.write_builds(builds)
 
             self.write_rules(outfile)
-            self.write_builds(outfile)
+            builds.seek(0)
+            shutil.copyfileobj(builds, outfile)
+            self.write_subninjas(outfile)
 
             default = 'default all\n\n'
             outfile.write(default)
@@ -546,26 +643,51 @@ int dummy;
         mlog.cmd_ci_include(outfilename)  # For CI debugging
         self.generate_compdb()
 
-    # http://clang.llvm.org/docs/JSONCompilationDatabase.html
-    def generate_compdb(self):
-        rules = []
+    def get_compdb_rules(self) -> T.Set[str]:
+        rules = set()
         # TODO: Rather than an explicit list here, rules could be marked in the
         # rule store as being wanted in compdb
         for for_machine in MachineChoice:
             for lang in self.environment.coredata.compilers[for_machine]:
-                rules += ["%s%s" % (rule, ext) for rule in [self.get_compiler_rule_name(lang, for_machine)]
-                          for ext in ['', '_RSP']]
-                rules += ["%s%s" % (rule, ext) for rule in [self.get_pch_rule_name(lang, for_machine)]
-                          for ext in ['', '_RSP']]
-        compdb_options = ['-x'] if mesonlib.version_compare(self.ninja_version, '>=1.9') else []
-        ninja_compdb = self.ninja_command + ['-t', 'compdb'] + compdb_options + rules
+                rules.add(self.get_compiler_rule_name(lang, for_machine))
+                rules.add(self.get_pch_rule_name(lang, for_machine))
+        return rules
+
+    def add_compdb_entries(self, target, elements):
         builddir = self.environment.get_build_dir()
-        try:
-            jsondb = subprocess.check_output(ninja_compdb, cwd=builddir)
-            with open(os.path.join(builddir, 'compile_commands.json'), 'wb') as f:
-                f.write(jsondb)
-        except Exception:
-            mlog.warning('Could not create compilation database.')
+        for e in elements:
+            if isinstance(e, NinjaBuildElement) and e.rulename in self.compdb_rules:
+                self.compdb_entries.append((target.subproject, {
+                    'directory': builddir,
+                    'command': e.evaluate_command(),
+                    'file': e.infilenames[0].replace('\\', '/'),
+                    'output': e.outfilenames[0].replace('\\', '/'),
+                }))
+
+    # http://clang.llvm.org/docs/JSONCompilationDatabase.html
+    def generate_compdb(self):
+        builddir = self.environment.get_build_dir()
+        self.write_compdb(os.path.join(builddir, 'compile_commands.json'),
+                          [e for _, e in self.compdb_entries])
+        if self.environment.coredata.backend_options['backend_compdb_per_subproject'].value:
+            subprojects = OrderedDict()  # type: T.Dict[str, T.List[T.Dict[str, str]]]
+            for subproject, e in self.compdb_entries:
+                if subproject:
+                    subprojects.setdefault(subproject, []).append(e)
+            for subproject, entries in subprojects.items():
+                subdir = os.path.join(builddir, self.build.get_subproject_dir(), subproject)
+                os.makedirs(subdir, exist_ok=True)
+                self.write_compdb(os.path.join(subdir, 'compile_commands.json'), entries)
+        self.compdb_entries = []
+
+    @staticmethod
+    def write_compdb(filename, entries):
+        # Left untouched when nothing changed, so that tools watching the
+        # file do not reindex everything after each reconfigure.
+        with open(filename + '~', 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=2)
+            f.write('\n')
+        mesonlib.replace_if_different(filename, filename + '~')
 
     # Get all generated headers. Any source file might need them so
     # we need to add an order dependency to them.
@@ -687,6 +809,110 @@ int dummy;
                 return True
         return False
 
+    def get_generate_jobs(self, num_targets: int) -> int:
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return 1
+        jobs = self.environment.coredata.backend_options['backend_generate_jobs'].value
+        if jobs == 0:
+            jobs = min(multiprocessing.cpu_count(), num_targets // GENERATE_TARGETS_PER_JOB)
+        return max(jobs, 1)
+
+    def get_internal_command(self) -> T.List[str]:
+        cmd = super().get_internal_command()
+        if not self.environment.coredata.backend_options['backend_helper_server'].value:
+            return cmd
+        # The client is run by path, which needs Meson to be installed as
+        # plain files, and the server forks and passes file descriptors.
+        client = helperclient.__file__
+        if (not hasattr(os, 'fork') or not hasattr(socket, 'AF_UNIX') or
+                getattr(sys, 'frozen', False) or not client.endswith('.py')):
+            return cmd
+        sockpath = os.path.join(self.environment.get_scratch_dir(), 'helper.sock')
+        return [sys.executable, '-S', client, sockpath] + cmd
+
+    def generate_targets_serial(self, targets: T.List[build.Target]) -> T.Iterator[T.Tuple[build.Target, T.List[NinjaBuildElement]]]:
+        for t in ProgressBar(targets, desc='Generating targets'):
+            start = len(self.build_elements)
+            self.generate_target(t)
+            elements = self.build_elements[start:]
+            del self.build_elements[start:]
+            yield t, elements
+
+    def generate_targets_parallel(self, targets: T.List[build.Target], jobs: int) -> T.Iterator[T.Tuple[build.Target, T.List[NinjaBuildElement]]]:
+        '''Generate the statements of targets in forked worker processes.
+
+        Each worker generates the statements of a target on its own, without
+        those of its dependencies, and sends them back together with the
+        state the rest of the backend needs. The results are merged in the
+        order of the targets, so the output does not depend on the number of
+        workers.
+        '''
+        global _forked_backend
+        chunksize = max(1, min(GENERATE_TARGETS_PER_JOB, len(targets) // (jobs * 4)))
+        chunks = [[t.get_id() for t in targets[i:i + chunksize]]
+                  for i in range(0, len(targets), chunksize)]
+        # Anything buffered would be written again by every worker
+        sys.stdout.flush()
+        if mlog.log_file is not None:
+            mlog.log_file.flush()
+        _forked_backend = self
+        try:
+            with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_init_generate_worker) as executor:
+                results = executor.map(_generate_targets_in_worker, chunks)
+                for chunk in ProgressBar(results, total=len(chunks), desc='Generating targets'):
+                    for result in chunk:
+                        yield self.merge_generated_target(result)
+        finally:
+            _forked_backend = None
+
+    def init_generate_worker(self) -> None:
+        # Targets that are not generated by the worker itself are already
+        # generated by another one, the worker does not need their state.
+        self.processed_targets = dict.fromkeys(self.build.get_targets(), True)
+
+    def generate_targets_in_worker(self, tids: T.List[str]) -> T.List[GeneratedTarget]:
+        results = []
+        for tid in tids:
+            target = self.build.get_targets()[tid]
+            del self.processed_targets[tid]
+            start = len(self.build_elements)
+            num_rules = len(self.rules)
+            self.generate_target(target)
+            elements = self.build_elements[start:]
+            del self.build_elements[start:]
+            for e in elements:
+                # Restored by merge_generated_target
+                if isinstance(e, NinjaBuildElement):
+                    e.all_outputs = None
+                    e.rule = None
+            results.append(GeneratedTarget(tid, elements, self.rules[num_rules:],
+                                           self.introspection_data.get(tid),
+                                           self.fortran_deps.get(target.get_basename()),
+                                           getattr(target, 'rpath_dirs_to_remove', None)))
+        if mlog.log_file is not None:
+            mlog.log_file.flush()
+        return results
+
+    def merge_generated_target(self, result: GeneratedTarget) -> T.Tuple[build.Target, T.List[NinjaBuildElement]]:
+        target = self.build.get_targets()[result.tid]
+        for rule in result.rules:
+            if rule.name not in self.ruledict:
+                self.add_rule(rule)
+        for e in result.elements:
+            if isinstance(e, NinjaBuildElement):
+                e.all_outputs = self.all_outputs
+                if e.rulename in self.ruledict:
+                    e.rule = self.ruledict[e.rulename]
+        self.processed_targets[result.tid] = True
+        if result.introspection_data is not None:
+            self.introspection_data[result.tid] = result.introspection_data
+        if result.fortran_deps is not None:
+            self.fortran_deps[target.get_basename()] = result.fortran_deps
+        if result.rpath_dirs_to_remove is not None:
+            target.rpath_dirs_to_remove = result.rpath_dirs_to_remove
+        return target, result.elements
+
     def generate_target(self, target):
         try:
             if isinstance(target, build.BuildTarget):
@@ -1065,7 +1291,8 @@ int dummy;
                                     self.build.get_subproject_dir()),
                        self.environment.get_build_dir(),
                        self.environment.get_log_dir()] +
-                      (['--use_llvm_cov'] if use_llvm_cov else []))
+                      (['--use_llvm_cov'] if use_llvm_cov else []) +
+                      (['--single-pass'] if self.environment.coredata.get_builtin_option('coverage_single_pass') else []))
 
     def generate_coverage_rules(self):
         e = NinjaBuildElement(self.all_outputs, 'meson-coverage', 'CUSTOM_COMMAND', 'PHONY')
@@ -1191,17 +1418,61 @@ int dummy;
                 mlog.warning("build statement for {} references non-existent rule {}".format(build.outfilenames, build.rulename))
 
     def write_rules(self, outfile):
-        for b in self.build_elements:
-            if isinstance(b, NinjaBuildElement):
-                b.count_rule_references()
-
         for r in self.rules:
             r.write(outfile)
 
-    def write_builds(self, outfile):
-        for b in ProgressBar(self.build_elements, desc='Writing build.ninja'):
+    @staticmethod
+    def write_elements(outfile, elements):
+        for b in elements:
+            if isinstance(b, NinjaBuildElement):
+                b.count_rule_references()
             b.write(outfile)
 
+    def write_builds(self, outfile):
+        self.write_elements(outfile, self.build_elements)
+        self.build_elements = []
+
+    @staticmethod
+    def subninja_filename(subdir: str) -> str:
+        # Every subdir gets its own name: '%' and '@' are escaped before '@'
+        # stands in for the separators, and no subdir starts with one.
+        if subdir:
+            name = subdir.replace('%', '%25').replace('@', '%40').replace('\\', '/').replace('/', '@')
+        else:
+            name = '@root'
+        return os.path.join('meson-private', 'subninja', name + '.ninja')
+
+    def write_subninja_elements(self, subdir, elements):
+        if subdir in self.subninja_files:
+            filename = self.subninja_files[subdir]
+            mode = 'a'
+        else:
+            filename = os.path.join(self.environment.get_build_dir(), self.subninja_filename(subdir))
+            self.subninja_files[subdir] = filename
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            mode = 'w'
+        with open(filename + '~', mode, encoding='utf-8') as f:
+            self.write_elements(f, elements)
+
+    def write_subninjas(self, outfile):
+        '''Include the statements written to the file of each subdir.
+
+        Files whose content did not change are left untouched, so that a
+        reconfigure only rewrites the parts of the build graph that changed.
+        Files of subdirs that no longer have targets are removed.
+        '''
+        subninja_dir = os.path.join(self.environment.get_build_dir(), 'meson-private', 'subninja')
+        if not self.subninja_files and not os.path.isdir(subninja_dir):
+            return
+        for subdir, filename in self.subninja_files.items():
+            mesonlib.replace_if_different(filename, filename + '~')
+            outfile.write('subninja {}\n'.format(ninja_quote(self.subninja_filename(subdir).replace('\\', '/'), True)))
+        if self.subninja_files:
+            outfile.write('\n')
+        current = {os.path.basename(f) for f in self.subninja_files.values()}
+        for f in set(os.listdir(subninja_dir)) - current:
+            os.unlink(os.path.join(subninja_dir, f))
+
     def generate_phony(self):
         self.add_build_comment(NinjaComment('Phony build target, always out of date'))
         elem = NinjaBuildElement(self.all_outputs, 'PHONY', 'phony', '')
@@ -1890,9 +2161,8 @@ int dummy;
                                                                      isinstance(compiler, DmdDCompiler)) else 'gcc',
                                         extra=pool))
 
-        args = self.environment.get_build_command() + \
-            ['--internal',
-             'symbolextractor',
+        args = self.get_internal_command() + \
+            ['symbolextractor',
              self.environment.get_build_dir(),
              '$in',
              '$IMPLIB',
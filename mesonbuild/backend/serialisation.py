@@ -0,0 +1,45 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Data written by the backends for the `meson --internal` helper scripts.
+
+These helpers run once per build step, so unpickling their data must not
+import the modules that configure a project. Keep the imports of this
+module to the standard library.
+"""
+
+import typing as T
+
+if T.TYPE_CHECKING:
+    from ..dependencies import ExternalProgram
+
+
+class ExecutableSerialisation:
+    def __init__(self, cmd_args: T.List[str], env: T.Optional[T.Dict[str, str]] = None,
+                 exe_wrapper: T.Optional['ExternalProgram'] = None,
+                 workdir: T.Optional[str] = None, extra_paths: T.Optional[T.List[str]] = None,
+                 capture: T.Optional[str] = None) -> None:
+        self.cmd_args = cmd_args
+        self.env = env or {}
+        self.exe_runner = exe_wrapper
+        self.workdir = workdir
+        self.extra_paths = extra_paths
+        self.capture = capture
+        self.pickled = False
+
+
+class TargetDependencyScannerInfo:
+    def __init__(self, private_dir: str, source2object: T.Dict[str, str]):
+        self.private_dir = private_dir
+        self.source2object = source2object
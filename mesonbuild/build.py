@@ -25,6 +25,8 @@ import typing as T
 from . import environment
 from . import dependencies
 from . import mlog
+from . import sectionfile
+from .sectionfile import SectionedObject, SectionRef
 from .mesonlib import (
     File, MesonException, MachineChoice, PerMachine, OrderedSet, listify,
     extract_as_list, typeslistify, stringlistify, classify_unity_sources,
@@ -169,11 +171,22 @@ class Man:
         return self.sources
 
 
-class Build:
+class Build(SectionedObject):
     """A class that holds the status of one build including
     all dependencies and so on.
     """
 
+    # How build.dat is split, so that tools like mtest only unpickle what
+    # they use. The environment and the targets are shared with the other
+    # sections by reference.
+    sections = {
+        'environment': ('environment',),
+        'targets': ('targets',),
+        'tests': ('tests', 'benchmarks'),
+        'test_setups': ('test_setups', 'test_setup_default_name'),
+        'install': ('headers', 'man', 'data', 'install_scripts', 'install_dirs'),
+    }
+
     def __init__(self, environment: environment.Environment):
         self.project_name = 'name of master project'
         self.project_version = None
@@ -206,6 +219,23 @@ class Build:
         self.searched_programs = set() # The list of all programs that have been searched for.
         self.dependency_overrides = PerMachine({}, {})
 
+    def _section_refs(self, section: str) -> T.Dict[int, SectionRef]:
+        refs = {}  # type: T.Dict[int, SectionRef]
+        if section == 'environment':
+            return refs
+        refs[id(self.environment)] = ('environment',)
+        if section != 'targets':
+            for k, t in self.targets.items():
+                refs[id(t)] = ('target', k)
+        return refs
+
+    def _resolve_section_ref(self, ref: SectionRef) -> T.Any:
+        if ref == ('environment',):
+            return self.environment
+        if ref[0] == 'target':
+            return self.targets[ref[1]]
+        return super()._resolve_section_ref(ref)
+
     def copy(self):
         other = Build(self.environment)
         for k, v in self.__dict__.items():
@@ -854,33 +884,45 @@ class BuildTarget(Target):
         return self.get_transitive_link_deps()
 
     @lru_cache(maxsize=None)
-    def get_transitive_link_deps(self):
-        result = []
+    def get_link_dep_closure(self) -> OrderedSet:
+        '''All targets reachable through link_targets, without duplicates.
+
+        Targets are in the order of a depth first walk, each at its first
+        position. The closures of the link targets are memoized as well, so
+        this is linear in the size of the graph even when there are many
+        paths to the same library. The other transitive link dependency
+        queries below are computed from it.
+        '''
+        result = OrderedSet()
         for i in self.link_targets:
-            result += i.get_all_link_deps()
+            result.add(i)
+            result.update(i.get_link_dep_closure())
         return result
 
+    @lru_cache(maxsize=None)
+    def get_transitive_link_deps(self):
+        # Static libraries are linked into their users, only the shared
+        # libraries they link to are needed at run time.
+        return [t for t in self.get_link_dep_closure() if isinstance(t, SharedLibrary)]
+
     def get_link_deps_mapping(self, prefix, environment):
         return self.get_transitive_link_deps_mapping(prefix, environment)
 
     @lru_cache(maxsize=None)
     def get_transitive_link_deps_mapping(self, prefix, environment):
         result = {}
-        for i in self.link_targets:
-            mapping = i.get_link_deps_mapping(prefix, environment)
-            #we are merging two dictionaries, while keeping the earlier one dominant
-            result_tmp = mapping.copy()
-            result_tmp.update(result)
-            result = result_tmp
+        for i in self.get_transitive_link_deps():
+            # The first library with a given install name is the one found
+            # at run time.
+            result.setdefault(*i.get_install_name_mapping(prefix, environment))
         return result
 
     @lru_cache(maxsize=None)
     def get_link_dep_subdirs(self):
         result = OrderedSet()
-        for i in self.link_targets:
+        for i in self.get_link_dep_closure():
             if not isinstance(i, StaticLibrary):
                 result.add(i.get_subdir())
-            result.update(i.get_link_dep_subdirs())
         return result
 
     def get_default_install_dir(self, environment):
@@ -1091,17 +1133,15 @@ This will become a hard error in a future Meson release.''')
     def get_extra_args(self, language):
         return self.extra_args.get(language, [])
 
-    def get_dependencies(self, exclude=None):
-        transitive_deps = []
-        if exclude is None:
-            exclude = []
+    @lru_cache(maxsize=None)
+    def get_dependencies(self):
+        '''The targets to link with, including what static libraries link with.'''
+        result = OrderedSet()
         for t in itertools.chain(self.link_targets, self.link_whole_targets):
-            if t in transitive_deps or t in exclude:
-                continue
-            transitive_deps.append(t)
+            result.add(t)
             if isinstance(t, StaticLibrary):
-                transitive_deps += t.get_dependencies(transitive_deps + exclude)
-        return transitive_deps
+                result.update(t.get_dependencies())
+        return list(result)
 
     def get_source_subdir(self):
         return self.subdir
@@ -1799,17 +1839,15 @@ class SharedLibrary(BuildTarget):
         self.basic_filename_tpl = '{0.prefix}{0.name}.{0.suffix}'
         self.determine_filenames(environment)
 
-    def get_link_deps_mapping(self, prefix, environment):
-        result = {}
-        mappings = self.get_transitive_link_deps_mapping(prefix, environment)
+    def get_install_name_mapping(self, prefix, environment):
         old = get_target_macos_dylib_install_name(self)
-        if old not in mappings:
-            fname = self.get_filename()
-            outdirs, _ = self.get_install_dir(self.environment)
-            new = os.path.join(prefix, outdirs[0], fname)
-            result.update({old: new})
-        mappings.update(result)
-        return mappings
+        outdirs, _ = self.get_install_dir(self.environment)
+        return old, os.path.join(prefix, outdirs[0], self.get_filename())
+
+    def get_link_deps_mapping(self, prefix, environment):
+        result = dict(self.get_transitive_link_deps_mapping(prefix, environment))
+        result.setdefault(*self.get_install_name_mapping(prefix, environment))
+        return result
 
     def get_default_install_dir(self, environment):
         return environment.get_shared_lib_dir()
@@ -2349,6 +2387,9 @@ class CustomTarget(Target):
     def get_link_dep_subdirs(self):
         return OrderedSet()
 
+    def get_link_dep_closure(self) -> OrderedSet:
+        return OrderedSet()
+
     def get_all_link_deps(self):
         return []
 
@@ -2504,6 +2545,9 @@ class CustomTargetIndex:
     def get_link_dep_subdirs(self):
         return self.target.get_link_dep_subdirs()
 
+    def get_link_dep_closure(self) -> OrderedSet:
+        return self.target.get_link_dep_closure()
+
     def is_linkable_target(self):
         suf = os.path.splitext(self.output)[-1]
         if suf == '.a' or suf == '.dll' or suf == '.lib' or suf == '.so':
@@ -2618,11 +2662,10 @@ def load(build_dir: str) -> Build:
     load_fail_msg = 'Build data file {!r} is corrupted. Try with a fresh build tree.'.format(filename)
     nonexisting_fail_msg = 'No such build data file as "{!r}".'.format(filename)
     try:
-        with open(filename, 'rb') as f:
-            obj = pickle.load(f)
+        obj, _ = sectionfile.load(filename, Build)
     except FileNotFoundError:
         raise MesonException(nonexisting_fail_msg)
-    except (pickle.UnpicklingError, EOFError):
+    except (pickle.UnpicklingError, EOFError, sectionfile.SectionFileException):
         raise MesonException(load_fail_msg)
     except AttributeError:
         raise MesonException(
@@ -2630,10 +2673,13 @@ def load(build_dir: str) -> Build:
             "exist. This probably means that it was generated with an old "
             "version of meson. Try running from the source directory "
             "meson {} --wipe".format(filename, build_dir))
-    if not isinstance(obj, Build):
-        raise MesonException(load_fail_msg)
     return obj
 
 def save(obj: Build, filename: str) -> None:
-    with open(filename, 'wb') as f:
-        pickle.dump(obj, f)
+    data = sectionfile.dumps(obj)
+    # Replaced rather than written over, so that loaded objects can still
+    # read their remaining sections from the previous file.
+    tempfilename = filename + '~'
+    with open(tempfilename, 'wb') as f:
+        f.write(data)
+    os.replace(tempfilename, filename)
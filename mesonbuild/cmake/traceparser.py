@@ -142,9 +142,20 @@ class CMakeTraceParser:
         return version_compare(self.cmake_version, '<3.16')
 
     def parse(self, trace: T.Optional[str] = None) -> None:
+        # The JSON trace is read line by line, it can get very large for big
+        # projects and most of its lines are never decoded.
+        if self.trace_format == 'json-v1' and not self.requires_stderr():
+            if not self.trace_file_path.is_file():
+                raise CMakeException('CMake: Trace file "{}" not found'.format(str(self.trace_file_path)))
+            if self.trace_file_path.stat().st_size == 0:
+                raise CMakeException('CMake: The CMake trace was not provided or is empty')
+            with self.trace_file_path.open(encoding='utf-8', errors='ignore') as f:
+                self._parse_lines(self._lex_trace_json(f))
+            return
+
         # First load the trace (if required)
         if not self.requires_stderr():
-            if not self.trace_file_path.exists and not self.trace_file_path.is_file():
+            if not self.trace_file_path.is_file():
                 raise CMakeException('CMake: Trace file "{}" not found'.format(str(self.trace_file_path)))
             trace = self.trace_file_path.read_text(errors='ignore')
         if not trace:
@@ -155,10 +166,17 @@ class CMakeTraceParser:
         if self.trace_format == 'human':
             lexer1 = self._lex_trace_human(trace)
         elif self.trace_format == 'json-v1':
-            lexer1 = self._lex_trace_json(trace)
+            lexer1 = self._lex_trace_json(trace.splitlines())
         else:
             raise CMakeException('CMake: Internal error: Invalid trace format {}. Expected [human, json-v1]'.format(self.trace_format))
+        self._parse_lines(lexer1)
+
+    def _is_relevant(self, func: str) -> bool:
+        # Lines are lexed lazily, so this sees the delayed commands as they
+        # are when the line is reached.
+        return func in self.functions or func in self.delayed_commands
 
+    def _parse_lines(self, lexer1: T.Iterable[CMakeTraceLine]) -> None:
         # Primary pass -- parse everything
         for l in lexer1:
             # store the function if its execution should be delayed
@@ -647,6 +665,8 @@ class CMakeTraceParser:
             file = mo_file_line.group(1)
             line = mo_file_line.group(3)
             func = mo_file_line.group(4)
+            if not self._is_relevant(func.lower()):
+                continue
             args = mo_file_line.group(5)
             args = parse_generator_expressions(args)
             argl = args.split(' ')
@@ -654,10 +674,19 @@ class CMakeTraceParser:
 
             yield CMakeTraceLine(Path(file), int(line), func, argl)
 
-    def _lex_trace_json(self, trace: str) -> T.Generator[CMakeTraceLine, None, None]:
-        lines = trace.splitlines(keepends=False)
-        lines.pop(0)  # The first line is the version
+    def _lex_trace_json(self, trace: T.Iterable[str]) -> T.Generator[CMakeTraceLine, None, None]:
+        # The command is looked up in the raw line, so only the lines of
+        # relevant functions are decoded. A quoted "cmd": can only be the key,
+        # quotes in strings are escaped.
+        reg_cmd = re.compile(r'"cmd"\s*:\s*"([^"]*)"')
+        lines = iter(trace)
+        next(lines, None)  # The first line is the version
         for i in lines:
+            if not i.strip():
+                continue
+            mo_cmd = reg_cmd.search(i)
+            if mo_cmd and not self._is_relevant(mo_cmd.group(1).lower()):
+                continue
             data = json.loads(i)
             assert isinstance(data['file'], str)
             assert isinstance(data['line'], int)
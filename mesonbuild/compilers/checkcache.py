@@ -0,0 +1,185 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A persistent compiler check cache shared between build directories.
+
+The in-memory `CoreData.compiler_check_cache` only lives as long as a single
+build directory. When the `check_cache` option is set, results of cached
+compiles are additionally stored on disk, keyed on the same values as the
+in-memory cache plus a fingerprint of the compiler binaries, so that every
+build directory using the same compiler can reuse them.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import typing as T
+
+from .. import mlog
+from ..mesonlib import is_windows
+
+if T.TYPE_CHECKING:
+    from .compilers import Compiler
+    from ..coredata import CoreData, CompilerCheckCacheKey
+
+# Bump this whenever the layout of the stored entries changes.
+CACHE_FORMAT_VERSION = 1
+# Upper bound of entries kept on disk, least recently used ones are evicted.
+DEFAULT_MAX_ENTRIES = 20000
+# How many new entries may be stored before eviction runs again.
+EVICT_INTERVAL = 1000
+
+# Environment variables that change what the compiler finds without being
+# part of its command line.
+_FINGERPRINT_ENV_VARS = ('CPATH', 'C_INCLUDE_PATH', 'CPLUS_INCLUDE_PATH',
+                         'OBJC_INCLUDE_PATH', 'LIBRARY_PATH', 'INCLUDE', 'LIB',
+                         'SDKROOT', 'MACOSX_DEPLOYMENT_TARGET')
+
+
+def default_cache_dir() -> str:
+    if is_windows():
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(base, 'meson', 'checkcache')
+
+
+_fingerprints = {}  # type: T.Dict[T.Tuple[str, ...], str]
+
+def compiler_fingerprint(compiler: 'Compiler') -> str:
+    """Identify the compiler binaries beyond their names.
+
+    Every element of the exelist that resolves to a file contributes its real
+    path, modification time and size, so upgrading a compiler in place
+    invalidates all of its entries.
+    """
+    exelist = tuple(compiler.get_exelist())
+    try:
+        return _fingerprints[exelist]
+    except KeyError:
+        pass
+    parts = [compiler.get_id(), compiler.version, compiler.full_version or '']  # type: T.List[T.Any]
+    for e in exelist:
+        path = shutil.which(e)
+        if path is None:
+            parts.append(e)
+            continue
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        parts.append([path, st.st_mtime_ns, st.st_size])
+    parts.append([os.environ.get(v) for v in _FINGERPRINT_ENV_VARS])
+    fingerprint = hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+    _fingerprints[exelist] = fingerprint
+    return fingerprint
+
+
+class CheckCache:
+
+    """An on disk store of compile check results.
+
+    Each entry is a small JSON file named after the hash of its key. Entries
+    are written atomically, so several configure processes may share the
+    same directory. The modification time of an entry is bumped on every hit
+    and used to evict the least recently used entries.
+    """
+
+    def __init__(self, directory: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.stored = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.evict()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + '.json')
+
+    @staticmethod
+    def digest(compiler: 'Compiler', key: 'CompilerCheckCacheKey') -> str:
+        data = [CACHE_FORMAT_VERSION, compiler_fingerprint(compiler), key]
+        return hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()
+
+    def get(self, digest: str) -> T.Optional[T.Dict[str, T.Any]]:
+        path = self._path(digest)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('version') != CACHE_FORMAT_VERSION:
+            return None
+        return entry
+
+    def put(self, digest: str, entry: T.Dict[str, T.Any]) -> None:
+        path = self._path(digest)
+        tempfilename = '{}.{}~'.format(path, os.getpid())
+        entry = dict(entry, version=CACHE_FORMAT_VERSION)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tempfilename, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tempfilename, path)
+        except OSError as e:
+            mlog.debug('Could not store compiler check in {!r}: {}'.format(self.directory, e))
+            return
+        self.stored += 1
+        if self.stored % EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove the least recently used entries above max_entries."""
+        entries = []  # type: T.List[T.Tuple[float, str]]
+        for root, _, files in os.walk(self.directory):
+            for f in files:
+                path = os.path.join(root, f)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    pass
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return 0
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        return excess
+
+
+_caches = {}  # type: T.Dict[str, T.Optional[CheckCache]]
+
+def get_check_cache(cdata: 'CoreData') -> T.Optional[CheckCache]:
+    """Return the persistent check cache selected by the check_cache option."""
+    value = cdata.get_builtin_option('check_cache')
+    assert isinstance(value, str)
+    if value == 'off':
+        return None
+    if value == 'user':
+        directory = default_cache_dir()
+    else:
+        directory = os.path.abspath(os.path.expanduser(value))
+    try:
+        return _caches[directory]
+    except KeyError:
+        pass
+    try:
+        cache = CheckCache(directory)  # type: T.Optional[CheckCache]
+    except OSError as e:
+        mlog.warning('Compiler check cache {!r} is not usable: {}'.format(directory, e))
+        cache = None
+    _caches[directory] = cache
+    return cache
@@ -16,10 +16,14 @@ import abc
 import contextlib, os.path, re
 import enum
 import itertools
+import threading
 import typing as T
-from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 
 from .. import coredata
+from . import checkcache
 from .. import mlog
 from .. import mesonlib
 from ..linkers import LinkerEnvVarsMixin
@@ -446,6 +450,100 @@ class CompileResult:
         self.text_mode = text_mode
 
 
+# Serializes the debug log of compiles that run in parallel
+_compile_log_lock = threading.Lock()
+
+
+class DeferredCompile(Exception):
+
+    """Raised by Compiler.cached_compile while a CheckBatch collects compiles."""
+
+
+class CheckBatch:
+
+    """Run independent compiler checks with their compiles in parallel.
+
+    Checks such as has_header() or has_function() are added with add() and
+    may do any number of cached compiles. run() calls every check while
+    collecting the compiles that are missing from the compiler check cache
+    instead of running them, runs all collected compiles on a pool of worker
+    threads, and then calls the checks that could not complete again. This
+    repeats until every check has a result, so compiles that depend on the
+    outcome of an earlier one, like the builtin fallback of has_function(),
+    only run when they are needed. Results are returned in the order the
+    checks were added and are the same as calling the checks one by one.
+    """
+
+    collecting = None  # type: T.Optional[CheckBatch]
+
+    def __init__(self, cdata: coredata.CoreData, num_workers: T.Optional[int] = None):
+        self.cdata = cdata
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.checks = []  # type: T.List[T.Callable[[], T.Any]]
+        self.pending = OrderedDict()  # type: T.Dict[coredata.CompilerCheckCacheKey, T.Tuple[Compiler, str, T.Union[None, T.List[str], CompilerArgs], str, T.Optional[str]]]
+        self.done = set()  # type: T.Set[coredata.CompilerCheckCacheKey]
+        self.fresh = set()  # type: T.Set[coredata.CompilerCheckCacheKey]
+
+    def add(self, func: T.Callable[..., T.Any], *args: T.Any, **kwargs: T.Any) -> None:
+        self.checks.append(partial(func, *args, **kwargs))
+
+    def defer(self, compiler: 'Compiler', key: 'coredata.CompilerCheckCacheKey', code: str,
+              extra_args: T.Union[None, T.List[str], CompilerArgs], mode: str,
+              temp_dir: T.Optional[str]) -> None:
+        # A compile that already ran in this batch but is not in the cache
+        # anymore is simply run in place to guarantee progress.
+        if key in self.done:
+            return
+        self.pending.setdefault(key, (compiler, code, extra_args, mode, temp_dir))
+        raise DeferredCompile()
+
+    def record(self, compiler: 'Compiler', key: 'coredata.CompilerCheckCacheKey', p: CompileResult) -> None:
+        """Store a result computed outside of the batch, reporting it as fresh."""
+        compiler._store_cached_compile(key, self.cdata, p)
+        self.fresh.add(key)
+
+    def take_fresh(self, key: 'coredata.CompilerCheckCacheKey') -> bool:
+        if key in self.fresh:
+            self.fresh.remove(key)
+            return True
+        return False
+
+    def _compile(self, key: 'coredata.CompilerCheckCacheKey') -> CompileResult:
+        compiler, code, extra_args, mode, temp_dir = self.pending[key]
+        with compiler.compile(code, extra_args=extra_args, mode=mode, want_output=False, temp_dir=temp_dir) as p:
+            return p
+
+    def _run_pending(self) -> None:
+        keys = list(self.pending)
+        with ThreadPoolExecutor(max_workers=min(self.num_workers, len(keys))) as executor:
+            results = list(executor.map(self._compile, keys))
+        for key, p in zip(keys, results):
+            self.pending[key][0]._store_cached_compile(key, self.cdata, p)
+        self.done.update(keys)
+        self.fresh.update(keys)
+        self.pending.clear()
+
+    def run(self) -> T.List[T.Any]:
+        results = [None] * len(self.checks)  # type: T.List[T.Any]
+        todo = list(range(len(self.checks)))
+        while todo:
+            retry = []  # type: T.List[int]
+            assert CheckBatch.collecting is None, 'CheckBatches cannot be nested'
+            CheckBatch.collecting = self
+            try:
+                for i in todo:
+                    try:
+                        results[i] = self.checks[i]()
+                    except DeferredCompile:
+                        retry.append(i)
+            finally:
+                CheckBatch.collecting = None
+            if self.pending:
+                self._run_pending()
+            todo = retry
+        return results
+
+
 class Compiler(metaclass=abc.ABCMeta):
     # Libraries to ignore in find_library() since they are provided by the
     # compiler or the C library. Currently only used for MSVC.
@@ -652,6 +750,12 @@ class Compiler(metaclass=abc.ABCMeta):
                dependencies: T.Optional[T.List['Dependency']] = None) -> int:
         raise EnvironmentException('Language %s does not support sizeof checks.' % self.get_display_language())
 
+    def sizeofs(self, typenames: T.List[str], prefix: str, env: 'Environment', *,
+                extra_args: T.Optional[T.List[str]] = None,
+                dependencies: T.Optional[T.List['Dependency']] = None) -> T.List[int]:
+        return [self.sizeof(t, prefix, env, extra_args=extra_args, dependencies=dependencies)
+                for t in typenames]
+
     def alignment(self, typename: str, prefix: str, env: 'Environment', *,
                  extra_args: T.Optional[T.List[str]] = None,
                  dependencies: T.Optional[T.List['Dependency']] = None) -> int:
@@ -668,6 +772,32 @@ class Compiler(metaclass=abc.ABCMeta):
         """
         raise EnvironmentException('Language %s does not support function checks.' % self.get_display_language())
 
+    def has_headers(self, hnames: T.List[str], prefix: str, env: 'Environment', *,
+                    extra_args: T.Optional[T.List[str]] = None,
+                    dependencies: T.Optional[T.List['Dependency']] = None) -> T.List[T.Tuple[bool, bool]]:
+        """Run has_header() for every header, compiling in parallel.
+
+        Returns a list with the result of has_header() for each header.
+        """
+        batch = self.check_batch(env)
+        for hname in hnames:
+            batch.add(self.has_header, hname, prefix, env, extra_args=extra_args,
+                      dependencies=dependencies)
+        return batch.run()
+
+    def has_functions(self, funcnames: T.List[str], prefix: str, env: 'Environment', *,
+                      extra_args: T.Optional[T.List[str]] = None,
+                      dependencies: T.Optional[T.List['Dependency']] = None) -> T.List[T.Tuple[bool, bool]]:
+        """Run has_function() for every function, compiling in parallel.
+
+        Returns a list with the result of has_function() for each function.
+        """
+        batch = self.check_batch(env)
+        for funcname in funcnames:
+            batch.add(self.has_function, funcname, prefix, env, extra_args=extra_args,
+                      dependencies=dependencies)
+        return batch.run()
+
     def unix_args_to_native(self, args: T.List[str]) -> T.List[str]:
         "Always returns a copy that can be independently mutated"
         return args.copy()
@@ -765,17 +895,20 @@ class Compiler(metaclass=abc.ABCMeta):
             commands += extra_args
             # Generate full command-line with the exelist
             command_list = self.get_exelist() + commands.to_native()
-            mlog.debug('Running compile:')
-            mlog.debug('Working directory: ', tmpdirname)
-            mlog.debug('Command line: ', ' '.join(command_list), '\n')
-            mlog.debug('Code:\n', contents)
             os_env = os.environ.copy()
             os_env['LC_ALL'] = 'C'
             if no_ccache:
                 os_env['CCACHE_DISABLE'] = '1'
             p, stdo, stde = Popen_safe(command_list, cwd=tmpdirname, env=os_env)
-            mlog.debug('Compiler stdout:\n', stdo)
-            mlog.debug('Compiler stderr:\n', stde)
+            # Log only once the compile is done so that compiles running in
+            # parallel in a CheckBatch do not interleave in the log.
+            with _compile_log_lock:
+                mlog.debug('Running compile:')
+                mlog.debug('Working directory: ', tmpdirname)
+                mlog.debug('Command line: ', ' '.join(command_list), '\n')
+                mlog.debug('Code:\n', contents)
+                mlog.debug('Compiler stdout:\n', stdo)
+                mlog.debug('Compiler stderr:\n', stde)
 
             result = CompileResult(stdo, stde, list(commands), p.returncode, p.pid, input_name=srcname)
             if want_output:
@@ -789,24 +922,70 @@ class Compiler(metaclass=abc.ABCMeta):
                        temp_dir: T.Optional[str] = None) -> T.Iterator[T.Optional[CompileResult]]:
         # TODO: There's isn't really any reason for this to be a context manager
 
-        # Calculate the key
-        textra_args = tuple(extra_args) if extra_args is not None else tuple()  # type: T.Tuple[str, ...]
-        key = (tuple(self.exelist), self.version, code, textra_args, mode)  # type: coredata.CompilerCheckCacheKey
+        key = self._check_cache_key(code, extra_args, mode)
 
         # Check if not cached, and generate, otherwise get from the cache
+        p = self._get_cached_compile(key, code, cdata)
+        if p is not None:
+            yield p
+            return
+
+        # While a CheckBatch collects compiles this raises instead of compiling
+        if CheckBatch.collecting is not None:
+            CheckBatch.collecting.defer(self, key, code, extra_args, mode, temp_dir)
+
+        with self.compile(code, extra_args=extra_args, mode=mode, want_output=False, temp_dir=temp_dir) as p:
+            self._store_cached_compile(key, cdata, p)
+            yield p
+
+    def _check_cache_key(self, code: str, extra_args: T.Union[None, T.List[str], CompilerArgs],
+                         mode: str) -> 'coredata.CompilerCheckCacheKey':
+        textra_args = tuple(extra_args) if extra_args is not None else tuple()  # type: T.Tuple[str, ...]
+        return (tuple(self.exelist), self.version, code, textra_args, mode)
+
+    def _get_cached_compile(self, key: 'coredata.CompilerCheckCacheKey', code: str,
+                            cdata: coredata.CoreData) -> T.Optional[CompileResult]:
         if key in cdata.compiler_check_cache:
             p = cdata.compiler_check_cache[key]  # type: CompileResult
-            p.cached = True
+            # Results compiled by the running CheckBatch are reported as fresh
+            p.cached = CheckBatch.collecting is None or not CheckBatch.collecting.take_fresh(key)
             mlog.debug('Using cached compile:')
             mlog.debug('Cached command line: ', ' '.join(p.command), '\n')
             mlog.debug('Code:\n', code)
             mlog.debug('Cached compiler stdout:\n', p.stdout)
             mlog.debug('Cached compiler stderr:\n', p.stderr)
-            yield p
-        else:
-            with self.compile(code, extra_args=extra_args, mode=mode, want_output=False, temp_dir=temp_dir) as p:
+            return p
+
+        # Then the persistent cache shared between build directories
+        check_cache = checkcache.get_check_cache(cdata)
+        if check_cache is not None:
+            entry = check_cache.get(check_cache.digest(self, key))
+            if entry is not None:
+                p = CompileResult(entry['stdout'], entry['stderr'], entry['args'],
+                                  entry['returncode'], command=entry['command'], cached=True)
                 cdata.compiler_check_cache[key] = p
-                yield p
+                mlog.debug('Using persistently cached compile:')
+                mlog.debug('Cached command line: ', ' '.join(p.command), '\n')
+                mlog.debug('Code:\n', code)
+                mlog.debug('Cached compiler stdout:\n', p.stdout)
+                mlog.debug('Cached compiler stderr:\n', p.stderr)
+                return p
+        return None
+
+    def _store_cached_compile(self, key: 'coredata.CompilerCheckCacheKey',
+                              cdata: coredata.CoreData, p: CompileResult) -> None:
+        cdata.compiler_check_cache[key] = p
+        # A failed check may succeed once a header or library is installed,
+        # which the entries do not track, so only successes are shared.
+        check_cache = checkcache.get_check_cache(cdata)
+        if check_cache is not None and p.returncode == 0:
+            check_cache.put(check_cache.digest(self, key),
+                            {'stdout': p.stdout, 'stderr': p.stderr, 'args': p.args,
+                             'returncode': p.returncode, 'command': p.command})
+
+    def check_batch(self, env: 'Environment') -> 'CheckBatch':
+        """Return a CheckBatch running its compiles on all cores."""
+        return CheckBatch(env.coredata)
 
     def get_colorout_args(self, colortype: str) -> T.List[str]:
         # TODO: colortype can probably be an emum
@@ -351,10 +351,8 @@ class CLikeCompiler(Compiler):
         return self.compiles(code.format(**fargs), env, extra_args=extra_args,
                              dependencies=dependencies)
 
-    def has_header(self, hname: str, prefix: str, env: 'Environment', *,
-                   extra_args: T.Optional[T.List[str]] = None,
-                   dependencies: T.Optional[T.List['Dependency']] = None,
-                   disable_cache: bool = False) -> T.Tuple[bool, bool]:
+    @staticmethod
+    def _has_header_code(hname: str, prefix: str) -> str:
         fargs = {'prefix': prefix, 'header': hname}
         code = '''{prefix}
         #ifdef __has_include
@@ -364,9 +362,47 @@ class CLikeCompiler(Compiler):
         #else
          #include <{header}>
         #endif'''
-        return self.compiles(code.format(**fargs), env, extra_args=extra_args,
+        return code.format(**fargs)
+
+    def has_header(self, hname: str, prefix: str, env: 'Environment', *,
+                   extra_args: T.Optional[T.List[str]] = None,
+                   dependencies: T.Optional[T.List['Dependency']] = None,
+                   disable_cache: bool = False) -> T.Tuple[bool, bool]:
+        return self.compiles(self._has_header_code(hname, prefix), env, extra_args=extra_args,
                              dependencies=dependencies, mode='preprocess', disable_cache=disable_cache)
 
+    def has_headers(self, hnames: T.List[str], prefix: str, env: 'Environment', *,
+                    extra_args: T.Optional[T.List[str]] = None,
+                    dependencies: T.Optional[T.List['Dependency']] = None) -> T.List[T.Tuple[bool, bool]]:
+        """Check for many headers with a single preprocessor run.
+
+        With __has_include all headers are looked up in one preprocessed
+        file that prints a marker for every header that exists. The outcome
+        is recorded as the result of the has_header() check for each header,
+        so only the headers that could not be decided this way, for instance
+        because the compiler lacks __has_include, get their own compile.
+        """
+        batch = self.check_batch(env)
+        args = self.build_wrapper_args(env, extra_args, dependencies, CompileCheckMode.PREPROCESS)
+        todo = [h for h in hnames if self._check_cache_key(self._has_header_code(h, prefix), args, 'preprocess')
+                not in env.coredata.compiler_check_cache]
+        if len(todo) > 1:
+            code = [prefix, '#ifndef __has_include', '#error "__has_include is not supported"', '#endif']
+            for i, hname in enumerate(todo):
+                code += ['#if __has_include("{}")'.format(hname),
+                         'meson_has_header_found {}'.format(i),
+                         '#endif']
+            with self._build_wrapper('\n'.join(code), env, extra_args, dependencies, mode='preprocess') as p:
+                if p.returncode == 0:
+                    found = {int(m) for m in re.findall(r'^\s*meson_has_header_found (\d+)\s*$', p.stdout, re.M)}
+                    for i, hname in enumerate(todo):
+                        key = self._check_cache_key(self._has_header_code(hname, prefix), args, 'preprocess')
+                        batch.record(self, key, compilers.CompileResult('', '', list(args), 0 if i in found else 1))
+        for hname in hnames:
+            batch.add(self.has_header, hname, prefix, env, extra_args=extra_args,
+                      dependencies=dependencies)
+        return batch.run()
+
     def has_header_symbol(self, hname: str, symbol: str, prefix: str,
                           env: 'Environment', *,
                           extra_args: T.Optional[T.List[str]] = None,
@@ -615,6 +651,49 @@ class CLikeCompiler(Compiler):
             raise mesonlib.EnvironmentException('Could not run sizeof test binary.')
         return int(res.stdout)
 
+    def sizeofs(self, typenames: T.List[str], prefix: str, env: 'Environment', *,
+                extra_args: T.Optional[T.List[str]] = None,
+                dependencies: T.Optional[T.List['Dependency']] = None) -> T.List[int]:
+        """Run sizeof() for many types with a single test program.
+
+        The types that compile are found with coalesced compiles and their
+        sizes printed by one program. Types that do not exist get -1 from a
+        regular sizeof() check, and cross builds do every check on its own.
+        """
+        if extra_args is None:
+            extra_args = []
+        if self.is_cross or len(typenames) < 2:
+            return [self.sizeof(t, prefix, env, extra_args=extra_args, dependencies=dependencies)
+                    for t in typenames]
+        bodies = ['\n        void meson_sizeof_{}(void) {{ (void) sizeof({}); }}'.format(i, t)
+                  for i, t in enumerate(typenames)]
+        sizes = {}  # type: T.Dict[int, int]
+
+        def fallback(i: int) -> bool:
+            sizes[i] = self.sizeof(typenames[i], prefix, env, extra_args=extra_args,
+                                   dependencies=dependencies)
+            return sizes[i] != -1
+
+        valid = self._coalesced_compiles(prefix, bodies, env, fallback,
+                                         extra_args=extra_args, dependencies=dependencies)
+        todo = [i for i, ok in enumerate(valid) if ok and i not in sizes]
+        if todo:
+            prints = ''.join('\n            printf("%d %ld\\n", {}, (long)(sizeof({})));'.format(i, typenames[i])
+                             for i in todo)
+            t = '''#include<stdio.h>
+        {prefix}
+        int main(void) {{{prints}
+            return 0;
+        }};'''
+            res = self.run(t.format(prefix=prefix, prints=prints), env, extra_args=extra_args,
+                           dependencies=dependencies)
+            if not res.compiled or res.returncode != 0:
+                raise mesonlib.EnvironmentException('Could not run sizeof test binary.')
+            for line in res.stdout.splitlines():
+                i, size = line.split()
+                sizes[int(i)] = int(size)
+        return [sizes.get(i, -1) for i in range(len(typenames))]
+
     def cross_alignment(self, typename: str, prefix: str, env: 'Environment', *,
                         extra_args: T.Optional[T.List[str]] = None,
                         dependencies: T.Optional[T.List['Dependency']] = None) -> int:
@@ -905,6 +984,37 @@ class CLikeCompiler(Compiler):
         return self.compiles(t.format(**fargs), env, extra_args=extra_args,
                              dependencies=dependencies)
 
+    def _coalesced_compiles(self, prefix: str, bodies: T.List[str], env: 'Environment',
+                            fallback: T.Callable[[int], bool], *,
+                            extra_args: T.Optional[T.List[str]] = None,
+                            dependencies: T.Optional[T.List['Dependency']] = None) -> T.List[bool]:
+        """Find out which code bodies compile after prefix with few compiles.
+
+        All bodies are compiled together in one translation unit. If that
+        fails the bodies are split in halves which are tried separately, down
+        to single bodies for which the fallback, usually the regular check,
+        decides. With k failing out of n bodies this needs about k * log2(n)
+        compiles instead of n.
+        """
+        results = [False] * len(bodies)
+
+        def check(indices: T.List[int]) -> None:
+            if len(indices) == 1:
+                results[indices[0]] = fallback(indices[0])
+                return
+            code = prefix + ''.join(bodies[i] for i in indices)
+            if self.compiles(code, env, extra_args=extra_args, dependencies=dependencies)[0]:
+                for i in indices:
+                    results[i] = True
+                return
+            half = len(indices) // 2
+            check(indices[:half])
+            check(indices[half:])
+
+        if bodies:
+            check(list(range(len(bodies))))
+        return results
+
     def has_type(self, typename: str, prefix: str, env: 'Environment', extra_args: T.List[str],
                  dependencies: T.Optional[T.List['Dependency']] = None) -> T.Tuple[bool, bool]:
         fargs = {'prefix': prefix, 'type': typename}
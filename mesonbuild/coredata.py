@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from . import mlog, mparser
+from . import mlog, mparser, sectionfile
 import pickle, os, uuid
 import sys
 from itertools import chain
@@ -22,6 +22,7 @@ from .mesonlib import (
     MesonException, EnvironmentException, MachineChoice, PerMachine,
     default_libdir, default_libexecdir, default_prefix, split_args
 )
+from .sectionfile import SectionedObject
 from .wrap import WrapMode
 import ast
 import argparse
@@ -365,7 +366,12 @@ _V = T.TypeVar('_V')
 # invocations of Meson. It is roughly the same thing as
 # cmakecache.
 
-class CoreData:
+class CoreData(SectionedObject):
+
+    # The compiler check results are only needed when reconfiguring.
+    sections = {
+        'compiler_check_cache': ('compiler_check_cache',),
+    }
 
     def __init__(self, options: argparse.Namespace, scratch_dir: str, meson_command: T.List[str]):
         self.lang_guids = {
@@ -547,6 +553,26 @@ class CoreData:
                     'Maximum number of linker processes to run or 0 for no '
                     'limit',
                     (0, None, 0))
+            self.backend_options['backend_subninja'] = \
+                UserBooleanOption(
+                    'Write the build statements of each subdirectory to a '
+                    'separate file that is only rewritten when it changes',
+                    False)
+            self.backend_options['backend_helper_server'] = \
+                UserBooleanOption(
+                    'Run internal helper commands of the build in a '
+                    'background server that keeps Meson loaded',
+                    False)
+            self.backend_options['backend_generate_jobs'] = \
+                UserIntegerOption(
+                    'Number of processes generating the build statements of '
+                    'targets or 0 to decide based on the number of targets',
+                    (0, None, 0))
+            self.backend_options['backend_compdb_per_subproject'] = \
+                UserBooleanOption(
+                    'Also write a compile_commands.json with the files of each '
+                    'subproject to its build directory',
+                    False)
         elif backend_name.startswith('vs'):
             self.backend_options['backend_startup_project'] = \
                 UserStringOption(
@@ -1004,19 +1030,19 @@ def load(build_dir: str) -> CoreData:
     filename = os.path.join(build_dir, 'meson-private', 'coredata.dat')
     load_fail_msg = 'Coredata file {!r} is corrupted. Try with a fresh build tree.'.format(filename)
     try:
-        with open(filename, 'rb') as f:
-            obj = pickle.load(f)
-    except (pickle.UnpicklingError, EOFError):
+        obj, metadata = sectionfile.load(filename, CoreData)
+        # Files in the sectioned format carry the version in their index,
+        # older ones are only checked once fully loaded.
+        file_version = metadata['version'] if 'version' in metadata else obj.version
+    except (pickle.UnpicklingError, EOFError, sectionfile.SectionFileException):
         raise MesonException(load_fail_msg)
     except AttributeError:
         raise MesonException(
             "Coredata file {!r} references functions or classes that don't "
             "exist. This probably means that it was generated with an old "
             "version of meson.".format(filename))
-    if not isinstance(obj, CoreData):
-        raise MesonException(load_fail_msg)
-    if major_versions_differ(obj.version, version):
-        raise MesonVersionMismatchException(obj.version, version)
+    if major_versions_differ(file_version, version):
+        raise MesonVersionMismatchException(file_version, version)
     return obj
 
 def save(obj: CoreData, build_dir: str) -> str:
@@ -1028,8 +1054,9 @@ def save(obj: CoreData, build_dir: str) -> str:
     if os.path.exists(filename):
         import shutil
         shutil.copyfile(filename, prev_filename)
+    data = sectionfile.dumps(obj, {'version': obj.version})
     with open(tempfilename, 'wb') as f:
-        pickle.dump(obj, f)
+        f.write(data)
         f.flush()
         os.fsync(f.fileno())
     os.replace(tempfilename, filename)
@@ -1172,6 +1199,8 @@ BUILTIN_CORE_OPTIONS = OrderedDict([
     ('backend',         BuiltinOption(UserComboOption, 'Backend to use', 'ninja', choices=backendlist)),
     ('buildtype',       BuiltinOption(UserComboOption, 'Build type to use', 'debug',
                                       choices=['plain', 'debug', 'debugoptimized', 'release', 'minsize', 'custom'])),
+    ('check_cache',     BuiltinOption(UserStringOption, "Directory of the compiler check cache shared between build directories, 'user' or 'off' (headers and libraries removed later are not noticed)", 'off')),
+    ('coverage_single_pass', BuiltinOption(UserBooleanOption, 'Generate all coverage reports from a single run of gcov', False)),
     ('debug',           BuiltinOption(UserBooleanOption, 'Debug', True)),
     ('default_library', BuiltinOption(UserComboOption, 'Default library type', 'shared', choices=['shared', 'static', 'both'],
                                       yielding=False)),
@@ -1186,6 +1215,7 @@ BUILTIN_CORE_OPTIONS = OrderedDict([
     ('warning_level',   BuiltinOption(UserComboOption, 'Compiler warning level to use', '1', choices=['0', '1', '2', '3'], yielding=False)),
     ('werror',          BuiltinOption(UserBooleanOption, 'Treat warnings as errors', False, yielding=False)),
     ('wrap_mode',       BuiltinOption(UserComboOption, 'Wrap mode', 'default', choices=['default', 'nofallback', 'nodownload', 'forcefallback'])),
+    ('wrap_prefetch',   BuiltinOption(UserBooleanOption, 'Download all wrap-file subprojects in parallel before they are used', False)),
     ('force_fallback_for', BuiltinOption(UserArrayOption, 'Force fallback for those subprojects', [])),
 ])  # type: OptionDictType
 
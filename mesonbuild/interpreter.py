@@ -12,6 +12,7 @@
 # limitations under the License.
 
 from . import mparser
+from . import astcache
 from . import environment
 from . import coredata
 from . import dependencies
@@ -285,8 +286,17 @@ class EnvironmentVariablesHolder(MutableInterpreterObject, ObjectHolder):
         if method != self.held_object.set and self.held_object.has_name(args[0]):
             mlog.warning('Overriding previous value of environment variable {!r} with a new one'
                          .format(args[0]), location=self.current_node)
+        self.copy_on_write()
+        method = getattr(self.held_object, method.__name__)
         self.held_object.add_var(method, args[0], args[1:], kwargs)
 
+    def copy_data(self):
+        env = build.EnvironmentVariables()
+        env.envvars = [(getattr(env, method.__name__), name, args, kwargs)
+                       for method, name, args, kwargs in self.held_object.envvars]
+        env.varnames = set(self.held_object.varnames)
+        self.held_object = env
+
     @stringArgs
     @permittedKwargs({'separator'})
     def set_method(self, args, kwargs):
@@ -329,6 +339,11 @@ class ConfigurationDataHolder(MutableInterpreterObject, ObjectHolder):
     def mark_used(self):
         self.used = True
 
+    def copy_data(self):
+        conf = build.ConfigurationData()
+        conf.values = self.held_object.values.copy()
+        self.held_object = conf
+
     def validate_args(self, args, kwargs):
         if len(args) == 1 and isinstance(args[0], list) and len(args[0]) == 2:
             mlog.deprecation('Passing a list as the single argument to '
@@ -358,17 +373,20 @@ class ConfigurationDataHolder(MutableInterpreterObject, ObjectHolder):
     @noArgsFlattening
     def set_method(self, args, kwargs):
         (name, val, desc) = self.validate_args(args, kwargs)
+        self.copy_on_write()
         self.held_object.values[name] = (val, desc)
 
     def set_quoted_method(self, args, kwargs):
         (name, val, desc) = self.validate_args(args, kwargs)
         if not isinstance(val, str):
             raise InterpreterException("Second argument to set_quoted must be a string.")
+        self.copy_on_write()
         escaped_val = '\\"'.join(val.split('"'))
         self.held_object.values[name] = ('"' + escaped_val + '"', desc)
 
     def set10_method(self, args, kwargs):
         (name, val, desc) = self.validate_args(args, kwargs)
+        self.copy_on_write()
         if val:
             self.held_object.values[name] = (1, desc)
         else:
@@ -421,6 +439,7 @@ class ConfigurationDataHolder(MutableInterpreterObject, ObjectHolder):
         if not isinstance(from_object, ConfigurationDataHolder):
             raise InterpreterException('Merge_from argument must be a configuration data object.')
         from_object = from_object.held_object
+        self.copy_on_write()
         for k, v in from_object.values.items():
             self.held_object.values[k] = v
 
@@ -1068,12 +1087,15 @@ class CompilerHolder(InterpreterObject):
                              'get_linker_id': self.get_linker_id_method,
                              'compute_int': self.compute_int_method,
                              'sizeof': self.sizeof_method,
+                             'sizeofs': self.sizeofs_method,
                              'get_define': self.get_define_method,
                              'check_header': self.check_header_method,
                              'has_header': self.has_header_method,
+                             'has_headers': self.has_headers_method,
                              'has_header_symbol': self.has_header_symbol_method,
                              'run': self.run_method,
                              'has_function': self.has_function_method,
+                             'has_functions': self.has_functions_method,
                              'has_member': self.has_member_method,
                              'has_members': self.has_members_method,
                              'has_type': self.has_type_method,
@@ -1339,6 +1361,38 @@ class CompilerHolder(InterpreterObject):
         mlog.log('Checking for function', mlog.bold(funcname, True), msg, hadtxt, cached)
         return had
 
+    @FeatureNew('compiler.has_functions', '0.57.0')
+    @permittedKwargs({
+        'prefix',
+        'no_builtin_args',
+        'include_directories',
+        'args',
+        'dependencies',
+    })
+    def has_functions_method(self, args, kwargs):
+        funcnames = mesonlib.listify(args)
+        if not funcnames:
+            raise InterpreterException('Has_functions takes at least one argument.')
+        check_stringlist(funcnames)
+        prefix = kwargs.get('prefix', '')
+        if not isinstance(prefix, str):
+            raise InterpreterException('Prefix argument of has_functions must be a string.')
+        extra_args = self.determine_args(kwargs)
+        deps, msg = self.determine_dependencies(kwargs)
+        results = self.compiler.has_functions(funcnames, prefix, self.environment,
+                                              extra_args=extra_args,
+                                              dependencies=deps)
+        found = {}
+        for funcname, (had, cached) in zip(funcnames, results):
+            cached = mlog.blue('(cached)') if cached else ''
+            if had:
+                hadtxt = mlog.green('YES')
+            else:
+                hadtxt = mlog.red('NO')
+            mlog.log('Checking for function', mlog.bold(funcname, True), msg, hadtxt, cached)
+            found[funcname] = had
+        return found
+
     @permittedKwargs({
         'prefix',
         'no_builtin_args',
@@ -1424,6 +1478,30 @@ class CompilerHolder(InterpreterObject):
         mlog.log('Checking for size of', mlog.bold(element, True), msg, esize)
         return esize
 
+    @FeatureNew('compiler.sizeofs', '0.57.0')
+    @permittedKwargs({
+        'prefix',
+        'no_builtin_args',
+        'include_directories',
+        'args',
+        'dependencies',
+    })
+    def sizeofs_method(self, args, kwargs):
+        elements = listify(args)
+        if not elements:
+            raise InterpreterException('Sizeofs takes at least one argument.')
+        check_stringlist(elements)
+        prefix = kwargs.get('prefix', '')
+        if not isinstance(prefix, str):
+            raise InterpreterException('Prefix argument of sizeofs must be a string.')
+        extra_args = functools.partial(self.determine_args, kwargs)
+        deps, msg = self.determine_dependencies(kwargs)
+        sizes = self.compiler.sizeofs(elements, prefix, self.environment,
+                                      extra_args=extra_args, dependencies=deps)
+        for element, esize in zip(elements, sizes):
+            mlog.log('Checking for size of', mlog.bold(element, True), msg, esize)
+        return dict(zip(elements, sizes))
+
     @FeatureNew('compiler.get_define', '0.40.0')
     @permittedKwargs({
         'prefix',
@@ -1573,6 +1651,40 @@ class CompilerHolder(InterpreterObject):
         mlog.log('Has header', mlog.bold(hname, True), msg, h, cached)
         return haz
 
+    @FeatureNew('compiler.has_headers', '0.57.0')
+    @permittedKwargs(header_permitted_kwargs)
+    def has_headers_method(self, args, kwargs):
+        hnames = mesonlib.listify(args)
+        if not hnames:
+            raise InterpreterException('has_headers method takes at least one argument.')
+        check_stringlist(hnames)
+        prefix = kwargs.get('prefix', '')
+        if not isinstance(prefix, str):
+            raise InterpreterException('Prefix argument of has_headers must be a string.')
+        disabled, required, feature = extract_required_kwarg(kwargs, self.subproject, default=False)
+        if disabled:
+            for hname in hnames:
+                mlog.log('Has header', mlog.bold(hname, True), 'skipped: feature', mlog.bold(feature), 'disabled')
+            return {hname: False for hname in hnames}
+        extra_args = functools.partial(self.determine_args, kwargs)
+        deps, msg = self.determine_dependencies(kwargs)
+        results = self.compiler.has_headers(hnames, prefix, self.environment,
+                                            extra_args=extra_args, dependencies=deps)
+        found = {}
+        for hname, (haz, cached) in zip(hnames, results):
+            cached = mlog.blue('(cached)') if cached else ''
+            if haz:
+                h = mlog.green('YES')
+            else:
+                h = mlog.red('NO')
+            mlog.log('Has header', mlog.bold(hname, True), msg, h, cached)
+            found[hname] = haz
+        missing = [h for h, haz in found.items() if not haz]
+        if required and missing:
+            raise InterpreterException('{} headers not found: {}'.format(
+                self.compiler.get_display_language(), ', '.join(missing)))
+        return found
+
     @FeatureNewKwargs('compiler.has_header_symbol', '0.50.0', ['required'])
     @permittedKwargs(header_permitted_kwargs)
     def has_header_symbol_method(self, args, kwargs):
@@ -2416,6 +2528,10 @@ class Interpreter(InterpreterBase):
         self.subproject_directory_name = subdir.split(os.path.sep)[-1]
         self.subproject_dir = subproject_dir
         self.option_file = os.path.join(self.source_root, self.subdir, 'meson_options.txt')
+        # Without a build directory, like for mock interpreters, there is
+        # nowhere to keep the cache.
+        scratch_dir = self.environment.get_scratch_dir()
+        self.ast_cache = astcache.get_ast_cache(os.path.join(scratch_dir, 'astcache')) if scratch_dir else None
         if not mock and ast is None:
             self.load_root_meson_file()
             self.sanity_check_ast()
@@ -3222,6 +3338,8 @@ external dependencies (including libraries) must go to "dependencies".''')
                 self.environment.wrap_resolver.merge_wraps(r)
             else:
                 self.environment.wrap_resolver = r
+            if self.coredata.get_builtin_option('wrap_prefetch'):
+                self.environment.wrap_resolver.prefetch(r.wraps.values())
 
         self.build.projects[self.subproject] = proj_name
         mlog.log('Project name:', mlog.bold(proj_name))
@@ -4116,6 +4234,8 @@ This will become a hard error in the future.''' % kwargs['input'], location=self
     def unpack_env_kwarg(self, kwargs) -> build.EnvironmentVariables:
         envlist = kwargs.get('env', EnvironmentVariablesHolder())
         if isinstance(envlist, EnvironmentVariablesHolder):
+            # Later changes of the variable go to the data handed out here
+            envlist.own_data()
             env = envlist.held_object
         elif isinstance(envlist, dict):
             FeatureNew.single_use('environment dictionary', '0.52.0', self.subproject)
@@ -4270,11 +4390,7 @@ This will become a hard error in the future.''' % kwargs['input'], location=self
         with open(absname, encoding='utf8') as f:
             code = f.read()
         assert(isinstance(code, str))
-        try:
-            codeblock = mparser.Parser(code, absname).parse()
-        except mesonlib.MesonException as me:
-            me.file = absname
-            raise me
+        codeblock = self.parse_code(code, absname)
         try:
             self.evaluate_codeblock(codeblock)
         except SubdirDoneRequest:
@@ -5031,9 +5147,12 @@ This will become a hard error in the future.''', location=self.current_node)
         if not isinstance(varname, str):
             raise InterpreterException('First argument must be a string.')
         try:
-            return self.variables[varname]
+            value = self.variables[varname]
         except KeyError:
             pass
+        else:
+            self.unshared_variables.discard(varname)
+            return value
         if len(args) == 2:
             return args[1]
         raise InterpreterException('Tried to get unknown variable "%s".' % varname)
@@ -20,10 +20,15 @@ from . import environment, dependencies
 
 import abc
 import os, copy, re
+import types
+import weakref
 import collections.abc
 from functools import wraps
 import typing as T
 
+if T.TYPE_CHECKING:
+    from .astcache import ASTCache
+
 TV_fw_var = T.Union[str, int, float, bool, list, dict, 'InterpreterObject', 'ObjectHolder']
 TV_fw_args = T.List[T.Union[mparser.BaseNode, TV_fw_var]]
 TV_fw_kwargs = T.Dict[str, T.Union[mparser.BaseNode, TV_fw_var]]
@@ -418,9 +423,50 @@ class ContinueRequest(BaseException):
 class BreakRequest(BaseException):
     pass
 
-class MutableInterpreterObject(InterpreterObject):
+class MutableInterpreterObject(InterpreterObject, metaclass=abc.ABCMeta):
+
+    """An object that can be modified by its methods.
+
+    Assigning such an object to a variable creates a copy of it. Copies
+    borrow the held data of the object they were made from until either of
+    them is about to be modified, so methods that modify it must call
+    copy_on_write() first. The copies then get their own data, the original
+    keeps modifying the data it holds, which whatever it was passed to
+    before may still use.
+    """
+
     def __init__(self) -> None:
         super().__init__()
+        # The object whose data this copy borrows, None if it owns its data
+        self.data_lender = None  # type: T.Optional[MutableInterpreterObject]
+        # The copies borrowing the data of this object
+        self.data_borrowers = weakref.WeakSet()  # type: weakref.WeakSet[MutableInterpreterObject]
+
+    def copy(self) -> 'MutableInterpreterObject':
+        new = copy.copy(self)
+        new.methods = {k: types.MethodType(m.__func__, new) if getattr(m, '__self__', None) is self else m
+                       for k, m in self.methods.items()}
+        lender = self.data_lender or self
+        new.data_lender = lender
+        new.data_borrowers = weakref.WeakSet()
+        lender.data_borrowers.add(new)
+        return new
+
+    def own_data(self) -> None:
+        """Stop borrowing the held data, like before handing it out."""
+        if self.data_lender is not None:
+            self.data_lender.data_borrowers.discard(self)
+            self.data_lender = None
+            self.copy_data()
+
+    def copy_on_write(self) -> None:
+        self.own_data()
+        for borrower in list(self.data_borrowers):
+            borrower.own_data()
+
+    @abc.abstractmethod
+    def copy_data(self) -> None:
+        """Replace the held data by a copy of it."""
 
 class Disabler(InterpreterObject):
     def __init__(self) -> None:
@@ -467,6 +513,10 @@ class InterpreterBase:
         self.root_subdir = subdir
         self.subproject = subproject
         self.variables = {}  # type: T.Dict[str, TYPE_var]
+        # Variables holding a list or dict that was created by += and that
+        # has not been read since. Nothing else can refer to their value, so
+        # the next += may extend it in place instead of copying it.
+        self.unshared_variables = set()  # type: T.Set[str]
         self.argument_depth = 0
         self.current_lineno = -1
         # Current node set during a function call. This can be used as location
@@ -477,6 +527,8 @@ class InterpreterBase:
         # If it was part of a if-clause, it is used to temporally override the
         # current meson version target within that if-block.
         self.tmp_meson_version = None # type: T.Optional[str]
+        # Parsed build files are looked up here before parsing them
+        self.ast_cache = None  # type: T.Optional[ASTCache]
 
     def load_root_meson_file(self) -> None:
         mesonfile = os.path.join(self.source_root, self.subdir, environment.build_filename)
@@ -487,10 +539,15 @@ class InterpreterBase:
         if code.isspace():
             raise InvalidCode('Builder file is empty.')
         assert(isinstance(code, str))
+        self.ast = self.parse_code(code, mesonfile)
+
+    def parse_code(self, code: str, filename: str) -> mparser.CodeBlockNode:
         try:
-            self.ast = mparser.Parser(code, mesonfile).parse()
+            if self.ast_cache is not None:
+                return self.ast_cache.parse(code, filename)
+            return mparser.Parser(code, filename).parse()
         except mesonlib.MesonException as me:
-            me.file = mesonfile
+            me.file = filename
             raise me
 
     def join_path_strings(self, args: T.Sequence[str]) -> str:
@@ -841,7 +898,10 @@ The result of this is undefined and will become a hard error in a future Meson r
         addition = self.evaluate_statement(node.value)
 
         # Remember that all variables are immutable. We must always create a
-        # full new variable and then assign it.
+        # full new variable and then assign it, unless no other value can
+        # refer to the old one. Repeated += on a list is then linear instead
+        # of quadratic.
+        unshared = varname in self.unshared_variables
         old_variable = self.get_variable(varname)
         new_value = None  # type: T.Union[str, int, float, bool, dict, list]
         if isinstance(old_variable, str):
@@ -853,18 +913,27 @@ The result of this is undefined and will become a hard error in a future Meson r
                 raise InvalidArguments('The += operator requires an int on the right hand side if the variable on the left is an int')
             new_value = old_variable + addition
         elif isinstance(old_variable, list):
-            if isinstance(addition, list):
-                new_value = old_variable + addition
+            if not isinstance(addition, list):
+                addition = [addition]
+            if unshared:
+                old_variable.extend(addition)
+                new_value = old_variable
             else:
-                new_value = old_variable + [addition]
+                new_value = old_variable + addition
         elif isinstance(old_variable, dict):
             if not isinstance(addition, dict):
                 raise InvalidArguments('The += operator requires a dict on the right hand side if the variable on the left is a dict')
-            new_value = {**old_variable, **addition}
+            if unshared:
+                old_variable.update(addition)
+                new_value = old_variable
+            else:
+                new_value = {**old_variable, **addition}
         # Add other data types here.
         else:
             raise InvalidArguments('The += operator currently only works with arrays, dicts, strings or ints')
         self.set_variable(varname, new_value)
+        if isinstance(new_value, (list, dict)):
+            self.unshared_variables.add(varname)
 
     def evaluate_indexing(self, node: mparser.IndexNode) -> TYPE_var:
         assert(isinstance(node, mparser.IndexNode))
@@ -1221,7 +1290,7 @@ To specify a keyword argument, use : instead of =.''')
             raise InvalidCode('Tried to assign an invalid value to variable.')
         # For mutable objects we need to make a copy on assignment
         if isinstance(value, MutableInterpreterObject):
-            value = copy.deepcopy(value)
+            value = value.copy()
         self.set_variable(var_name, value)
         return None
 
@@ -1237,11 +1306,14 @@ To specify a keyword argument, use : instead of =.''')
         if varname in self.builtin:
             raise InvalidCode('Tried to overwrite internal variable "%s"' % varname)
         self.variables[varname] = variable
+        self.unshared_variables.discard(varname)
 
     def get_variable(self, varname: str) -> TYPE_var:
         if varname in self.builtin:
             return self.builtin[varname]
         if varname in self.variables:
+            # The value may now be referred to from anywhere
+            self.unshared_variables.discard(varname)
             return self.variables[varname]
         raise InvalidCode('Unknown variable "%s".' % varname)
 
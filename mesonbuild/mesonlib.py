@@ -112,7 +112,14 @@ def verbose_git(cmd: T.List[str], workingdir: str, check: bool = False) -> bool:
         if check:
             raise GitException(m)
         return False
-    p, _, _ = git(cmd, workingdir, check, stdout=None, stderr=None)
+    if not mlog.output_captured():
+        p, _, _ = git(cmd, workingdir, check, stdout=None, stderr=None)
+        return p.returncode == 0
+    # Log the output instead, so it ends up with the rest of the captured output
+    p, o, _ = git(cmd, workingdir, stderr=subprocess.STDOUT)
+    mlog.log(o, end='')
+    if check and p.returncode != 0:
+        raise GitException('Git command failed: ' + str([GIT] + cmd), o)
     return p.returncode == 0
 
 def set_meson_command(mainfile: str) -> None:
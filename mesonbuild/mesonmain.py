@@ -20,18 +20,28 @@ import argparse
 import codecs
 import shutil
 
+# Only what `meson --internal` needs is imported here: helper scripts run
+# once per build step and should not pay for importing the whole of Meson.
 from . import mesonlib
 from . import mlog
-from . import mconf, mdist, minit, minstall, mintro, msetup, mtest, rewriter, msubprojects, munstable_coredata, mcompile
 from .mesonlib import MesonException
-from .environment import detect_msys2_arch
-from .wrap import wraptool
+
+# Map script name to module name for those that doesn't match
+SCRIPT_MAP = {'exe': 'meson_exe',
+              'install': 'meson_install',
+              'delsuffix': 'delwithsuffix',
+              'gtkdoc': 'gtkdochelper',
+              'hotdoc': 'hotdochelper',
+              'regencheck': 'regen_checker'}
 
 
 # Note: when adding arguments, please also add them to the completion
 # scripts in $MESONSRC/data/shell-completions/
 class CommandLineParser:
     def __init__(self):
+        from . import mconf, mdist, minit, minstall, mintro, msetup, mtest, rewriter, msubprojects, munstable_coredata, mcompile
+        from .wrap import wraptool
+
         self.term_width = shutil.get_terminal_size().columns
         self.formatter = lambda prog: argparse.HelpFormatter(prog, max_help_position=int(self.term_width / 2), width=self.term_width)
 
@@ -146,18 +156,12 @@ class CommandLineParser:
         finally:
             mlog.shutdown()
 
-def run_script_command(script_name, script_args):
-    # Map script name to module name for those that doesn't match
-    script_map = {'exe': 'meson_exe',
-                  'install': 'meson_install',
-                  'delsuffix': 'delwithsuffix',
-                  'gtkdoc': 'gtkdochelper',
-                  'hotdoc': 'hotdochelper',
-                  'regencheck': 'regen_checker'}
-    module_name = script_map.get(script_name, script_name)
+def script_module_name(script_name):
+    return 'mesonbuild.scripts.' + SCRIPT_MAP.get(script_name, script_name)
 
+def run_script_command(script_name, script_args):
     try:
-        module = importlib.import_module('mesonbuild.scripts.' + module_name)
+        module = importlib.import_module(script_module_name(script_name))
     except ModuleNotFoundError as e:
         mlog.exception(e)
         return 1
@@ -195,6 +199,7 @@ def run(original_args, mainfile):
     # https://github.com/mesonbuild/meson/issues/3653
     if sys.platform.lower() == 'msys':
         mlog.error('This python3 seems to be msys/python on MSYS2 Windows, which is known to have path semantics incompatible with Meson')
+        from .environment import detect_msys2_arch
         msys2_arch = detect_msys2_arch()
         if msys2_arch:
             mlog.error('Please install and use mingw-w64-i686-python3 and/or mingw-w64-x86_64-python3 with Pacman')
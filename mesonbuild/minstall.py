@@ -14,7 +14,13 @@
 
 import sys, pickle, os, shutil, subprocess, errno
 import argparse
+import collections
+import hashlib
+import json
 import shlex
+import threading
+import typing as T
+from concurrent.futures import Future, ThreadPoolExecutor
 from glob import glob
 from .scripts import depfixer
 from .scripts import destdir_join
@@ -29,12 +35,26 @@ except ImportError:
     # This is only used for pkexec which is not, so this is fine.
     main_file = None
 
+have_fcntl = False
+try:
+    import fcntl
+    have_fcntl = True
+except Exception:
+    pass
+
+# The ioctl to share the data blocks of two files, from <linux/fs.h>
+FICLONE = 0x40049409
+
 symlink_warning = '''Warning: trying to copy a symlink that points to a file. This will copy the file,
 but this will be changed in a future version of Meson to copy the symlink as is. Please update your
 build definitions so that it will not break when the change happens.'''
 
 selinux_updates = []
 
+# Output of the work a thread is doing for Installer.submit()
+_thread_output = threading.local()
+_chown_lock = threading.Lock()
+
 def add_arguments(parser):
     parser.add_argument('-C', default='.', dest='wd',
                         help='directory to cd into before running')
@@ -46,6 +66,14 @@ def add_arguments(parser):
                         help='Only overwrite files that are older than the copied file.')
     parser.add_argument('--quiet', default=False, action='store_true',
                         help='Do not print every file that was installed.')
+    parser.add_argument('--incremental', default=False, action='store_true',
+                        help='Skip files that did not change since they were last installed '
+                             'with --incremental.')
+    parser.add_argument('--copy-mode', default='copy', choices=['copy', 'hardlink', 'reflink'],
+                        help='How to copy files, hardlink and reflink fall back to copying '
+                             'where the file system does not support them (default: copy).')
+    parser.add_argument('--num-processes', default=os.cpu_count() or 1, type=int,
+                        help='How many files to install in parallel.')
 
 class DirMaker:
     def __init__(self, lf):
@@ -81,11 +109,21 @@ def is_executable(path, follow_symlinks=False):
     '''Checks whether any of the "x" bits are set in the source file mode.'''
     return bool(os.stat(path, follow_symlinks=follow_symlinks).st_mode & 0o111)
 
+def print_message(msg):
+    lines = getattr(_thread_output, 'lines', None)
+    if lines is None:
+        print(msg)
+    else:
+        lines.append((None, msg))
+
 def append_to_log(lf, line):
+    lines = getattr(_thread_output, 'lines', None)
+    if lines is not None:
+        lines.append((lf, line))
+        return
     lf.write(line)
     if not line.endswith('\n'):
         lf.write('\n')
-    lf.flush()
 
 def set_chown(path, user=None, group=None, dir_fd=None, follow_symlinks=True):
     # shutil.chown will call os.chown without passing all the parameters
@@ -94,16 +132,18 @@ def set_chown(path, user=None, group=None, dir_fd=None, follow_symlinks=True):
     # be actually passed properly.
     # Not nice, but better than actually rewriting shutil.chown until
     # this python bug is fixed: https://bugs.python.org/issue18108
-    real_os_chown = os.chown
-    try:
-        os.chown = lambda p, u, g: real_os_chown(p, u, g,
-                                                 dir_fd=dir_fd,
-                                                 follow_symlinks=follow_symlinks)
-        shutil.chown(path, user, group)
-    except Exception:
-        raise
-    finally:
-        os.chown = real_os_chown
+    # The lock keeps threads from replacing it at the same time.
+    with _chown_lock:
+        real_os_chown = os.chown
+        try:
+            os.chown = lambda p, u, g: real_os_chown(p, u, g,
+                                                     dir_fd=dir_fd,
+                                                     follow_symlinks=follow_symlinks)
+            shutil.chown(path, user, group)
+        except Exception:
+            raise
+        finally:
+            os.chown = real_os_chown
 
 def set_chmod(path, mode, dir_fd=None, follow_symlinks=True):
     try:
@@ -121,7 +161,17 @@ def sanitize_permissions(path, umask):
         set_chmod(path, new_perms, follow_symlinks=False)
     except PermissionError as e:
         msg = '{!r}: Unable to set permissions {!r}: {}, ignoring...'
-        print(msg.format(path, new_perms, e.strerror))
+        print_message(msg.format(path, new_perms, e.strerror))
+
+def mode_is_unchanged(path, mode, default_umask):
+    '''Whether set_mode() would leave the permissions and owner of path as they are.'''
+    if mode is not None and (mode.perms_s or mode.owner or mode.group) is not None:
+        return False
+    if default_umask == 'preserve':
+        return True
+    perms = os.stat(path).st_mode & 0o7777
+    new_perms = 0o777 if perms & 0o111 else 0o666
+    return perms == new_perms & ~default_umask
 
 def set_mode(path, mode, default_umask):
     if mode is None or (mode.perms_s or mode.owner or mode.group) is None:
@@ -134,14 +184,14 @@ def set_mode(path, mode, default_umask):
             set_chown(path, mode.owner, mode.group, follow_symlinks=False)
         except PermissionError as e:
             msg = '{!r}: Unable to set owner {!r} and group {!r}: {}, ignoring...'
-            print(msg.format(path, mode.owner, mode.group, e.strerror))
+            print_message(msg.format(path, mode.owner, mode.group, e.strerror))
         except LookupError:
             msg = '{!r}: Non-existent owner {!r} or group {!r}: ignoring...'
-            print(msg.format(path, mode.owner, mode.group))
+            print_message(msg.format(path, mode.owner, mode.group))
         except OSError as e:
             if e.errno == errno.EINVAL:
                 msg = '{!r}: Non-existent numeric owner {!r} or group {!r}: ignoring...'
-                print(msg.format(path, mode.owner, mode.group))
+                print_message(msg.format(path, mode.owner, mode.group))
             else:
                 raise
     # Must set permissions *after* setting owner/group otherwise the
@@ -152,10 +202,54 @@ def set_mode(path, mode, default_umask):
             set_chmod(path, mode.perms, follow_symlinks=False)
         except PermissionError as e:
             msg = '{!r}: Unable to set permissions {!r}: {}, ignoring...'
-            print(msg.format(path, mode.perms_s, e.strerror))
+            print_message(msg.format(path, mode.perms_s, e.strerror))
     else:
         sanitize_permissions(path, default_umask)
 
+def reflink_file(from_file, to_file):
+    '''Copy from_file to to_file sharing their data blocks, or at least
+    copying them in the kernel.
+
+    Returns False if the file system supports neither, a partial to_file may
+    be left behind then.
+    '''
+    with open(from_file, 'rb') as src, open(to_file, 'wb') as dst:
+        if have_fcntl and sys.platform.startswith('linux'):
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return True
+            except OSError:
+                pass
+        if not hasattr(os, 'copy_file_range'):
+            return False
+        # copy_file_range shares the blocks itself on file systems like
+        # Btrfs and XFS, and does server side copies on NFS.
+        try:
+            while os.copy_file_range(src.fileno(), dst.fileno(), 1 << 30) > 0:
+                pass
+        except OSError:
+            return False
+    return True
+
+def copy_file(from_file, to_file, copy_mode='copy'):
+    '''Copy from_file with its metadata to to_file, which must not exist.
+
+    Hard links share the permissions of the file, and changes made to one
+    of them, like stripping, show up in the other.
+    '''
+    if copy_mode == 'hardlink':
+        try:
+            os.link(from_file, to_file)
+            return
+        except OSError:
+            # Across file systems for example
+            pass
+    elif copy_mode == 'reflink':
+        if reflink_file(from_file, to_file):
+            shutil.copystat(from_file, to_file)
+            return
+    shutil.copy2(from_file, to_file)
+
 def restore_selinux_contexts():
     '''
     Restores the SELinux context for files in @selinux_updates
@@ -219,6 +313,88 @@ def check_for_stampfile(fname):
                 return files[0]
     return fname
 
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def mode_params(mode):
+    return None if mode is None else (mode.perms_s, mode.owner, mode.group)
+
+class InstallManifest:
+
+    '''The installed files and the files they were installed from.
+
+    Stored as JSON in meson-private/install-manifest.json, separately for
+    every DESTDIR. For each installed file it holds the size and
+    modification time of both files, a hash of the source, and the
+    parameters of the installation, like the mode and whether it was
+    stripped. A file is unchanged if it is still as it was installed, and
+    its source still has the same size and modification time or, after a
+    rebuild that produced the same file again, the same hash.
+    '''
+
+    VERSION = 1
+
+    def __init__(self, filename, destdir):
+        self.filename = filename
+        self.destdir = destdir
+        self.lock = threading.Lock()
+        self.destdirs = {}  # type: T.Dict[str, T.Dict[str, T.Dict[str, T.Any]]]
+        try:
+            with open(filename, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self.destdirs = data['destdirs']
+        except (OSError, ValueError, AttributeError, KeyError):
+            pass
+        self.old = self.destdirs.get(destdir, {})
+        # Files installed, or found unchanged, by this run
+        self.new = {}  # type: T.Dict[str, T.Dict[str, T.Any]]
+
+    def is_unchanged(self, from_file, to_file, params):
+        entry = self.old.get(to_file)
+        if entry is None or entry['params'] != params or os.path.islink(from_file):
+            return False
+        try:
+            src = os.stat(from_file)
+            dst = os.stat(to_file)
+        except OSError:
+            return False
+        if [dst.st_size, dst.st_mtime_ns] != entry['installed']:
+            return False
+        source = [src.st_size, src.st_mtime_ns, entry['source'][2]]
+        if source[:2] != entry['source'][:2]:
+            if src.st_size != entry['source'][0] or file_hash(from_file) != entry['source'][2]:
+                return False
+        with self.lock:
+            self.new[to_file] = dict(entry, source=source)
+        return True
+
+    def record(self, from_file, to_file, params):
+        '''Add to_file after it was installed from from_file.'''
+        if os.path.islink(from_file):
+            return
+        src = os.stat(from_file)
+        dst = os.stat(to_file)
+        entry = {'source': [src.st_size, src.st_mtime_ns, file_hash(from_file)],
+                 'installed': [dst.st_size, dst.st_mtime_ns],
+                 'params': params}
+        with self.lock:
+            self.new[to_file] = entry
+
+    def save(self):
+        self.destdirs[self.destdir] = self.new
+        tempfilename = self.filename + '~'
+        try:
+            with open(tempfilename, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'destdirs': self.destdirs}, f)
+            os.replace(tempfilename, self.filename)
+        except OSError as e:
+            print('Could not write install manifest {!r}: {}'.format(self.filename, e))
+
 class Installer:
 
     def __init__(self, options, lf):
@@ -226,10 +402,86 @@ class Installer:
         self.options = options
         self.lf = lf
         self.preserved_file_count = 0
+        self.unchanged_file_count = 0
+        self.manifest = None  # type: T.Optional[InstallManifest]
+        self.lock = threading.Lock()
+        self.executor = None  # type: T.Optional[ThreadPoolExecutor]
+        # Work submitted to the executor in order, with the file it writes
+        self.pending = collections.deque()  # type: T.Deque[T.Tuple[Future, T.Optional[str]]]
+        self.pending_files = {}  # type: T.Dict[str, Future]
 
     def log(self, msg):
-        if not self.options.quiet:
-            print(msg)
+        if self.options.quiet:
+            return
+        if self.pending and getattr(_thread_output, 'lines', None) is None:
+            # Printed after the output of the work submitted before
+            future = Future()  # type: Future
+            future.set_result((False, [(None, msg)], None))
+            self.pending.append((future, None))
+        else:
+            print_message(msg)
+
+    @staticmethod
+    def _run_in_thread(func, args):
+        _thread_output.lines = lines = []
+        try:
+            return func(*args), lines, None
+        except BaseException as e:
+            return False, lines, e
+        finally:
+            _thread_output.lines = None
+
+    def submit(self, to_file, func, *args):
+        '''Run func(*args) in a worker thread, it returns whether it installed something.
+
+        What func prints and adds to the install log is written out after the
+        output of all work submitted before it, so the output is the same as
+        if files were installed one after the other. Work writing to_file
+        waits for earlier work writing the same file.
+        '''
+        if self.executor is None:
+            self.run_now(func, *args)
+            return
+        if to_file is not None:
+            self.wait_for_file(to_file)
+        future = self.executor.submit(self._run_in_thread, func, args)
+        self.pending.append((future, to_file))
+        if to_file is not None:
+            self.pending_files[to_file] = future
+        # Write out what is done, and bound the backlog
+        max_pending = 16 * self.options.num_processes
+        while self.pending and (self.pending[0][0].done() or len(self.pending) > max_pending):
+            self._finish()
+
+    def run_now(self, func, *args):
+        '''Run func(*args) in this thread, after all submitted work.'''
+        self.wait()
+        if func(*args):
+            self.did_install_something = True
+
+    def _finish(self, raise_errors=True):
+        future, to_file = self.pending.popleft()
+        if to_file is not None and self.pending_files.get(to_file) is future:
+            del self.pending_files[to_file]
+        result, lines, exc = future.result()
+        for lf, line in lines:
+            if lf is None:
+                print(line)
+            else:
+                append_to_log(lf, line)
+        if exc is not None and raise_errors:
+            raise exc
+        if result:
+            self.did_install_something = True
+
+    def wait(self):
+        '''Wait for all submitted work and write out its output.'''
+        while self.pending:
+            self._finish()
+
+    def wait_for_file(self, path):
+        while path in self.pending_files:
+            self._finish()
 
     def should_preserve_existing_file(self, from_file, to_file):
         if not self.options.only_changed:
@@ -241,7 +493,7 @@ class Installer:
         to_time = os.stat(to_file).st_mtime
         return from_time <= to_time
 
-    def do_copyfile(self, from_file, to_file, makedirs=None):
+    def do_copyfile(self, from_file, to_file, copy_mode=None):
         outdir = os.path.split(to_file)[0]
         if not os.path.isfile(from_file) and not os.path.islink(from_file):
             raise RuntimeError('Tried to install something that isn\'t a file:'
@@ -255,14 +507,12 @@ class Installer:
                                    'a file'.format(to_file))
             if self.should_preserve_existing_file(from_file, to_file):
                 append_to_log(self.lf, '# Preserving old file {}\n'.format(to_file))
-                self.preserved_file_count += 1
+                with self.lock:
+                    self.preserved_file_count += 1
                 return False
             os.remove(to_file)
-        elif makedirs:
-            # Unpack tuple
-            dirmaker, outdir = makedirs
-            # Create dirs if needed
-            dirmaker.makedirs(outdir, exist_ok=True)
+        if copy_mode is None:
+            copy_mode = self.options.copy_mode
         self.log('Installing {} to {}'.format(from_file, outdir))
         if os.path.islink(from_file):
             if not os.path.exists(from_file):
@@ -271,14 +521,40 @@ class Installer:
             else:
                 # Remove this entire branch when changing the behaviour to duplicate
                 # symlinks rather than copying what they point to.
-                print(symlink_warning)
-                shutil.copy2(from_file, to_file)
+                print_message(symlink_warning)
+                copy_file(from_file, to_file, copy_mode)
         else:
-            shutil.copy2(from_file, to_file)
+            copy_file(from_file, to_file, copy_mode)
         selinux_updates.append(to_file)
         append_to_log(self.lf, to_file)
         return True
 
+    def skip_unchanged(self, from_file, to_file, params):
+        if self.manifest is None or not self.manifest.is_unchanged(from_file, to_file, params):
+            return False
+        append_to_log(self.lf, to_file)
+        with self.lock:
+            self.unchanged_file_count += 1
+        return True
+
+    def record(self, from_file, to_file, params):
+        if self.manifest is not None:
+            self.manifest.record(from_file, to_file, params)
+
+    def install_file(self, from_file, to_file, mode, umask):
+        params = repr((mode_params(mode), umask))
+        if self.skip_unchanged(from_file, to_file, params):
+            return True
+        copy_mode = None
+        if self.options.copy_mode == 'hardlink' and not mode_is_unchanged(from_file, mode, umask):
+            # Setting the mode of a hard link changes the original as well
+            copy_mode = 'copy'
+        copied = self.do_copyfile(from_file, to_file, copy_mode)
+        set_mode(to_file, mode, umask)
+        if copied:
+            self.record(from_file, to_file, params)
+        return copied
+
     def do_copydir(self, data, src_dir, dst_dir, exclude, install_mode):
         '''
         Copies the contents of directory @src_dir into @dst_dir.
@@ -320,6 +596,7 @@ class Installer:
                 if filepart in exclude_dirs:
                     dirs.remove(d)
                     continue
+                self.wait_for_file(abs_dst)
                 if os.path.isdir(abs_dst):
                     continue
                 if os.path.exists(abs_dst):
@@ -334,6 +611,7 @@ class Installer:
                 if filepart in exclude_files:
                     continue
                 abs_dst = os.path.join(dst_dir, filepart)
+                self.wait_for_file(abs_dst)
                 if os.path.isdir(abs_dst):
                     print('Tried to copy file {} but a directory of that name already exists.'.format(abs_dst))
                     sys.exit(1)
@@ -342,8 +620,7 @@ class Installer:
                     os.mkdir(parent_dir)
                     shutil.copystat(os.path.dirname(abs_src), parent_dir)
                 # FIXME: what about symlinks?
-                self.do_copyfile(abs_src, abs_dst)
-                set_mode(abs_dst, install_mode, data.install_umask)
+                self.submit(abs_dst, self.install_file, abs_src, abs_dst, install_mode, data.install_umask)
 
     @staticmethod
     def check_installdata(obj: InstallData) -> InstallData:
@@ -359,6 +636,9 @@ class Installer:
 
         d.destdir = os.environ.get('DESTDIR', '')
         d.fullprefix = destdir_join(d.destdir, d.prefix)
+        if self.options.incremental:
+            manifest = os.path.join(os.path.dirname(datafilename), 'install-manifest.json')
+            self.manifest = InstallManifest(manifest, d.destdir)
 
         if d.install_umask != 'preserve':
             os.umask(d.install_umask)
@@ -367,11 +647,26 @@ class Installer:
         try:
             d.dirmaker = DirMaker(self.lf)
             with d.dirmaker:
-                self.install_subdirs(d) # Must be first, because it needs to delete the old subtree.
-                self.install_targets(d)
-                self.install_headers(d)
-                self.install_man(d)
-                self.install_data(d)
+                if self.options.num_processes > 1:
+                    self.executor = ThreadPoolExecutor(max_workers=self.options.num_processes)
+                try:
+                    self.install_subdirs(d) # Must be first, because it needs to delete the old subtree.
+                    self.install_targets(d)
+                    self.install_headers(d)
+                    self.install_man(d)
+                    self.install_data(d)
+                    self.wait()
+                except BaseException:
+                    # Still log what was installed until now
+                    while self.pending:
+                        self._finish(raise_errors=False)
+                    raise
+                finally:
+                    if self.executor is not None:
+                        self.executor.shutdown()
+                        self.executor = None
+                    if self.manifest is not None:
+                        self.manifest.save()
                 restore_selinux_contexts()
                 self.run_install_script(d)
                 if not self.did_install_something:
@@ -379,6 +674,9 @@ class Installer:
                 if not self.options.quiet and self.preserved_file_count > 0:
                     self.log('Preserved {} unchanged files, see {} for the full list'
                              .format(self.preserved_file_count, os.path.normpath(self.lf.name)))
+                if self.unchanged_file_count > 0:
+                    self.log('Skipped {} files that did not change since the last install.'
+                             .format(self.unchanged_file_count))
         except PermissionError:
             if shutil.which('pkexec') is not None and 'PKEXEC_UID' not in os.environ and d.destdir is None:
                 print('Installation failed due to insufficient permissions.')
@@ -402,9 +700,8 @@ class Installer:
             outfilename = get_destdir_path(d, i[1])
             mode = i[2]
             outdir = os.path.dirname(outfilename)
-            if self.do_copyfile(fullfilename, outfilename, makedirs=(d.dirmaker, outdir)):
-                self.did_install_something = True
-            set_mode(outfilename, mode, d.install_umask)
+            d.dirmaker.makedirs(outdir, exist_ok=True)
+            self.submit(outfilename, self.install_file, fullfilename, outfilename, mode, d.install_umask)
 
     def install_man(self, d):
         for m in d.man:
@@ -412,9 +709,8 @@ class Installer:
             outfilename = get_destdir_path(d, m[1])
             outdir = os.path.dirname(outfilename)
             install_mode = m[2]
-            if self.do_copyfile(full_source_filename, outfilename, makedirs=(d.dirmaker, outdir)):
-                self.did_install_something = True
-            set_mode(outfilename, install_mode, d.install_umask)
+            d.dirmaker.makedirs(outdir, exist_ok=True)
+            self.submit(outfilename, self.install_file, full_source_filename, outfilename, install_mode, d.install_umask)
 
     def install_headers(self, d):
         for t in d.headers:
@@ -423,9 +719,8 @@ class Installer:
             outdir = get_destdir_path(d, t[1])
             outfilename = os.path.join(outdir, fname)
             install_mode = t[2]
-            if self.do_copyfile(fullfilename, outfilename, makedirs=(d.dirmaker, outdir)):
-                self.did_install_something = True
-            set_mode(outfilename, install_mode, d.install_umask)
+            d.dirmaker.makedirs(outdir, exist_ok=True)
+            self.submit(outfilename, self.install_file, fullfilename, outfilename, install_mode, d.install_umask)
 
     def run_install_script(self, d):
         env = {'MESON_SOURCE_ROOT': d.source_dir,
@@ -465,71 +760,97 @@ class Installer:
                     continue
                 else:
                     raise RuntimeError('File {!r} could not be found'.format(t.fname))
-            file_copied = False # not set when a directory is copied
             fname = check_for_stampfile(t.fname)
             outdir = get_destdir_path(d, t.outdir)
             outname = os.path.join(outdir, os.path.basename(fname))
             final_path = os.path.join(d.prefix, t.outdir, os.path.basename(fname))
-            aliases = t.aliases
-            should_strip = t.strip
-            install_rpath = t.install_rpath
-            install_name_mappings = t.install_name_mappings
-            install_mode = t.install_mode
             if not os.path.exists(fname):
                 raise RuntimeError('File {!r} could not be found'.format(fname))
             elif os.path.isfile(fname):
-                file_copied = self.do_copyfile(fname, outname, makedirs=(d.dirmaker, outdir))
-                set_mode(outname, install_mode, d.install_umask)
-                if should_strip and d.strip_bin is not None:
-                    if fname.endswith('.jar'):
-                        self.log('Not stripping jar target: {}'.format(os.path.basename(fname)))
-                        continue
-                    self.log('Stripping target {!r} using {}.'.format(fname, d.strip_bin[0]))
-                    ps, stdo, stde = Popen_safe(d.strip_bin + [outname])
-                    if ps.returncode != 0:
-                        print('Could not strip file.\n')
-                        print('Stdout:\n{}\n'.format(stdo))
-                        print('Stderr:\n{}\n'.format(stde))
-                        sys.exit(1)
-                if fname.endswith('.js'):
-                    # Emscripten outputs js files and optionally a wasm file.
-                    # If one was generated, install it as well.
-                    wasm_source = os.path.splitext(fname)[0] + '.wasm'
-                    if os.path.exists(wasm_source):
-                        wasm_output = os.path.splitext(outname)[0] + '.wasm'
-                        file_copied = self.do_copyfile(wasm_source, wasm_output)
+                d.dirmaker.makedirs(outdir, exist_ok=True)
+                if fname.endswith('.jar'):
+                    # Fixing jars extracts their manifest to the current directory
+                    self.run_now(self.install_target_file, d, t, fname, outname, outdir, final_path)
+                else:
+                    self.submit(outname, self.install_target_file, d, t, fname, outname, outdir, final_path)
             elif os.path.isdir(fname):
                 fname = os.path.join(d.build_dir, fname.rstrip('/'))
                 outname = os.path.join(outdir, os.path.basename(fname))
                 d.dirmaker.makedirs(outdir, exist_ok=True)
-                self.do_copydir(d, fname, outname, None, install_mode)
+                self.do_copydir(d, fname, outname, None, t.install_mode)
+                self.submit(None, self.install_aliases, outdir, t.aliases)
             else:
                 raise RuntimeError('Unknown file type for {!r}'.format(fname))
-            printed_symlink_error = False
-            for alias, to in aliases.items():
-                try:
-                    symlinkfilename = os.path.join(outdir, alias)
-                    try:
-                        os.remove(symlinkfilename)
-                    except FileNotFoundError:
-                        pass
-                    os.symlink(to, symlinkfilename)
+
+    def install_target_file(self, d, t, fname, outname, outdir, final_path):
+        # Everything that changes the installed file after copying it
+        params = repr((mode_params(t.install_mode), d.install_umask, t.strip, d.strip_bin, final_path,
+                       t.install_rpath, sorted(t.rpath_dirs_to_remove), sorted(t.install_name_mappings.items())))
+        unchanged = self.skip_unchanged(fname, outname, params)
+        file_copied = False
+        if not unchanged:
+            # Built files are stripped and have their rpath fixed in place, which
+            # must not change the files in the build directory.
+            copy_mode = 'copy' if self.options.copy_mode == 'hardlink' else None
+            file_copied = self.do_copyfile(fname, outname, copy_mode)
+            set_mode(outname, t.install_mode, d.install_umask)
+            if t.strip and d.strip_bin is not None:
+                if fname.endswith('.jar'):
+                    self.log('Not stripping jar target: {}'.format(os.path.basename(fname)))
+                    return file_copied
+                self.log('Stripping target {!r} using {}.'.format(fname, d.strip_bin[0]))
+                ps, stdo, stde = Popen_safe(d.strip_bin + [outname])
+                if ps.returncode != 0:
+                    print_message('Could not strip file.\n')
+                    print_message('Stdout:\n{}\n'.format(stdo))
+                    print_message('Stderr:\n{}\n'.format(stde))
+                    sys.exit(1)
+        target_copied = file_copied
+        if fname.endswith('.js'):
+            # Emscripten outputs js files and optionally a wasm file.
+            # If one was generated, install it as well.
+            wasm_source = os.path.splitext(fname)[0] + '.wasm'
+            if os.path.exists(wasm_source):
+                wasm_output = os.path.splitext(outname)[0] + '.wasm'
+                file_copied = False
+                if not self.skip_unchanged(wasm_source, wasm_output, ''):
+                    file_copied = self.do_copyfile(wasm_source, wasm_output)
+                    if file_copied:
+                        self.record(wasm_source, wasm_output, '')
+        self.install_aliases(outdir, t.aliases)
+        if file_copied:
+            try:
+                depfixer.fix_rpath(outname, t.rpath_dirs_to_remove, t.install_rpath, final_path,
+                                   t.install_name_mappings, verbose=False)
+            except SystemExit as e:
+                if isinstance(e.code, int) and e.code == 0:
+                    pass
+                else:
+                    raise
+        if target_copied:
+            self.record(fname, outname, params)
+        return file_copied or unchanged
+
+    def install_aliases(self, outdir, aliases):
+        printed_symlink_error = False
+        for alias, to in aliases.items():
+            try:
+                symlinkfilename = os.path.join(outdir, alias)
+                if os.path.islink(symlinkfilename) and os.readlink(symlinkfilename) == to:
                     append_to_log(self.lf, symlinkfilename)
-                except (NotImplementedError, OSError):
-                    if not printed_symlink_error:
-                        print("Symlink creation does not work on this platform. "
-                              "Skipping all symlinking.")
-                        printed_symlink_error = True
-            if file_copied:
-                self.did_install_something = True
+                    continue
                 try:
-                    depfixer.fix_rpath(outname, t.rpath_dirs_to_remove, install_rpath, final_path,
-                                       install_name_mappings, verbose=False)
-                except SystemExit as e:
-                    if isinstance(e.code, int) and e.code == 0:
-                        pass
-                    else:
-                        raise
+                    os.remove(symlinkfilename)
+                except FileNotFoundError:
+                    pass
+                os.symlink(to, symlinkfilename)
+                append_to_log(self.lf, symlinkfilename)
+            except (NotImplementedError, OSError):
+                if not printed_symlink_error:
+                    print_message("Symlink creation does not work on this platform. "
+                                  "Skipping all symlinking.")
+                    printed_symlink_error = True
+        return False
 
 def rebuild_all(wd: str) -> bool:
     if not (Path(wd) / 'build.ninja').is_file():
@@ -17,6 +17,7 @@ import io
 import sys
 import time
 import platform
+import threading
 import typing as T
 from contextlib import contextmanager
 from pathlib import Path
@@ -77,6 +78,8 @@ log_errors_only = False      # type: bool
 _in_ci = 'CI' in os.environ  # type: bool
 _logged_once = set()         # type: T.Set[T.Tuple[str, ...]]
 log_warnings_counter = 0     # type: int
+# Console output of the threads running in capture_output()
+_thread_output = threading.local()
 
 def disable() -> None:
     global log_disable_stdout
@@ -196,11 +199,12 @@ def force_print(*args: str, **kwargs: T.Any) -> None:
         raw = prepend + raw.replace('\n', '\n' + prepend, raw.count('\n') - 1)
 
     # _Something_ is going to get printed.
+    output = getattr(_thread_output, 'file', None)
     try:
-        print(raw, end='')
+        print(raw, end='', file=output)
     except UnicodeEncodeError:
         cleaned = raw.encode('ascii', 'replace').decode('ascii')
-        print(cleaned, end='')
+        print(cleaned, end='', file=output)
 
 # We really want a heterogeneous dict for this, but that's in typing_extensions
 def debug(*args: T.Union[str, AnsiDecorator], **kwargs: T.Any) -> None:
@@ -351,6 +355,23 @@ def format_list(input_list: T.List[str]) -> str:
     else:
         return ''
 
+@contextmanager
+def capture_output() -> T.Generator[io.StringIO, None, None]:
+    """Collect what this thread logs to the console instead of printing it.
+
+    Used to print the output of work done in parallel in one piece.
+    """
+    output = io.StringIO()
+    _thread_output.file = output
+    try:
+        yield output
+    finally:
+        _thread_output.file = None
+
+def output_captured() -> bool:
+    """Whether console output of this thread goes to capture_output()."""
+    return getattr(_thread_output, 'file', None) is not None
+
 @contextmanager
 def nested() -> T.Generator[None, None, None]:
     global log_depth
@@ -90,6 +90,7 @@ class SourceSetHolder(MutableInterpreterObject, ObjectHolder):
         keys, dependencies = self.check_conditions(when)
         sources, extra_deps = self.check_source_files(if_true, True)
         if_false, _ = self.check_source_files(if_false, False)
+        self.copy_on_write()
         self.held_object.append(SourceSetRule(keys, sources, if_false, [], dependencies, extra_deps))
 
     @permittedKwargs(['when', 'if_true'])
@@ -107,8 +108,12 @@ class SourceSetHolder(MutableInterpreterObject, ObjectHolder):
             if not isinstance(s, SourceSetHolder):
                 raise InvalidCode('Arguments to \'add_all\' after the first must be source sets')
             s.frozen = True
+        self.copy_on_write()
         self.held_object.append(SourceSetRule(keys, [], [], if_true, dependencies, []))
 
+    def copy_data(self):
+        self.held_object = list(self.held_object)
+
     def collect(self, enabled_fn, all_sources, into=None):
         if not into:
             into = SourceFiles(OrderedSet(), OrderedSet())
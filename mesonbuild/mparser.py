@@ -113,12 +113,12 @@ class Lexer:
         self.future_keywords = {'return'}
         self.token_specification = [
             # Need to be sorted longest to shortest.
-            ('ignore', re.compile(r'[ \t]')),
+            ('ignore', re.compile(r'[ \t]+')),
             ('id', re.compile('[_a-zA-Z][_0-9a-zA-Z]*')),
             ('number', re.compile(r'0[bB][01]+|0[oO][0-7]+|0[xX][0-9a-fA-F]+|0|[1-9]\d*')),
             ('eol_cont', re.compile(r'\\\n')),
             ('eol', re.compile(r'\n')),
-            ('multiline_string', re.compile(r"'''(.|\n)*?'''", re.M)),
+            ('multiline_string', re.compile(r"'''(?:.|\n)*?'''")),
             ('comment', re.compile(r'#.*')),
             ('lparen', re.compile(r'\(')),
             ('rparen', re.compile(r'\)')),
@@ -127,7 +127,7 @@ class Lexer:
             ('lcurl', re.compile(r'\{')),
             ('rcurl', re.compile(r'\}')),
             ('dblquote', re.compile(r'"')),
-            ('string', re.compile(r"'([^'\\]|(\\.))*'")),
+            ('string', re.compile(r"'(?:[^'\\]|\\.)*'")),
             ('comma', re.compile(r',')),
             ('plusassign', re.compile(r'\+=')),
             ('dot', re.compile(r'\.')),
@@ -146,6 +146,12 @@ class Lexer:
             ('gt', re.compile(r'>')),
             ('questionmark', re.compile(r'\?')),
         ]
+        # All tokens are matched with a single regex, its alternatives are
+        # tried in order, so the first token of the list that matches wins.
+        # Patterns must not use capturing groups, the name of the matched
+        # token is that of the last matched group.
+        self.token_regex = re.compile('|'.join('(?P<{}>{})'.format(tid, reg.pattern)
+                                               for tid, reg in self.token_specification))
 
     def getline(self, line_start: int) -> str:
         return self.code[line_start:self.code.find('\n', line_start)]
@@ -158,83 +164,84 @@ class Lexer:
         bracket_count = 0
         curl_count = 0
         col = 0
+        match = self.token_regex.match
         while loc < len(self.code):
-            matched = False
             value = None  # type: T.Union[str, bool, int]
-            for (tid, reg) in self.token_specification:
-                mo = reg.match(self.code, loc)
-                if mo:
-                    curline = lineno
-                    curline_start = line_start
-                    col = mo.start() - line_start
-                    matched = True
-                    span_start = loc
-                    loc = mo.end()
-                    span_end = loc
-                    bytespan = (span_start, span_end)
-                    match_text = mo.group()
-                    if tid == 'ignore' or tid == 'comment':
-                        break
-                    elif tid == 'lparen':
-                        par_count += 1
-                    elif tid == 'rparen':
-                        par_count -= 1
-                    elif tid == 'lbracket':
-                        bracket_count += 1
-                    elif tid == 'rbracket':
-                        bracket_count -= 1
-                    elif tid == 'lcurl':
-                        curl_count += 1
-                    elif tid == 'rcurl':
-                        curl_count -= 1
-                    elif tid == 'dblquote':
-                        raise ParseException('Double quotes are not supported. Use single quotes.', self.getline(line_start), lineno, col)
-                    elif tid == 'string':
-                        # Handle here and not on the regexp to give a better error message.
-                        if match_text.find("\n") != -1:
-                            mlog.warning(textwrap.dedent("""\
-                                    Newline character in a string detected, use ''' (three single quotes) for multiline strings instead.
-                                    This will become a hard error in a future Meson release.\
-                                """),
-                                self.getline(line_start),
-                                str(lineno),
-                                str(col)
-                            )
-                        value = match_text[1:-1]
-                        try:
-                            value = ESCAPE_SEQUENCE_SINGLE_RE.sub(decode_match, value)
-                        except MesonUnicodeDecodeError as err:
-                            raise MesonException("Failed to parse escape sequence: '{}' in string:\n  {}".format(err.match, match_text))
-                    elif tid == 'multiline_string':
-                        tid = 'string'
-                        value = match_text[3:-3]
-                        lines = match_text.split('\n')
-                        if len(lines) > 1:
-                            lineno += len(lines) - 1
-                            line_start = mo.end() - len(lines[-1])
-                    elif tid == 'number':
-                        value = int(match_text, base=0)
-                    elif tid == 'eol_cont':
-                        lineno += 1
-                        line_start = loc
-                        break
-                    elif tid == 'eol':
-                        lineno += 1
-                        line_start = loc
-                        if par_count > 0 or bracket_count > 0 or curl_count > 0:
-                            break
-                    elif tid == 'id':
-                        if match_text in self.keywords:
-                            tid = match_text
-                        else:
-                            if match_text in self.future_keywords:
-                                mlog.warning("Identifier '{}' will become a reserved keyword in a future release. Please rename it.".format(match_text),
-                                             location=types.SimpleNamespace(filename=filename, lineno=lineno))
-                            value = match_text
-                    yield Token(tid, filename, curline_start, curline, col, bytespan, value)
-                    break
-            if not matched:
+            mo = match(self.code, loc)
+            if not mo:
                 raise ParseException('lexer', self.getline(line_start), lineno, col)
+            tid = mo.lastgroup
+            curline = lineno
+            curline_start = line_start
+            span_start = loc
+            loc = mo.end()
+            if tid == 'ignore':
+                # Whitespace is matched as a whole, but errors are reported at
+                # its last character, as if it had been matched one by one
+                col = loc - 1 - line_start
+                continue
+            col = span_start - line_start
+            bytespan = (span_start, loc)
+            match_text = mo.group()
+            if tid == 'comment':
+                continue
+            elif tid == 'lparen':
+                par_count += 1
+            elif tid == 'rparen':
+                par_count -= 1
+            elif tid == 'lbracket':
+                bracket_count += 1
+            elif tid == 'rbracket':
+                bracket_count -= 1
+            elif tid == 'lcurl':
+                curl_count += 1
+            elif tid == 'rcurl':
+                curl_count -= 1
+            elif tid == 'dblquote':
+                raise ParseException('Double quotes are not supported. Use single quotes.', self.getline(line_start), lineno, col)
+            elif tid == 'string':
+                # Handle here and not on the regexp to give a better error message.
+                if match_text.find("\n") != -1:
+                    mlog.warning(textwrap.dedent("""\
+                            Newline character in a string detected, use ''' (three single quotes) for multiline strings instead.
+                            This will become a hard error in a future Meson release.\
+                        """),
+                        self.getline(line_start),
+                        str(lineno),
+                        str(col)
+                    )
+                value = match_text[1:-1]
+                try:
+                    value = ESCAPE_SEQUENCE_SINGLE_RE.sub(decode_match, value)
+                except MesonUnicodeDecodeError as err:
+                    raise MesonException("Failed to parse escape sequence: '{}' in string:\n  {}".format(err.match, match_text))
+            elif tid == 'multiline_string':
+                tid = 'string'
+                value = match_text[3:-3]
+                lines = match_text.split('\n')
+                if len(lines) > 1:
+                    lineno += len(lines) - 1
+                    line_start = loc - len(lines[-1])
+            elif tid == 'number':
+                value = int(match_text, base=0)
+            elif tid == 'eol_cont':
+                lineno += 1
+                line_start = loc
+                continue
+            elif tid == 'eol':
+                lineno += 1
+                line_start = loc
+                if par_count > 0 or bracket_count > 0 or curl_count > 0:
+                    continue
+            elif tid == 'id':
+                if match_text in self.keywords:
+                    tid = match_text
+                else:
+                    if match_text in self.future_keywords:
+                        mlog.warning("Identifier '{}' will become a reserved keyword in a future release. Please rename it.".format(match_text),
+                                     location=types.SimpleNamespace(filename=filename, lineno=lineno))
+                    value = match_text
+            yield Token(tid, filename, curline_start, curline, col, bytespan, value)
 
 class BaseNode:
     def __init__(self, lineno: int, colno: int, filename: str, end_lineno: T.Optional[int] = None, end_colno: T.Optional[int] = None):
@@ -1,5 +1,7 @@
 import os, subprocess
 import argparse
+import copy
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from . import mlog
@@ -47,6 +49,20 @@ def update_file(r, wrap, repo_dir, options):
 def git_output(cmd, workingdir):
     return quiet_git(cmd, workingdir, check=True)[1]
 
+def run_logged(cmd, workingdir, check=False):
+    if not mlog.output_captured():
+        if check:
+            subprocess.check_call(cmd, cwd=workingdir)
+            return 0
+        return subprocess.call(cmd, cwd=workingdir)
+    # The output is logged rather than printed by the command itself, so that
+    # it stays with the rest of the output of the subproject.
+    p, out, _ = Popen_safe(cmd, stderr=subprocess.STDOUT, cwd=workingdir)
+    mlog.log(out, end='')
+    if check and p.returncode != 0:
+        raise subprocess.CalledProcessError(p.returncode, cmd, out)
+    return p.returncode
+
 def git_stash(workingdir):
     # That git command return 1 (failure) when there is something to stash.
     # We don't want to stash when there is nothing to stash because that would
@@ -225,11 +241,11 @@ def update_hg(r, wrap, repo_dir, options):
         # Failure to do pull is not a fatal error,
         # because otherwise you can't develop without
         # a working net connection.
-        subprocess.call(['hg', 'pull'], cwd=repo_dir)
+        run_logged(['hg', 'pull'], repo_dir)
     else:
-        if subprocess.call(['hg', 'checkout', revno], cwd=repo_dir) != 0:
-            subprocess.check_call(['hg', 'pull'], cwd=repo_dir)
-            subprocess.check_call(['hg', 'checkout', revno], cwd=repo_dir)
+        if run_logged(['hg', 'checkout', revno], repo_dir) != 0:
+            run_logged(['hg', 'pull'], repo_dir, check=True)
+            run_logged(['hg', 'checkout', revno], repo_dir, check=True)
     return True
 
 def update_svn(r, wrap, repo_dir, options):
@@ -245,9 +261,9 @@ def update_svn(r, wrap, repo_dir, options):
         # Failure to do pull is not a fatal error,
         # because otherwise you can't develop without
         # a working net connection.
-        subprocess.call(['svn', 'update'], cwd=repo_dir)
+        run_logged(['svn', 'update'], repo_dir)
     else:
-        subprocess.check_call(['svn', 'update', '-r', revno], cwd=repo_dir)
+        run_logged(['svn', 'update', '-r', revno], repo_dir, check=True)
     return True
 
 def update(r, wrap, repo_dir, options):
@@ -306,11 +322,22 @@ def foreach(r, wrap, repo_dir, options):
     mlog.log(out, end='')
     return True
 
+def run_subproject(r, wrap, repo_dir, options):
+    # Resolver.resolve() stores the subproject it works on in the resolver
+    r = copy.copy(r)
+    with mlog.capture_output() as output:
+        try:
+            return options.subprojects_func(r, wrap, repo_dir, options), output.getvalue(), None
+        except Exception as e:
+            return False, output.getvalue(), e
+
 def add_common_arguments(p):
     p.add_argument('--sourcedir', default='.',
                    help='Path to source directory')
     p.add_argument('--types', default='',
                    help='Comma-separated list of subproject types. Supported types are: {} (default: all)'.format(ALL_TYPES_STRING))
+    p.add_argument('--num-processes', default=None, type=int,
+                   help='How many subprojects to process in parallel (default: the number of processors plus four, at most 32).')
 
 def add_subprojects_argument(p):
     p.add_argument('subprojects', nargs='*',
@@ -374,12 +401,32 @@ def run(options):
         if t not in ALL_TYPES:
             raise MesonException('Unknown subproject type {!r}, supported types are: {}'.format(t, ALL_TYPES_STRING))
     failures = []
-    for wrap in wraps:
-        if types and wrap.type not in types:
-            continue
-        dirname = Path(subprojects_dir, wrap.directory).as_posix()
-        if not options.subprojects_func(r, wrap, dirname, options):
-            failures.append(wrap.name)
+    if options.num_processes == 1:
+        for wrap in wraps:
+            if types and wrap.type not in types:
+                continue
+            dirname = Path(subprojects_dir, wrap.directory).as_posix()
+            if not options.subprojects_func(r, wrap, dirname, options):
+                failures.append(wrap.name)
+    else:
+        with ThreadPoolExecutor(options.num_processes) as executor:
+            tasks = []
+            for wrap in wraps:
+                if types and wrap.type not in types:
+                    continue
+                dirname = Path(subprojects_dir, wrap.directory).as_posix()
+                tasks.append((wrap, executor.submit(run_subproject, r, wrap, dirname, options)))
+            # The output of each subproject is printed in one piece, in the
+            # same order as when they are processed one after the other.
+            for i, (wrap, task) in enumerate(tasks):
+                success, output, exc = task.result()
+                print(output, end='')
+                if exc is not None:
+                    for _, t in tasks[i + 1:]:
+                        t.cancel()
+                    raise exc
+                if not success:
+                    failures.append(wrap.name)
     if failures:
         m = 'Please check logs above as command failed in some subprojects which could have been left in conflict state: '
         m += ', '.join(failures)
@@ -21,6 +21,7 @@ import argparse
 import asyncio
 import datetime
 import enum
+import functools
 import io
 import json
 import multiprocessing
@@ -32,11 +33,11 @@ import re
 import signal
 import subprocess
 import sys
-import tempfile
 import textwrap
 import time
 import typing as T
 import xml.etree.ElementTree as et
+import zlib
 
 from . import build
 from . import environment
@@ -56,6 +57,12 @@ GNU_SKIP_RETURNCODE = 77
 # mean that the test failed even before testing what it is supposed to test.
 GNU_ERROR_RETURNCODE = 99
 
+# Only the end of the output of a test is kept for the logs, so that tests
+# printing a lot cannot use up all memory.
+MAX_OUTPUT_SIZE = 16 * 1024 * 1024
+# Longer lines are split before being parsed
+MAX_LINE_LENGTH = 64 * 1024
+
 def is_windows() -> bool:
     platname = platform.system().lower()
     return platname == 'windows'
@@ -80,6 +87,15 @@ def determine_worker_count() -> int:
             num_workers = 1
     return num_workers
 
+def parse_shard(value: str) -> T.Tuple[int, int]:
+    try:
+        index, count = (int(i) for i in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected K/N, got {!r}'.format(value))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('shard {} is not between 1 and {}'.format(index, count))
+    return index, count
+
 def add_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--repeat', default=1, dest='repeat', type=int,
                         help='Number of times to run the tests.')
@@ -124,6 +140,20 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
                         help='Which test setup to use.')
     parser.add_argument('--test-args', default=[], type=split_args,
                         help='Arguments to pass to the specified test(s) or all tests')
+    parser.add_argument('--schedule', default='history', choices=['history', 'definition'],
+                        help='Order in which tests are started: longest tests first based on '
+                        'the durations of previous runs, or in the order they were defined '
+                        '(default: history).')
+    parser.add_argument('--failed-first', default=False, action='store_true',
+                        help='Start the tests that failed in the previous run first.')
+    parser.add_argument('--shard', default=None, type=parse_shard, metavar='K/N',
+                        help='Only run the K-th of N disjoint subsets of the selected tests.')
+    parser.add_argument('--shard-history', default=None, metavar='FILE',
+                        help='Test history to balance the shards with, all shards must use the same file. '
+                        'Without it tests are split by a hash of their name.')
+    parser.add_argument('--merge-results', default=None, nargs='+', metavar='LOGDIR',
+                        help='Merge the logs of the given directories, for example from '
+                        'several shards, into the log directory instead of running tests.')
     parser.add_argument('args', nargs='*',
                         help='Optional list of test names to run. "testname" to run all tests with that name, '
                         '"subprojname:testname" to specifically run "testname" from "subprojname", '
@@ -180,6 +210,181 @@ class TestResult(enum.Enum):
         return 14 # len(UNEXPECTEDPASS)
 
 
+class TestHistory:
+
+    """Durations and results of the tests in previous runs.
+
+    Stored as JSON in meson-logs/testhistory.json and used to start the
+    longest tests first, and optionally the ones that failed last time.
+    """
+
+    VERSION = 1
+    FAILED = {TestResult.FAIL, TestResult.ERROR, TestResult.TIMEOUT, TestResult.UNEXPECTEDPASS}
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.entries = {}  # type: T.Dict[str, T.Dict[str, T.Any]]
+        try:
+            with open(filename, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self.entries = data['tests']
+        except (OSError, ValueError, AttributeError, KeyError):
+            pass
+
+    @staticmethod
+    def key(test: TestSerialisation) -> str:
+        return '{}:{} / {}'.format(test.project_name, '+'.join(test.suite), test.name)
+
+    def duration(self, test: TestSerialisation) -> T.Optional[float]:
+        entry = self.entries.get(self.key(test))
+        return entry['duration'] if entry else None
+
+    def failed(self, test: TestSerialisation) -> bool:
+        entry = self.entries.get(self.key(test))
+        return bool(entry) and TestResult(entry['result']) in self.FAILED
+
+    def record(self, test: TestSerialisation, result: 'TestRun') -> None:
+        # An interrupted test did not run to completion, its duration
+        # means nothing.
+        if result.res is TestResult.INTERRUPT:
+            return
+        self.entries[self.key(test)] = {'duration': result.duration,
+                                        'result': result.res.value}
+
+    def save(self) -> None:
+        tempfilename = self.filename + '~'
+        try:
+            with open(tempfilename, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'tests': self.entries}, f)
+            os.replace(tempfilename, self.filename)
+        except OSError as e:
+            mlog.warning('Could not write test history {!r}: {}'.format(self.filename, e))
+
+
+def schedule_tests(tests: T.List[TestSerialisation], history: T.Optional[TestHistory],
+                   schedule: str, failed_first: bool) -> T.List[TestSerialisation]:
+    """Return tests in the order in which they should be started.
+
+    Tests with a higher priority are always started first. Among those with
+    the same priority, the tests that failed last time come first if
+    failed_first is set. With the history schedule, tests without a recorded
+    duration come next, in the order they were defined, as they could be
+    long ones. Of the tests with a duration, the non-parallel ones, which
+    have to run alone, are started before the others, and the parallel ones
+    are started longest first, so that no long test is left running alone
+    at the end. Without any recorded durations the order is unchanged.
+    """
+    if history is None:
+        return tests
+
+    def sort_key(test: TestSerialisation) -> T.Tuple[T.Any, ...]:
+        key = [-test.priority]  # type: T.List[T.Any]
+        if failed_first:
+            key.append(not history.failed(test))
+        if schedule == 'history':
+            duration = history.duration(test)
+            if duration is None:
+                key.append(False)
+            else:
+                key += [True, test.is_parallel, -duration]
+        return tuple(key)
+
+    # sorted() is stable, ties keep the definition order
+    return sorted(tests, key=sort_key)
+
+
+def shard_tests(tests: T.List[TestSerialisation], history: T.Optional[TestHistory],
+                index: int, count: int) -> T.List[TestSerialisation]:
+    """Return the tests of shard index (starting at 1) out of count shards.
+
+    Tests with a recorded duration are distributed longest first, each to
+    the shard with the smallest total duration so far. The others are
+    distributed by a hash of their name. Either way the partition only
+    depends on the selected tests and the history, so all shards must be
+    run with the same history file, or none, to get each test exactly once.
+    """
+    timed = []       # type: T.List[T.Tuple[float, str, int]]
+    shard_of = {}    # type: T.Dict[int, int]
+    for i, t in enumerate(tests):
+        key = TestHistory.key(t)
+        duration = history.duration(t) if history is not None else None
+        if duration is None:
+            shard_of[i] = zlib.crc32(key.encode('utf-8')) % count
+        else:
+            timed.append((-duration, key, i))
+    loads = [0.0] * count
+    for duration, _, i in sorted(timed):
+        shard = min(range(count), key=lambda s: loads[s])
+        loads[shard] -= duration
+        shard_of[i] = shard
+    return [t for i, t in enumerate(tests) if shard_of[i] == index - 1]
+
+
+def merge_results(options: argparse.Namespace) -> int:
+    """Merge test logs of several directories into the log directory.
+
+    The JSON logs are concatenated, test suites with the same name in the
+    JUnit logs are joined and the test histories are combined, so that the
+    shards of the next run can be balanced with --shard-history based on
+    all tests.
+    """
+    logdir = os.path.join(options.wd, 'meson-logs')
+    os.makedirs(logdir, exist_ok=True)
+    logfile_base = os.path.join(logdir, options.logbase)
+    history = TestHistory(os.path.join(logdir, 'testhistory.json'))
+    root = et.Element('testsuites', tests='0', errors='0', failures='0')
+    suites = {}  # type: T.Dict[str, et.Element]
+    results = []  # type: T.List[str]
+    failures = 0
+    failed = {r.value for r in TestHistory.FAILED | {TestResult.INTERRUPT}}
+
+    for d in options.merge_results:
+        if os.path.isdir(os.path.join(d, 'meson-logs')):
+            d = os.path.join(d, 'meson-logs')
+        jsonlog = os.path.join(d, options.logbase + '.json')
+        if not os.path.isfile(jsonlog):
+            print('No test log found in {!r}.'.format(d))
+            return 1
+        with open(jsonlog, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                results.append(line.rstrip('\n') + '\n')
+                if json.loads(line)['result'] in failed:
+                    failures += 1
+
+        junitlog = os.path.join(d, options.logbase + '.junit.xml')
+        if os.path.isfile(junitlog):
+            for suite in et.parse(junitlog).getroot().findall('testsuite'):
+                name = suite.get('name', '')
+                if name not in suites:
+                    suites[name] = suite
+                    root.append(suite)
+                    continue
+                merged = suites[name]
+                for attr in ['tests', 'errors', 'failures', 'skipped']:
+                    if attr in suite.attrib:
+                        merged.attrib[attr] = str(int(merged.get(attr, '0')) + int(suite.attrib[attr]))
+                merged.extend(suite)
+
+        shard_history = TestHistory(os.path.join(d, 'testhistory.json'))
+        history.entries.update(shard_history.entries)
+
+    for suite in root:
+        for attr in ['tests', 'errors', 'failures']:
+            root.attrib[attr] = str(int(root.attrib[attr]) + int(suite.get(attr, '0')))
+
+    with open(logfile_base + '.json', 'w', encoding='utf-8') as f:
+        f.writelines(results)
+    with open(logfile_base + '.junit.xml', 'wb') as f:
+        et.ElementTree(root).write(f, encoding='utf-8', xml_declaration=True)
+    history.save()
+    print('Merged {} test results from {} directories into {}, {} failed.'.format(
+        len(results), len(options.merge_results), logdir, failures))
+    return 1 if failures else 0
+
+
 class TAPParser:
     Plan = namedtuple('Plan', ['count', 'late', 'skipped', 'explanation'])
     Bailout = namedtuple('Bailout', ['message'])
@@ -199,8 +404,17 @@ class TAPParser:
     _RE_YAML_START = re.compile(r'(\s+)---.*')
     _RE_YAML_END = re.compile(r'\s+\.\.\.\s*')
 
-    def __init__(self, io: T.Iterator[str]):
+    def __init__(self, io: T.Optional[T.Iterator[str]] = None):
         self.io = io
+        self.found_late_test = False
+        self.bailed_out = False
+        self.plan = None  # type: T.Optional[TAPParser.Plan]
+        self.lineno = 0
+        self.num_tests = 0
+        self.yaml_lineno = None  # type: T.Optional[int]
+        self.yaml_indent = ''
+        self.state = self._MAIN
+        self.version = 12
 
     def parse_test(self, ok: bool, num: int, name: str, directive: T.Optional[str], explanation: T.Optional[str]) -> \
             T.Generator[T.Union['TAPParser.Test', 'TAPParser.Error'], None, None]:
@@ -221,111 +435,130 @@ class TAPParser:
         yield self.Test(num, name, TestResult.OK if ok else TestResult.FAIL, explanation)
 
     def parse(self) -> T.Generator[T.Union['TAPParser.Test', 'TAPParser.Error', 'TAPParser.Version', 'TAPParser.Plan', 'TAPParser.Bailout'], None, None]:
-        found_late_test = False
-        bailed_out = False
-        plan = None
-        lineno = 0
-        num_tests = 0
-        yaml_lineno = None
-        yaml_indent = ''
-        state = self._MAIN
-        version = 12
-        while True:
-            lineno += 1
-            try:
-                line = next(self.io).rstrip()
-            except StopIteration:
-                break
+        assert self.io is not None
+        for line in self.io:
+            yield from self.parse_line(line)
+        yield from self.parse_end()
+
+    def parse_line(self, line: str) -> T.Generator[T.Union['TAPParser.Test', 'TAPParser.Error', 'TAPParser.Version', 'TAPParser.Plan', 'TAPParser.Bailout'], None, None]:
+        """Parse the next line of output, for parsing it as the test runs."""
+        self.lineno += 1
+        line = line.rstrip()
+
+        # YAML blocks are only accepted after a test
+        if self.state == self._AFTER_TEST:
+            if self.version >= 13:
+                m = self._RE_YAML_START.match(line)
+                if m:
+                    self.state = self._YAML
+                    self.yaml_lineno = self.lineno
+                    self.yaml_indent = m.group(1)
+                    return
+            self.state = self._MAIN
 
-            # YAML blocks are only accepted after a test
-            if state == self._AFTER_TEST:
-                if version >= 13:
-                    m = self._RE_YAML_START.match(line)
-                    if m:
-                        state = self._YAML
-                        yaml_lineno = lineno
-                        yaml_indent = m.group(1)
-                        continue
-                state = self._MAIN
-
-            elif state == self._YAML:
-                if self._RE_YAML_END.match(line):
-                    state = self._MAIN
-                    continue
-                if line.startswith(yaml_indent):
-                    continue
-                yield self.Error('YAML block not terminated (started on line {})'.format(yaml_lineno))
-                state = self._MAIN
+        elif self.state == self._YAML:
+            if self._RE_YAML_END.match(line):
+                self.state = self._MAIN
+                return
+            if line.startswith(self.yaml_indent):
+                return
+            yield self.Error('YAML block not terminated (started on line {})'.format(self.yaml_lineno))
+            self.state = self._MAIN
 
-            assert state == self._MAIN
-            if line.startswith('#'):
-                continue
+        assert self.state == self._MAIN
+        if line.startswith('#'):
+            return
 
-            m = self._RE_TEST.match(line)
-            if m:
-                if plan and plan.late and not found_late_test:
-                    yield self.Error('unexpected test after late plan')
-                    found_late_test = True
-                num_tests += 1
-                num = num_tests if m.group(2) is None else int(m.group(2))
-                if num != num_tests:
-                    yield self.Error('out of order test numbers')
-                yield from self.parse_test(m.group(1) == 'ok', num,
-                                           m.group(3), m.group(4), m.group(5))
-                state = self._AFTER_TEST
-                continue
+        m = self._RE_TEST.match(line)
+        if m:
+            if self.plan and self.plan.late and not self.found_late_test:
+                yield self.Error('unexpected test after late plan')
+                self.found_late_test = True
+            self.num_tests += 1
+            num = self.num_tests if m.group(2) is None else int(m.group(2))
+            if num != self.num_tests:
+                yield self.Error('out of order test numbers')
+            yield from self.parse_test(m.group(1) == 'ok', num,
+                                       m.group(3), m.group(4), m.group(5))
+            self.state = self._AFTER_TEST
+            return
 
-            m = self._RE_PLAN.match(line)
-            if m:
-                if plan:
-                    yield self.Error('more than one plan found')
-                else:
-                    count = int(m.group(1))
-                    skipped = (count == 0)
-                    if m.group(2):
-                        if m.group(2).upper().startswith('SKIP'):
-                            if count > 0:
-                                yield self.Error('invalid SKIP directive for plan')
-                            skipped = True
-                        else:
-                            yield self.Error('invalid directive for plan')
-                    plan = self.Plan(count=count, late=(num_tests > 0),
-                                     skipped=skipped, explanation=m.group(3))
-                    yield plan
-                continue
+        m = self._RE_PLAN.match(line)
+        if m:
+            if self.plan:
+                yield self.Error('more than one plan found')
+            else:
+                count = int(m.group(1))
+                skipped = (count == 0)
+                if m.group(2):
+                    if m.group(2).upper().startswith('SKIP'):
+                        if count > 0:
+                            yield self.Error('invalid SKIP directive for plan')
+                        skipped = True
+                    else:
+                        yield self.Error('invalid directive for plan')
+                self.plan = self.Plan(count=count, late=(self.num_tests > 0),
+                                      skipped=skipped, explanation=m.group(3))
+                yield self.plan
+            return
 
-            m = self._RE_BAILOUT.match(line)
-            if m:
-                yield self.Bailout(m.group(1))
-                bailed_out = True
-                continue
+        m = self._RE_BAILOUT.match(line)
+        if m:
+            yield self.Bailout(m.group(1))
+            self.bailed_out = True
+            return
 
-            m = self._RE_VERSION.match(line)
-            if m:
-                # The TAP version is only accepted as the first line
-                if lineno != 1:
-                    yield self.Error('version number must be on the first line')
-                    continue
-                version = int(m.group(1))
-                if version < 13:
-                    yield self.Error('version number should be at least 13')
-                else:
-                    yield self.Version(version=version)
-                continue
+        m = self._RE_VERSION.match(line)
+        if m:
+            # The TAP version is only accepted as the first line
+            if self.lineno != 1:
+                yield self.Error('version number must be on the first line')
+                return
+            self.version = int(m.group(1))
+            if self.version < 13:
+                yield self.Error('version number should be at least 13')
+            else:
+                yield self.Version(version=self.version)
+            return
 
-            if not line:
-                continue
+        if not line:
+            return
 
-            yield self.Error('unexpected input at line {}'.format((lineno,)))
+        yield self.Error('unexpected input at line {}'.format((self.lineno,)))
 
-        if state == self._YAML:
-            yield self.Error('YAML block not terminated (started on line {})'.format(yaml_lineno))
+    def parse_end(self) -> T.Generator['TAPParser.Error', None, None]:
+        """Check what can only be checked once all output was parsed."""
+        if self.state == self._YAML:
+            yield self.Error('YAML block not terminated (started on line {})'.format(self.yaml_lineno))
 
-        if not bailed_out and plan and num_tests != plan.count:
-            if num_tests < plan.count:
-                yield self.Error('Too few tests run (expected {}, got {})'.format(plan.count, num_tests))
+        if not self.bailed_out and self.plan and self.num_tests != self.plan.count:
+            if self.num_tests < self.plan.count:
+                yield self.Error('Too few tests run (expected {}, got {})'.format(self.plan.count, self.num_tests))
             else:
-                yield self.Error('Too many tests run (expected {}, got {})'.format(plan.count, num_tests))
+                yield self.Error('Too many tests run (expected {}, got {})'.format(self.plan.count, self.num_tests))
+
+
+class TAPResults:
+
+    """The outcome of the subtests of a TAP test, collected from parser events."""
+
+    def __init__(self) -> None:
+        self.results = []  # type: T.List[TestResult]
+        self.errors = []   # type: T.List[str]
+        self.failed = False
+
+    def add(self, event: T.Union[TAPParser.Test, TAPParser.Error, TAPParser.Version, TAPParser.Plan, TAPParser.Bailout]) -> None:
+        if isinstance(event, TAPParser.Bailout):
+            self.results.append(TestResult.ERROR)
+            self.failed = True
+        elif isinstance(event, TAPParser.Test):
+            self.results.append(event.result)
+            if event.result not in {TestResult.OK, TestResult.EXPECTEDFAIL, TestResult.SKIP}:
+                self.failed = True
+        elif isinstance(event, TAPParser.Error):
+            self.results.append(TestResult.ERROR)
+            self.errors.append(event.message)
+            self.failed = True
 
 
 class JunitBuilder:
@@ -483,23 +716,18 @@ class TestRun:
     def make_tap(cls, test: TestSerialisation, test_env: T.Dict[str, str],
                  returncode: int, starttime: float, duration: float,
                  stdo: str, stde: str,
-                 cmd: T.Optional[T.List[str]]) -> 'TestRun':
+                 cmd: T.Optional[T.List[str]],
+                 tap: T.Optional[TAPResults] = None) -> 'TestRun':
         res = None    # type: T.Optional[TestResult]
-        results = []  # type: T.List[TestResult]
-        failed = False
-
-        for i in TAPParser(io.StringIO(stdo)).parse():
-            if isinstance(i, TAPParser.Bailout):
-                results.append(TestResult.ERROR)
-                failed = True
-            elif isinstance(i, TAPParser.Test):
-                results.append(i.result)
-                if i.result not in {TestResult.OK, TestResult.EXPECTEDFAIL, TestResult.SKIP}:
-                    failed = True
-            elif isinstance(i, TAPParser.Error):
-                results.append(TestResult.ERROR)
-                stde += '\nTAP parsing error: ' + i.message
-                failed = True
+        if tap is None:
+            # Not parsed while the test was running
+            tap = TAPResults()
+            for i in TAPParser(io.StringIO(stdo)).parse():
+                tap.add(i)
+        results = tap.results
+        failed = tap.failed
+        for message in tap.errors:
+            stde += '\nTAP parsing error: ' + message
 
         if returncode != 0:
             res = TestResult.ERROR
@@ -615,7 +843,7 @@ def load_tests(build_dir: str) -> T.List[TestSerialisation]:
 
 async def try_wait_one(*awaitables: T.Any, timeout: T.Optional[T.Union[int, float]]) -> None:
     try:
-        await asyncio.wait(awaitables,
+        await asyncio.wait([asyncio.ensure_future(a) for a in awaitables],
                            timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
     except asyncio.TimeoutError:
         pass
@@ -637,6 +865,68 @@ async def complete_all(futures: T.Iterable[asyncio.Future]) -> None:
                 f.result()
 
 
+class OutputReader:
+
+    """Read the output of a test from a pipe while it runs.
+
+    Only the last max_size bytes are kept, starting at a line boundary. If
+    on_line is given it is called with every line as soon as it is complete.
+    """
+
+    def __init__(self, on_line: T.Optional[T.Callable[[str], None]] = None,
+                 max_size: int = MAX_OUTPUT_SIZE):
+        self.on_line = on_line
+        self.max_size = max_size
+        self.chunks = deque()  # type: T.Deque[bytes]
+        self.size = 0
+        self.dropped = 0
+        self.partial_line = b''
+
+    def _keep(self, data: bytes) -> None:
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size <= self.max_size:
+            return
+        while self.size - len(self.chunks[0]) >= self.max_size:
+            self.size -= len(self.chunks[0])
+            self.dropped += len(self.chunks.popleft())
+        first = self.chunks[0]
+        excess = self.size - self.max_size
+        # Drop the rest of the line as well, instead of leaving part of it
+        newline = first.find(b'\n', excess)
+        cut = newline + 1 if newline >= 0 else excess
+        self.chunks[0] = first[cut:]
+        self.size -= cut
+        self.dropped += cut
+
+    def _parse(self, data: bytes) -> None:
+        lines = (self.partial_line + data).split(b'\n')
+        self.partial_line = lines.pop()
+        if len(self.partial_line) > MAX_LINE_LENGTH:
+            lines.append(self.partial_line)
+            self.partial_line = b''
+        for line in lines:
+            self.on_line(line.decode('utf-8', errors='replace'))
+
+    async def read(self, stream: asyncio.StreamReader) -> None:
+        while True:
+            data = await stream.read(MAX_LINE_LENGTH)
+            if not data:
+                break
+            self._keep(data)
+            if self.on_line is not None:
+                self._parse(data)
+        if self.on_line is not None and self.partial_line:
+            self.on_line(self.partial_line.decode('utf-8', errors='replace'))
+            self.partial_line = b''
+
+    def getvalue(self) -> str:
+        output = decode(b''.join(self.chunks))
+        if self.dropped:
+            output = '[{} bytes of output were dropped]\n'.format(self.dropped) + output
+        return output
+
+
 class SingleTestRunner:
 
     def __init__(self, test: TestSerialisation, test_env: T.Dict[str, str],
@@ -678,7 +968,7 @@ class SingleTestRunner:
             return await self._run_cmd(wrap + cmd + self.test.cmd_args + self.options.test_args)
 
     async def _run_subprocess(self, args: T.List[str], *, timeout: T.Optional[int],
-                              stdout: T.IO, stderr: T.IO,
+                              stdout: T.Optional[OutputReader], stderr: T.Union[None, int, OutputReader],
                               env: T.Dict[str, str], cwd: T.Optional[str]) -> T.Tuple[int, TestResult, T.Optional[str]]:
         async def kill_process(p: asyncio.subprocess.Process) -> T.Optional[str]:
             # Python does not provide multiplatform support for
@@ -737,11 +1027,17 @@ class SingleTestRunner:
                 os.setsid()
 
         p = await asyncio.create_subprocess_exec(*args,
-                                                 stdout=stdout,
-                                                 stderr=stderr,
+                                                 stdout=None if stdout is None else asyncio.subprocess.PIPE,
+                                                 stderr=asyncio.subprocess.PIPE if isinstance(stderr, OutputReader) else stderr,
                                                  env=env,
                                                  cwd=cwd,
                                                  preexec_fn=preexec_fn if not is_windows() else None)
+        # The output is read while the test runs, or it could fill up the pipes
+        readers = []  # type: T.List[asyncio.Future]
+        if stdout is not None:
+            readers.append(asyncio.ensure_future(stdout.read(p.stdout)))
+        if isinstance(stderr, OutputReader):
+            readers.append(asyncio.ensure_future(stderr.read(p.stderr)))
         result = None
         additional_error = None
         try:
@@ -759,6 +1055,12 @@ class SingleTestRunner:
             if self.options.gdb:
                 # Let us accept ^C again
                 signal.signal(signal.SIGINT, previous_sigint_handler)
+            if readers:
+                # Processes started by the test may still hold the pipes open,
+                # do not wait for them.
+                _, pending = await asyncio.wait(readers, timeout=1)
+                for f in pending:
+                    f.cancel()
 
         return p.returncode or 0, result, additional_error
 
@@ -785,13 +1087,19 @@ class SingleTestRunner:
         if ('MALLOC_PERTURB_' not in self.env or not self.env['MALLOC_PERTURB_']) and not self.options.benchmark:
             self.env['MALLOC_PERTURB_'] = str(random.randint(1, 255))
 
-        stdout = None
-        stderr = None
+        stdout = None  # type: T.Optional[OutputReader]
+        stderr = None  # type: T.Union[None, int, OutputReader]
         if not self.options.verbose:
-            stdout = tempfile.TemporaryFile("wb+")
-            stderr = tempfile.TemporaryFile("wb+") if self.options.split else stdout
-        if self.test.protocol is TestProtocol.TAP and stderr is stdout:
-            stdout = tempfile.TemporaryFile("wb+")
+            stdout = OutputReader()
+            stderr = OutputReader() if self.options.split else asyncio.subprocess.STDOUT
+        tap = TAPResults()
+        tap_parser = TAPParser()
+        if self.test.protocol is TestProtocol.TAP:
+            # TAP output is parsed as it arrives, so that failing subtests
+            # are reported right away.
+            stdout = OutputReader(functools.partial(self._parse_tap_line, tap_parser, tap))
+            if stderr is asyncio.subprocess.STDOUT:
+                stderr = OutputReader()
 
         extra_cmd = []  # type: T.List[str]
         if self.test.protocol is TestProtocol.GTEST:
@@ -816,16 +1124,8 @@ class SingleTestRunner:
         endtime = time.time()
         duration = endtime - starttime
         if additional_error is None:
-            if stdout is None:
-                stdo = ''
-            else:
-                stdout.seek(0)
-                stdo = decode(stdout.read())
-            if stderr is None or stderr is stdout:
-                stde = ''
-            else:
-                stderr.seek(0)
-                stde = decode(stderr.read())
+            stdo = '' if stdout is None else stdout.getvalue()
+            stde = stderr.getvalue() if isinstance(stderr, OutputReader) else ''
         else:
             stdo = ""
             stde = additional_error
@@ -837,9 +1137,21 @@ class SingleTestRunner:
             elif self.test.protocol is TestProtocol.GTEST:
                 return TestRun.make_gtest(self.test, self.test_env, returncode, starttime, duration, stdo, stde, cmd)
             else:
-                if self.options.verbose:
-                    print(stdo, end='')
-                return TestRun.make_tap(self.test, self.test_env, returncode, starttime, duration, stdo, stde, cmd)
+                for event in tap_parser.parse_end():
+                    tap.add(event)
+                return TestRun.make_tap(self.test, self.test_env, returncode, starttime, duration, stdo, stde, cmd, tap)
+
+    def _parse_tap_line(self, parser: TAPParser, tap: TAPResults, line: str) -> None:
+        if self.options.verbose:
+            print(line)
+        for event in parser.parse_line(line):
+            tap.add(event)
+            if not self.options.verbose and not self.test.should_fail and \
+                    isinstance(event, TAPParser.Test) and \
+                    event.result in {TestResult.FAIL, TestResult.UNEXPECTEDPASS}:
+                subtest = '{} {}'.format(event.number, event.name).strip()
+                print(mlog.red('{} subtest {} {}'.format(self.test.name, subtest, event.result.value))
+                      .get_text(mlog.colorize_console()))
 
 
 class TestHarness:
@@ -860,10 +1172,12 @@ class TestHarness:
         self.logfile = None       # type: T.Optional[T.TextIO]
         self.jsonlogfile = None   # type: T.Optional[T.TextIO]
         self.junit = None         # type: T.Optional[JunitBuilder]
+        self.history = None       # type: T.Optional[TestHistory]
         if self.options.benchmark:
             self.tests = load_benchmarks(options.wd)
         else:
             self.tests = load_tests(options.wd)
+            self.history = TestHistory(os.path.join(options.wd, 'meson-logs', 'testhistory.json'))
         ss = set()
         for t in self.tests:
             for s in t.suite:
@@ -1035,6 +1349,7 @@ class TestHarness:
             # wrapper script.
             sys.exit(125)
 
+        tests = schedule_tests(tests, self.history, options.schedule, options.failed_first)
         self.run_tests(tests)
         return self.total_failure_count()
 
@@ -1126,6 +1441,16 @@ class TestHarness:
             print('No suitable tests defined.')
             return []
 
+        if self.options.shard:
+            index, count = self.options.shard
+            # The history of the build directory differs between machines
+            shard_history = None
+            if self.options.shard_history:
+                shard_history = TestHistory(self.options.shard_history)
+            tests = shard_tests(tests, shard_history, index, count)
+            if not tests:
+                print('No tests in shard {}/{}.'.format(index, count))
+
         return tests
 
     def open_log_files(self) -> None:
@@ -1202,6 +1527,8 @@ class TestHarness:
                 if interrupted or (self.options.repeat > 1 and self.fail_count):
                     return
                 res = await test.run()
+                if self.history is not None:
+                    self.history.record(test.test, res)
                 self.process_test_result(res)
                 self.print_stats(test_count, name_max_len, tests, name, res, index)
 
@@ -1273,6 +1600,8 @@ class TestHarness:
             if sys.platform != 'win32':
                 asyncio.get_event_loop().remove_signal_handler(signal.SIGINT)
                 asyncio.get_event_loop().remove_signal_handler(signal.SIGTERM)
+            if self.history is not None:
+                self.history.save()
             os.chdir(startdir)
 
 def list_tests(th: TestHarness) -> bool:
@@ -1313,6 +1642,9 @@ def rebuild_deps(wd: str, tests: T.List[TestSerialisation]) -> bool:
     return True
 
 def run(options: argparse.Namespace) -> int:
+    if options.merge_results:
+        return merge_results(options)
+
     if options.benchmark:
         options.num_processes = 1
 
@@ -1320,6 +1652,14 @@ def run(options: argparse.Namespace) -> int:
         print('Can not be both quiet and verbose at the same time.')
         return 1
 
+    if options.shard_history:
+        if not options.shard:
+            print('--shard-history can only be used with --shard.')
+            return 1
+        if not os.path.isfile(options.shard_history):
+            print('Could not find test history {!r}.'.format(options.shard_history))
+            return 1
+
     check_bin = None
     if options.gdb:
         options.verbose = True
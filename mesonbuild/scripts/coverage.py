@@ -14,15 +14,336 @@
 
 from mesonbuild import environment, mesonlib
 
-import argparse, sys, os, subprocess, pathlib, stat
+import argparse, sys, os, subprocess, pathlib, stat, hashlib, json, multiprocessing, time
 import typing as T
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 
-def coverage(outputs: T.List[str], source_root: str, subproject_root: str, build_root: str, log_dir: str, use_llvm_cov: bool) -> int:
+# Bump when the layout of the cached gcov results changes
+GCOV_CACHE_VERSION = 1
+
+
+class FileCoverage:
+    def __init__(self) -> None:
+        self.lines = {}  # type: T.Dict[int, int]
+        # The execution counts of the branches of a line
+        self.branches = {}  # type: T.Dict[int, T.List[int]]
+        # Function names mapped to their first line and execution count
+        self.functions = {}  # type: T.Dict[str, T.Tuple[int, int]]
+
+    def add_line(self, line: T.Dict[str, T.Any]) -> None:
+        number = line['line_number']
+        self.lines[number] = self.lines.get(number, 0) + line['count']
+        counts = [b['count'] for b in line.get('branches', [])]
+        if counts:
+            old = self.branches.get(number, [])
+            if len(old) < len(counts):
+                old, counts = counts, old
+            self.branches[number] = [c + (counts[i] if i < len(counts) else 0) for i, c in enumerate(old)]
+
+    def add_function(self, func: T.Dict[str, T.Any]) -> None:
+        name = func.get('demangled_name', func['name'])
+        line, count = self.functions.get(name, (func['start_line'], 0))
+        self.functions[name] = (line, count + func['execution_count'])
+
+    def covered_lines(self) -> int:
+        return sum(1 for c in self.lines.values() if c > 0)
+
+    def covered_branches(self) -> int:
+        return sum(1 for counts in self.branches.values() for c in counts if c > 0)
+
+    def total_branches(self) -> int:
+        return sum(len(counts) for counts in self.branches.values())
+
+
+class CoverageData:
+
+    """Coverage of all source files, merged from the gcov output of all objects."""
+
+    def __init__(self) -> None:
+        self.files = {}  # type: T.Dict[str, FileCoverage]
+
+    def add_gcov_output(self, doc: T.Dict[str, T.Any]) -> None:
+        cwd = doc.get('current_working_directory', '')
+        for f in doc['files']:
+            path = os.path.normpath(os.path.join(cwd, f['file']))
+            cov = self.files.setdefault(path, FileCoverage())
+            for line in f['lines']:
+                cov.add_line(line)
+            for func in f['functions']:
+                cov.add_function(func)
+
+    def filter(self, source_root: str, subproject_root: str) -> 'CoverageData':
+        """Only keep files of the project itself."""
+        result = CoverageData()
+        source_root = os.path.join(os.path.normpath(source_root), '')
+        subproject_root = os.path.join(os.path.normpath(subproject_root), '')
+        for path, cov in self.files.items():
+            if path.startswith(source_root) and not path.startswith(subproject_root):
+                result.files[path] = cov
+        return result
+
+
+def gcov_supports_json(gcov_exe: T.List[str]) -> bool:
+    try:
+        p = subprocess.run(gcov_exe + ['--help'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                           universal_newlines=True)
+    except OSError:
+        return False
+    return '--json-format' in p.stdout
+
+
+def find_gcno_files(build_root: str) -> T.List[str]:
+    result = []
+    for root, dirs, files in os.walk(build_root):
+        dirs[:] = [d for d in dirs if d not in ('meson-private', 'meson-logs')]
+        result += [os.path.join(root, f) for f in files if f.endswith('.gcno')]
+    return sorted(result)
+
+
+def file_stamp(path: str) -> T.Optional[T.List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def run_gcov(gcov_exe: T.List[str], build_root: str, gcno: str) -> T.List[T.Dict[str, T.Any]]:
+    # Objects without a .gcda file were never run, gcov reports all their
+    # lines as not executed, like `lcov --initial` does.
+    p = subprocess.run(gcov_exe + ['--branch-probabilities', '--json-format', '--stdout',
+                                   '--object-directory', os.path.dirname(gcno), gcno],
+                       cwd=build_root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                       universal_newlines=True, check=True)
+    # Warnings about missing .gcda files go to stdout too
+    return [json.loads(l) for l in p.stdout.splitlines() if l.startswith('{')]
+
+
+class GcovCache:
+
+    """The gcov output of every object, reused while its .gcno and .gcda do not change."""
+
+    def __init__(self, directory: str, gcov_exe: T.List[str], build_root: str):
+        self.directory = directory
+        self.gcov_exe = gcov_exe
+        self.build_root = build_root
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, gcno: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(gcno.encode('utf-8', errors='surrogateescape')).hexdigest() + '.json')
+
+    def get(self, gcno: str) -> T.List[T.Dict[str, T.Any]]:
+        gcda = gcno[:-len('.gcno')] + '.gcda'
+        key = [GCOV_CACHE_VERSION, self.gcov_exe, file_stamp(gcno), file_stamp(gcda)]
+        path = self._path(gcno)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry['key'] == key:
+                return entry['data']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        data = run_gcov(self.gcov_exe, self.build_root, gcno)
+        tempname = '{}.{}~'.format(path, os.getpid())
+        with open(tempname, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'data': data}, f)
+        os.replace(tempname, path)
+        return data
+
+    def prune(self, gcnos: T.List[str]) -> None:
+        """Remove the entries of objects that do not exist anymore."""
+        keep = {os.path.basename(self._path(g)) for g in gcnos}
+        for f in os.listdir(self.directory):
+            if f not in keep:
+                os.unlink(os.path.join(self.directory, f))
+
+
+def collect_coverage(gcov_exe: T.List[str], build_root: str, jobs: int) -> CoverageData:
+    """Run gcov once per object, in parallel, and merge the results."""
+    gcnos = find_gcno_files(build_root)
+    cache = GcovCache(os.path.join(build_root, 'meson-private', 'gcov-cache'), gcov_exe, build_root)
+    data = CoverageData()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for docs in executor.map(cache.get, gcnos):
+            for doc in docs:
+                data.add_gcov_output(doc)
+    cache.prune(gcnos)
+    return data
+
+
+def percent(covered: int, total: int) -> str:
+    if total == 0:
+        return '--'
+    return '{}%'.format(int(100 * covered / total))
+
+
+def rate(covered: int, total: int) -> str:
+    return '{:.4f}'.format(covered / total if total else 1.0)
+
+
+def line_ranges(lines: T.List[int]) -> str:
+    ranges = []  # type: T.List[T.List[int]]
+    for l in lines:
+        if ranges and ranges[-1][1] + 1 == l:
+            ranges[-1][1] = l
+        else:
+            ranges.append([l, l])
+    return ','.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in ranges)
+
+
+def write_text_report(data: CoverageData, source_root: str, filename: str) -> None:
+    rule = '-' * 78
+    rows = []
+    total_lines = total_covered = 0
+    for path in sorted(data.files):
+        cov = data.files[path]
+        covered = cov.covered_lines()
+        missing = sorted(l for l, c in cov.lines.items() if c == 0)
+        rows.append('{:<40} {:>7} {:>7} {:>6}   {}'.format(os.path.relpath(path, source_root), len(cov.lines),
+                                                          covered, percent(covered, len(cov.lines)),
+                                                          line_ranges(missing)).rstrip())
+        total_lines += len(cov.lines)
+        total_covered += covered
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('\n'.join([rule,
+                           '{:^78}'.format('Code Coverage Report').rstrip(),
+                           'Directory: ' + source_root,
+                           rule,
+                           '{:<40} {:>7} {:>7} {:>6}   {}'.format('File', 'Lines', 'Exec', 'Cover', 'Missing'),
+                           rule] +
+                          rows +
+                          [rule,
+                           '{:<40} {:>7} {:>7} {:>6}'.format('TOTAL', total_lines, total_covered,
+                                                             percent(total_covered, total_lines)),
+                           rule]) + '\n')
+
+
+def write_xml_report(data: CoverageData, source_root: str, filename: str) -> None:
+    """Write a report in the Cobertura format, like `gcovr --xml` does."""
+    packages = {}  # type: T.Dict[str, T.List[str]]
+    for path in sorted(data.files):
+        packages.setdefault(os.path.dirname(os.path.relpath(path, source_root)), []).append(path)
+
+    def add_rates(elem: ET.Element, files: T.List[FileCoverage]) -> None:
+        elem.set('line-rate', rate(sum(c.covered_lines() for c in files), sum(len(c.lines) for c in files)))
+        elem.set('branch-rate', rate(sum(c.covered_branches() for c in files), sum(c.total_branches() for c in files)))
+        elem.set('complexity', '0.0')
+
+    files = list(data.files.values())
+    root = ET.Element('coverage')
+    add_rates(root, files)
+    root.set('lines-covered', str(sum(c.covered_lines() for c in files)))
+    root.set('lines-valid', str(sum(len(c.lines) for c in files)))
+    root.set('branches-covered', str(sum(c.covered_branches() for c in files)))
+    root.set('branches-valid', str(sum(c.total_branches() for c in files)))
+    root.set('timestamp', str(int(time.time())))
+    root.set('version', 'meson')
+    ET.SubElement(ET.SubElement(root, 'sources'), 'source').text = source_root
+    packages_elem = ET.SubElement(root, 'packages')
+    for package, paths in sorted(packages.items()):
+        package_elem = ET.SubElement(packages_elem, 'package', name=package.replace(os.sep, '.') or '.')
+        add_rates(package_elem, [data.files[p] for p in paths])
+        classes = ET.SubElement(package_elem, 'classes')
+        for path in paths:
+            cov = data.files[path]
+            relpath = os.path.relpath(path, source_root)
+            class_elem = ET.SubElement(classes, 'class', name=os.path.basename(path).replace('.', '_'),
+                                       filename=relpath.replace(os.sep, '/'))
+            add_rates(class_elem, [cov])
+            ET.SubElement(class_elem, 'methods')
+            lines = ET.SubElement(class_elem, 'lines')
+            for number in sorted(cov.lines):
+                line = ET.SubElement(lines, 'line', number=str(number), hits=str(cov.lines[number]))
+                branches = cov.branches.get(number)
+                if branches:
+                    taken = sum(1 for c in branches if c > 0)
+                    line.set('branch', 'true')
+                    line.set('condition-coverage', '{}% ({}/{})'.format(int(100 * taken / len(branches)),
+                                                                        taken, len(branches)))
+                else:
+                    line.set('branch', 'false')
+    with open(filename, 'wb') as f:
+        f.write(b'<?xml version="1.0" ?>\n'
+                b"<!DOCTYPE coverage SYSTEM 'http://cobertura.sourceforge.net/xml/coverage-04.dtd'>\n")
+        ET.ElementTree(root).write(f, encoding='utf-8', xml_declaration=False)
+
+
+def write_lcov_tracefile(data: CoverageData, filename: str) -> None:
+    with open(filename, 'w', encoding='utf-8') as f:
+        for path in sorted(data.files):
+            cov = data.files[path]
+            f.write('TN:\nSF:{}\n'.format(path))
+            for name, (line, _) in sorted(cov.functions.items(), key=lambda i: i[1][0]):
+                f.write('FN:{},{}\n'.format(line, name))
+            for name, (_, count) in sorted(cov.functions.items(), key=lambda i: i[1][0]):
+                f.write('FNDA:{},{}\n'.format(count, name))
+            f.write('FNF:{}\nFNH:{}\n'.format(len(cov.functions),
+                                              sum(1 for _, c in cov.functions.values() if c > 0)))
+            for number in sorted(cov.branches):
+                for i, count in enumerate(cov.branches[number]):
+                    taken = str(count) if cov.lines.get(number) else '-'
+                    f.write('BRDA:{},0,{},{}\n'.format(number, i, taken))
+            f.write('BRF:{}\nBRH:{}\n'.format(cov.total_branches(), cov.covered_branches()))
+            for number in sorted(cov.lines):
+                f.write('DA:{},{}\n'.format(number, cov.lines[number]))
+            f.write('LF:{}\nLH:{}\nend_of_record\n'.format(len(cov.lines), cov.covered_lines()))
+
+
+def single_pass_coverage(outputs: T.List[str], source_root: str, subproject_root: str, build_root: str,
+                         log_dir: str, gcov_exe: T.List[str], genhtml_exe: T.Optional[str], jobs: int) -> int:
+    outfiles = []
+    exitcode = 0
+    data = collect_coverage(gcov_exe, build_root, jobs).filter(source_root, subproject_root)
+
+    if not outputs or 'xml' in outputs:
+        write_xml_report(data, source_root, os.path.join(log_dir, 'coverage.xml'))
+        outfiles.append(('Xml', pathlib.Path(log_dir, 'coverage.xml')))
+
+    if not outputs or 'text' in outputs:
+        write_text_report(data, source_root, os.path.join(log_dir, 'coverage.txt'))
+        outfiles.append(('Text', pathlib.Path(log_dir, 'coverage.txt')))
+
+    if not outputs or 'html' in outputs:
+        covinfo = os.path.join(log_dir, 'coverage.info')
+        write_lcov_tracefile(data, covinfo)
+        if genhtml_exe:
+            htmloutdir = os.path.join(log_dir, 'coveragereport')
+            subprocess.check_call([genhtml_exe,
+                                   '--prefix', build_root,
+                                   '--prefix', source_root,
+                                   '--output-directory', htmloutdir,
+                                   '--title', 'Code coverage',
+                                   '--legend',
+                                   '--show-details',
+                                   '--branch-coverage',
+                                   covinfo])
+            outfiles.append(('Html', pathlib.Path(htmloutdir, 'index.html')))
+        elif outputs:
+            print('genhtml needed to generate Html coverage report')
+            exitcode = 1
+
+    if outfiles:
+        print('')
+        for (filetype, path) in outfiles:
+            print(filetype + ' coverage report can be found at', path.as_uri())
+
+    return exitcode
+
+def coverage(outputs: T.List[str], source_root: str, subproject_root: str, build_root: str, log_dir: str,
+             use_llvm_cov: bool, single_pass: bool = False, jobs: int = 0) -> int:
     outfiles = []
     exitcode = 0
 
     (gcovr_exe, gcovr_new_rootdir, lcov_exe, genhtml_exe, llvm_cov_exe) = environment.find_coverage_tools()
 
+    if single_pass:
+        gcov_exe = [llvm_cov_exe, 'gcov'] if use_llvm_cov else ['gcov']
+        if gcov_exe[0] and gcov_supports_json(gcov_exe):
+            return single_pass_coverage(outputs, source_root, subproject_root, build_root, log_dir,
+                                        gcov_exe, genhtml_exe, jobs or multiprocessing.cpu_count())
+        print('{} does not support --json-format, using one pass per report'.format(' '.join(gcov_exe)))
+
     # gcovr >= 4.2 requires a different syntax for out of source builds
     if gcovr_new_rootdir:
         gcovr_base_cmd = [gcovr_exe, '-r', source_root, build_root]
@@ -160,6 +481,10 @@ def run(args: T.List[str]) -> int:
                         const='html', help='generate Html report')
     parser.add_argument('--use_llvm_cov', action='store_true',
                         help='use llvm-cov')
+    parser.add_argument('--single-pass', action='store_true',
+                        help='run gcov once and generate all reports from its output')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='number of gcov processes to run in parallel, 0 for the number of CPUs')
     parser.add_argument('source_root')
     parser.add_argument('subproject_root')
     parser.add_argument('build_root')
@@ -167,7 +492,8 @@ def run(args: T.List[str]) -> int:
     options = parser.parse_args(args)
     return coverage(options.outputs, options.source_root,
                     options.subproject_root, options.build_root,
-                    options.log_dir, options.use_llvm_cov)
+                    options.log_dir, options.use_llvm_cov,
+                    options.single_pass, options.jobs)
 
 if __name__ == '__main__':
     sys.exit(run(sys.argv[1:]))
@@ -17,7 +17,7 @@ import pickle
 import re
 import typing as T
 
-from ..backend.ninjabackend import TargetDependencyScannerInfo
+from ..backend.serialisation import TargetDependencyScannerInfo
 
 import_re = re.compile('\w*import ([a-zA-Z0-9]+);')
 export_re = re.compile('\w*export module ([a-zA-Z0-9]+);')
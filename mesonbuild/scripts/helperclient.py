@@ -0,0 +1,146 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Hand a `meson --internal` command to the helper server of a build dir.
+
+Run by path with `python -S`, so that it starts without importing anything
+but a few stdlib modules:
+
+    helperclient.py SOCKET MESON_COMMAND... --internal SCRIPT ARGS...
+
+The script, its arguments, the working directory, the environment and the
+standard file descriptors are sent to the server listening on SOCKET, which
+runs the script in a forked child and reports back its exit status. When
+no server is running, one is started in the background, and the command
+itself is run by executing MESON_COMMAND as usual. The same happens when
+the server refuses the command, for example because Meson was upgraded
+since it started.
+"""
+
+import marshal
+import os
+import socket
+import struct
+import sys
+import typing as T
+
+_HEADER = struct.Struct('!I')
+_STATUS = struct.Struct('!i')
+ACCEPTED = b'A'
+REFUSED = b'R'
+LOCK_NAME = 'helper.lock'
+# sun_path is 108 bytes on Linux and only 104 on the BSDs
+MAX_SOCKET_PATH = 100
+
+
+def socket_address(path: str) -> str:
+    """Relative paths avoid the short length limit of socket addresses."""
+    if len(path.encode('utf-8', errors='surrogateescape')) <= MAX_SOCKET_PATH:
+        return path
+    return os.path.relpath(path)
+
+
+def recv_exactly(conn: socket.socket, size: int) -> T.Optional[bytes]:
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def encode_request(args: T.List[str]) -> bytes:
+    umask = os.umask(0)
+    os.umask(umask)
+    # marshal is built in and keeps the lone surrogates of undecodable
+    # bytes in the environment, both sides run the same Python.
+    payload = marshal.dumps({'args': args,
+                             'cwd': os.getcwd(),
+                             'env': dict(os.environ),
+                             'umask': umask})
+    return _HEADER.pack(len(payload)) + payload
+
+
+def start_server(sockpath: str, meson_command: T.List[str]) -> None:
+    """Start a server, unless another client is already starting one."""
+    import fcntl
+    import subprocess
+    lockfile = os.path.join(os.path.dirname(sockpath), LOCK_NAME)
+    try:
+        fd = os.open(lockfile, os.O_WRONLY | os.O_CREAT, 0o644)
+    except OSError:
+        return
+    try:
+        # The running server holds the lock as long as it is listening.
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return
+    try:
+        subprocess.Popen(meson_command + ['--internal', 'helperserver', sockpath, '--lock-fd', str(fd)],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         pass_fds=(fd,), start_new_session=True)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def run_on_server(sockpath: str, args: T.List[str]) -> T.Optional[int]:
+    """Run args on the server, or return None if it could not take them."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(socket_address(sockpath))
+        except OSError:
+            return None
+        try:
+            conn.sendmsg([encode_request(args)],
+                         [(socket.SOL_SOCKET, socket.SCM_RIGHTS, struct.pack('3i', 0, 1, 2))])
+            reply = recv_exactly(conn, 1)
+        except OSError:
+            return None
+        if reply != ACCEPTED:
+            return None
+        # From here on the command runs and must not be run a second time.
+        try:
+            status = recv_exactly(conn, _STATUS.size)
+        except OSError:
+            status = None
+    if status is None:
+        print('The Meson helper server stopped while running {!r}'.format(args), file=sys.stderr)
+        return 1
+    return _STATUS.unpack(status)[0]
+
+
+def main(argv: T.List[str]) -> int:
+    sockpath = argv[0]
+    command = argv[1:]
+    split = command.index('--internal')
+    meson_command, args = command[:split], command[split + 1:]
+    try:
+        ret = run_on_server(sockpath, args)
+    except KeyboardInterrupt:
+        # Closing the connection makes the server stop the command
+        return 130
+    if ret is not None:
+        return ret
+    start_server(sockpath, meson_command)
+    sys.stdout.flush()
+    os.execvp(command[0], command)
+    return 1  # unreachable
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
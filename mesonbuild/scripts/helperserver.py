@@ -0,0 +1,331 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A server running `meson --internal` commands for helperclient.
+
+Starting Python and importing Meson takes much longer than most of the
+helper scripts run during a build. The server imports them once and forks a
+child for every command it receives, which runs the script with the
+client's arguments, working directory, environment and standard file
+descriptors. It exits once it was idle for a while, when its socket is
+removed, or when any of the Meson modules it loaded changes.
+"""
+
+import argparse
+import array
+import fcntl
+import marshal
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+import typing as T
+
+from .helperclient import ACCEPTED, REFUSED, LOCK_NAME, _HEADER, _STATUS, recv_exactly
+
+# Commands run for every target of a build, imported before forking.
+PRELOADED_SCRIPTS = ['exe', 'symbolextractor']
+DEFAULT_IDLE_TIMEOUT = 300
+REQUEST_TIMEOUT = 5
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+
+def buildparser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('socket')
+    parser.add_argument('--lock-fd', type=int, default=None,
+                        help='File descriptor of the already locked lock file.')
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help='Seconds without commands after which the server exits.')
+    return parser
+
+
+def exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def meson_module_files() -> T.List[str]:
+    """The files of all Meson modules loaded so far, which the children use."""
+    return sorted(m.__file__ for name, m in list(sys.modules.items())
+                  if (name == 'mesonbuild' or name.startswith('mesonbuild.')) and getattr(m, '__file__', None))
+
+
+def installation_stamp(files: T.List[str]) -> T.List[T.Optional[int]]:
+    stamp = []  # type: T.List[T.Optional[int]]
+    for f in files:
+        try:
+            stamp.append(os.stat(f).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+def peer_is_same_user(conn: socket.socket) -> bool:
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # Only the owner can connect to the socket anyway
+        return True
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+
+class Request:
+    def __init__(self, args: T.List[str], cwd: str, env: T.Dict[str, str], umask: int, fds: T.List[int]):
+        self.args = args
+        self.cwd = cwd
+        self.env = env
+        self.umask = umask
+        self.fds = fds
+
+
+def receive_request(conn: socket.socket) -> T.Optional[Request]:
+    fds = array.array('i')
+    msg, ancdata, _, _ = conn.recvmsg(_HEADER.size, socket.CMSG_LEN(3 * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    try:
+        if len(fds) != 3:
+            return None
+        if len(msg) < _HEADER.size:
+            rest = recv_exactly(conn, _HEADER.size - len(msg))
+            if rest is None:
+                return None
+            msg += rest
+        size = _HEADER.unpack(msg)[0]
+        if size > MAX_REQUEST_SIZE:
+            return None
+        payload = recv_exactly(conn, size)
+        if payload is None:
+            return None
+        request = marshal.loads(payload)
+        received = Request(request['args'], request['cwd'], request['env'], request['umask'], fds.tolist())
+        fds = array.array('i')
+        return received
+    finally:
+        # Only left for requests that are not run
+        for fd in fds:
+            os.close(fd)
+
+
+class HelperServer:
+    def __init__(self, sockname: str, idle_timeout: float):
+        self.sockname = sockname
+        self.idle_timeout = idle_timeout
+        self.stamp_files = meson_module_files()
+        self.stamp = installation_stamp(self.stamp_files)
+        self.children = {}  # type: T.Dict[int, socket.socket]
+        # Children whose client hung up, which were told to terminate
+        self.abandoned = set()  # type: T.Set[int]
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Whoever can connect can run commands as this user
+        umask = os.umask(0o177)
+        try:
+            self.listener.bind(sockname)
+        finally:
+            os.umask(umask)
+        os.chmod(sockname, 0o600)
+        self.listener.listen(64)
+        self.inode = os.stat(sockname).st_ino
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        for fd in (self.wakeup_r, self.wakeup_w):
+            os.set_blocking(fd, False)
+        signal.set_wakeup_fd(self.wakeup_w)
+        # Only installed so that SIGCHLD wakes up select().
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    def socket_removed(self) -> bool:
+        try:
+            return os.stat(self.sockname).st_ino != self.inode
+        except OSError:
+            return True
+
+    def serve(self) -> None:
+        last_active = time.monotonic()
+        while True:
+            # A client only becomes readable once it hangs up
+            clients = [c for pid, c in self.children.items() if pid not in self.abandoned]
+            readable, _, _ = select.select([self.listener, self.wakeup_r] + clients, [], [], 1.0)
+            if self.wakeup_r in readable:
+                try:
+                    while os.read(self.wakeup_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            self.reap()
+            for pid, conn in list(self.children.items()):
+                if conn in readable:
+                    self.abandon(pid)
+            if self.listener in readable:
+                last_active = time.monotonic()
+                if not self.accept():
+                    break
+            if self.children:
+                last_active = time.monotonic()
+            elif time.monotonic() - last_active > self.idle_timeout or self.socket_removed():
+                break
+        self.shutdown()
+
+    def abandon(self, pid: int) -> None:
+        """Stop the command of a client that went away, like on Ctrl-C."""
+        self.abandoned.add(pid)
+        try:
+            os.killpg(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    def shutdown(self) -> None:
+        if not self.socket_removed():
+            os.unlink(self.sockname)
+        self.listener.close()
+        # Wait for the running commands, whose clients wait for their status.
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.finish(pid, status)
+
+    def reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            self.finish(pid, status)
+
+    def finish(self, pid: int, status: int) -> None:
+        conn = self.children.pop(pid, None)
+        self.abandoned.discard(pid)
+        if conn is None:
+            return
+        try:
+            conn.sendall(_STATUS.pack(exit_code(status)))
+        except OSError:
+            pass
+        conn.close()
+
+    def accept(self) -> bool:
+        """Run the command of the next client, return False to shut down."""
+        try:
+            conn, _ = self.listener.accept()
+        except OSError:
+            return True
+        request = None
+        pid = None
+        try:
+            conn.settimeout(REQUEST_TIMEOUT)
+            if not peer_is_same_user(conn):
+                conn.close()
+                return True
+            if installation_stamp(self.stamp_files) != self.stamp:
+                # The client runs the command itself, and starts a new
+                # server once this one is gone.
+                conn.sendall(REFUSED)
+                conn.close()
+                return False
+            request = receive_request(conn)
+            if request is None:
+                conn.close()
+                return True
+            try:
+                pid = os.fork()
+            except OSError:
+                conn.sendall(REFUSED)
+                raise
+            if pid == 0:
+                self.run_child(conn, request)
+            # The command and everything it starts get their own process
+            # group, so they can be stopped together. The child does the
+            # same, whichever runs first.
+            try:
+                os.setpgid(pid, pid)
+            except OSError:
+                pass
+            self.children[pid] = conn
+            conn.sendall(ACCEPTED)
+        except (OSError, EOFError, ValueError, KeyError, TypeError):
+            if pid is None:
+                conn.close()
+        finally:
+            if request is not None:
+                for fd in request.fds:
+                    os.close(fd)
+        return True
+
+    def run_child(self, conn: socket.socket, request: Request) -> None:
+        ret = 1
+        try:
+            os.setpgid(0, 0)
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            conn.close()
+            self.listener.close()
+            for c in self.children.values():
+                c.close()
+            os.close(self.wakeup_r)
+            os.close(self.wakeup_w)
+            for i, fd in enumerate(request.fds):
+                os.dup2(fd, i)
+                os.close(fd)
+            os.chdir(request.cwd)
+            os.umask(request.umask)
+            os.environ.clear()
+            os.environ.update(request.env)
+            from .. import mesonmain
+            mesonmain.ensure_stdout_accepts_unicode()
+            ret = mesonmain.run_script_command(request.args[0], request.args[1:])
+        except SystemExit as e:
+            ret = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(ret or 0)
+
+
+def run(args: T.List[str]) -> int:
+    options = buildparser().parse_args(args)
+    sockdir, sockname = os.path.split(os.path.abspath(options.socket))
+    if options.lock_fd is None:
+        lock_fd = os.open(os.path.join(sockdir, LOCK_NAME), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Another server is running
+            return 0
+    # The socket is bound relative to its directory, the absolute path may
+    # be too long for a socket address.
+    os.chdir(sockdir)
+    try:
+        os.unlink(sockname)
+    except FileNotFoundError:
+        pass
+    from .. import mesonmain
+    import importlib
+    for script in PRELOADED_SCRIPTS:
+        importlib.import_module(mesonmain.script_module_name(script))
+    HelperServer(sockname, options.idle_timeout).serve()
+    return 0
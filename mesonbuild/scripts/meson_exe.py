@@ -16,14 +16,19 @@ import os
 import sys
 import argparse
 import pickle
+import shutil
 import subprocess
+import tempfile
 import typing as T
 
 from .. import mesonlib
-from ..backend.backends import ExecutableSerialisation
+from ..backend.serialisation import ExecutableSerialisation
 
 options = None
 
+# Captured output is compared in chunks of this size
+CHUNK_SIZE = 1024 * 1024
+
 def buildparser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Custom executable wrapper for Meson. Do not run on your own, mmm\'kay?')
     parser.add_argument('--unpickle')
@@ -49,11 +54,28 @@ def run_exe(exe: ExecutableSerialisation) -> int:
                 ['Z:' + p for p in exe.extra_paths] + child_env.get('WINEPATH', '').split(';')
             )
 
-    p = subprocess.Popen(cmd_args, env=child_env, cwd=exe.workdir,
-                         close_fds=False,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-    stdout, stderr = p.communicate()
+    if exe.capture:
+        # The output goes straight to a file next to the captured one, so it
+        # is never held in memory, however large it gets.
+        fd, tempname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(exe.capture)),
+                                        prefix=os.path.basename(exe.capture) + '.')
+        try:
+            with os.fdopen(fd, 'w+b') as stdout:
+                p = subprocess.Popen(cmd_args, env=child_env, cwd=exe.workdir,
+                                     close_fds=False, stdout=stdout)
+                p.wait()
+                if p.returncode != 0:
+                    stdout.seek(0)
+                    shutil.copyfileobj(stdout, sys.stdout.buffer)
+            if p.returncode == 0:
+                replace_if_different(exe.capture, tempname)
+        finally:
+            if os.path.exists(tempname):
+                os.unlink(tempname)
+    else:
+        p = subprocess.Popen(cmd_args, env=child_env, cwd=exe.workdir,
+                             close_fds=False)
+        p.wait()
 
     if exe.pickled and p.returncode != 0:
         print('while executing {!r}'.format(cmd_args))
@@ -62,22 +84,36 @@ def run_exe(exe: ExecutableSerialisation) -> int:
         # STATUS_DLL_NOT_FOUND on Windows indicating a common problem that is otherwise hard to diagnose
         raise FileNotFoundError('due to missing DLLs')
 
-    if exe.capture and p.returncode == 0:
-        skip_write = False
-        try:
-            with open(exe.capture, 'rb') as cur:
-                skip_write = cur.read() == stdout
-        except IOError:
-            pass
-        if not skip_write:
-            with open(exe.capture, 'wb') as output:
-                output.write(stdout)
-    else:
-        sys.stdout.buffer.write(stdout)
-    if stderr:
-        sys.stderr.buffer.write(stderr)
     return p.returncode
 
+def files_equal(a: str, b: str) -> bool:
+    if os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, 'rb') as fa, open(b, 'rb') as fb:
+        while True:
+            chunk = fa.read(CHUNK_SIZE)
+            if chunk != fb.read(CHUNK_SIZE):
+                return False
+            if not chunk:
+                return True
+
+def replace_if_different(dst: str, src: str) -> None:
+    '''Move src to dst, unless dst already has the same content.
+
+    Keeping dst untouched keeps its timestamp, so targets depending on it
+    are not rebuilt.
+    '''
+    try:
+        if files_equal(dst, src):
+            return
+    except OSError:
+        pass
+    # mkstemp creates files only readable by their owner
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(src, 0o666 & ~umask)
+    os.replace(src, dst)
+
 def run(args: T.List[str]) -> int:
     global options
     parser = buildparser()
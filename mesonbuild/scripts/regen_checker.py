@@ -15,6 +15,7 @@
 import sys, os
 import pickle, subprocess
 import typing as T
+from .. import sectionfile
 from ..coredata import CoreData
 from ..backend.vs2010backend import RegenInfo
 
@@ -49,9 +50,7 @@ def run(args: T.List[str]) -> int:
     with open(dumpfile, 'rb') as f:
         regeninfo = pickle.load(f)
         assert isinstance(regeninfo, RegenInfo)
-    with open(coredata_file, 'rb') as f:
-        coredata = pickle.load(f)
-        assert isinstance(coredata, CoreData)
+    coredata, _ = sectionfile.load(coredata_file, CoreData)
     backend = coredata.get_builtin_option('backend')
     assert isinstance(backend, str)
     regen_timestamp = os.stat(dumpfile).st_mtime
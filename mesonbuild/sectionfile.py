@@ -0,0 +1,227 @@
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A versioned storage format with separately loadable sections.
+
+Objects like Build and CoreData are stored as an index followed by one
+pickle per section, each section holding a group of the object's attributes.
+Loading such a file only reads the index; sections are unpickled the first
+time one of their attributes is accessed. Objects that belong to another
+section, like targets referenced from tests, are stored as references and
+resolved on load, so they keep their identity across sections.
+
+The file stays open while sections are left to load, so that they are read
+from the same file as the index even once a regeneration replaced it. Where
+open files can not be replaced, on Windows, all sections are loaded at once.
+"""
+
+import io
+import os
+import pickle
+import struct
+import threading
+import typing as T
+from collections import OrderedDict
+
+from .mesonlib import MesonException, is_windows
+
+MAGIC = b'MESON-SECTIONS\n'
+FORMAT_VERSION = 1
+_LENGTH = struct.Struct('<Q')
+
+# Attributes kept in __dict__ to implement the lazy loading
+_PRIVATE_ATTRS = ('_section_reader', '_loaded_sections')
+
+SectionRef = T.Tuple[str, ...]
+_T = T.TypeVar('_T', bound='SectionedObject')
+
+
+class SectionFileException(MesonException):
+    pass
+
+
+class SectionedObject:
+
+    """Mixin for objects that are stored with sections.
+
+    `sections` maps section names to the attributes stored in them, all
+    other attributes go to the 'core' section.
+    """
+
+    sections = {}  # type: T.Dict[str, T.Tuple[str, ...]]
+
+    def _section_refs(self, section: str) -> T.Dict[int, SectionRef]:
+        """Map ids of objects owned by other sections to a reference.
+
+        Called when dumping `section`.
+        """
+        return {}
+
+    def _resolve_section_ref(self, ref: SectionRef) -> T.Any:
+        raise SectionFileException('Unknown section reference {!r}'.format(ref))
+
+    def _section_of(self, name: str) -> str:
+        for section, attrs in self.sections.items():
+            if name in attrs:
+                return section
+        return 'core'
+
+    def _load_section(self, section: str) -> None:
+        reader = self.__dict__['_section_reader']  # type: SectionReader
+        loaded = self.__dict__['_loaded_sections']  # type: T.Set[str]
+        if section in loaded:
+            return
+        loaded.add(section)
+        # Attributes assigned before their section was loaded take precedence
+        for k, v in reader.load(section, self._resolve_section_ref).items():
+            self.__dict__.setdefault(k, v)
+        if loaded.issuperset(reader.sections):
+            reader.close()
+
+    def _load_all_sections(self) -> None:
+        reader = self.__dict__.get('_section_reader')
+        if reader is None:
+            return
+        for section in reader.sections:
+            self._load_section(section)
+
+    def __getattr__(self, name: str) -> T.Any:
+        # Only called for attributes missing from __dict__, that is, those of
+        # sections that have not been loaded yet.
+        reader = self.__dict__.get('_section_reader')
+        if reader is None or name.startswith('__'):
+            raise AttributeError(name)
+        section = self._section_of(name)
+        if section not in reader.sections or section in self.__dict__['_loaded_sections']:
+            raise AttributeError(name)
+        self._load_section(section)
+        return self.__dict__[name]
+
+    def __getstate__(self) -> T.Dict[str, T.Any]:
+        self._load_all_sections()
+        return {k: v for k, v in self.__dict__.items() if k not in _PRIVATE_ATTRS}
+
+
+class _SectionPickler(pickle.Pickler):
+
+    def __init__(self, f: T.BinaryIO, refs: T.Dict[int, SectionRef]):
+        super().__init__(f)
+        self.refs = refs
+
+    def persistent_id(self, obj: T.Any) -> T.Optional[SectionRef]:
+        return self.refs.get(id(obj))
+
+
+class _SectionUnpickler(pickle.Unpickler):
+
+    def __init__(self, f: T.BinaryIO, resolve: T.Callable[[SectionRef], T.Any]):
+        super().__init__(f)
+        self.resolve = resolve
+
+    def persistent_load(self, pid: SectionRef) -> T.Any:
+        return self.resolve(tuple(pid))
+
+
+class SectionReader:
+
+    """Read the index of a section file and load single sections from it."""
+
+    def __init__(self, filename: str, f: T.BinaryIO):
+        self.filename = filename
+        length = _LENGTH.unpack(f.read(_LENGTH.size))[0]
+        index = pickle.loads(f.read(length))
+        if index.get('version') != FORMAT_VERSION:
+            raise SectionFileException('Unsupported format version {!r}'.format(index.get('version')))
+        self.metadata = index['metadata']  # type: T.Dict[str, T.Any]
+        self.sections = index['sections']  # type: T.Dict[str, T.Tuple[int, int]]
+        self.data_start = f.tell()
+        st = os.fstat(f.fileno())
+        self.stamp = (st.st_mtime_ns, st.st_size)
+        self.file = f  # type: T.Optional[T.BinaryIO]
+        self.lock = threading.Lock()
+
+    def load(self, section: str, resolve: T.Callable[[SectionRef], T.Any]) -> T.Dict[str, T.Any]:
+        offset, length = self.sections[section]
+        try:
+            with self.lock:
+                if self.file is None:
+                    raise SectionFileException('{!r} was closed'.format(self.filename))
+                # Replacing the file leaves this one intact, only writing
+                # over it in place changes it.
+                st = os.fstat(self.file.fileno())
+                if (st.st_mtime_ns, st.st_size) != self.stamp:
+                    raise SectionFileException('{!r} changed since it was loaded'.format(self.filename))
+                self.file.seek(self.data_start + offset)
+                data = self.file.read(length)
+            return _SectionUnpickler(io.BytesIO(data), resolve).load()
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            raise SectionFileException('Could not load section {!r} of {!r}: {}'.format(section, self.filename, e))
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def __del__(self) -> None:
+        self.close()
+
+
+def dumps(obj: SectionedObject, metadata: T.Optional[T.Dict[str, T.Any]] = None) -> bytes:
+    # Everything is serialized before the caller writes anything, obj may
+    # still have to load sections from the file it is about to replace.
+    state = obj.__getstate__()
+    layout = OrderedDict()  # type: T.Dict[str, T.Dict[str, T.Any]]
+    for name, value in state.items():
+        layout.setdefault(obj._section_of(name), OrderedDict())[name] = value
+    payload = io.BytesIO()
+    sections = OrderedDict()  # type: T.Dict[str, T.Tuple[int, int]]
+    for section, attrs in layout.items():
+        start = payload.tell()
+        _SectionPickler(payload, obj._section_refs(section)).dump(attrs)
+        sections[section] = (start, payload.tell() - start)
+    index = pickle.dumps({'version': FORMAT_VERSION,
+                          'metadata': metadata or {},
+                          'sections': sections})
+    return b''.join([MAGIC, _LENGTH.pack(len(index)), index, payload.getvalue()])
+
+
+def load(filename: str, cls: T.Type[_T]) -> T.Tuple[_T, T.Dict[str, T.Any]]:
+    """Load an object of type cls and the metadata stored with it.
+
+    Files written as a single pickle, by older versions, are loaded in full
+    and have no metadata.
+    """
+    f = open(filename, 'rb')
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            obj = pickle.load(f)
+            if not isinstance(obj, cls):
+                raise SectionFileException('{!r} does not contain a {}'.format(filename, cls.__name__))
+            f.close()
+            return obj, {}
+        try:
+            reader = SectionReader(filename, f)
+        except (pickle.UnpicklingError, EOFError, struct.error, KeyError) as e:
+            raise SectionFileException('Invalid index in {!r}: {}'.format(filename, e))
+    except BaseException:
+        f.close()
+        raise
+    obj = cls.__new__(cls)
+    obj.__dict__['_section_reader'] = reader
+    obj.__dict__['_loaded_sections'] = set()
+    if is_windows():
+        obj._load_all_sections()
+    return obj, reader.metadata
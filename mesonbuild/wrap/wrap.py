@@ -14,6 +14,7 @@
 
 from .. import mlog
 import contextlib
+import copy
 import urllib.request
 import urllib.error
 import urllib.parse
@@ -28,6 +29,7 @@ import configparser
 import typing as T
 import textwrap
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from . import WrapMode
 from .. import coredata
@@ -53,6 +55,10 @@ WHITELIST_SUBDOMAIN = 'wrapdb.mesonbuild.com'
 
 ALL_TYPES = ['file', 'git', 'hg', 'svn']
 
+# Directory of the download cache shared by all source trees, where files are
+# stored under the sha256 hash of their contents.
+SHARED_CACHE_ENV_VAR = 'MESON_PACKAGE_CACHE_DIR'
+
 def whitelist_wrapdb(urlstr: str) -> urllib.parse.ParseResult:
     """ raises WrapException if not whitelisted subdomain """
     url = urllib.parse.urlparse(urlstr)
@@ -203,6 +209,7 @@ class Resolver:
         self.wrap_mode = wrap_mode
         self.subdir_root = os.path.join(source_dir, subdir)
         self.cachedir = os.path.join(self.subdir_root, 'packagecache')
+        self.shared_cachedir = os.environ.get(SHARED_CACHE_ENV_VAR) or None
         self.wraps = {} # type: T.Dict[str, PackageDefinition]
         self.provided_deps = {} # type: T.Dict[str, PackageDefinition]
         self.provided_programs = {} # type: T.Dict[str, PackageDefinition]
@@ -480,8 +487,11 @@ class Resolver:
                 dlsize = int(resp.info()['Content-Length'])
             except TypeError:
                 dlsize = None
-            if dlsize is None:
-                print('Downloading file of unknown size.')
+            # Progress of downloads done in parallel would be interleaved
+            show_progress = not mlog.output_captured()
+            if dlsize is None or not show_progress:
+                if show_progress:
+                    print('Downloading file of unknown size.')
                 while True:
                     block = resp.read(blocksize)
                     if block == b'':
@@ -534,20 +544,110 @@ class Resolver:
             raise
         os.rename(tmpfile, ofname)
 
+    def get_shared_cache_path(self, what: str) -> T.Optional[str]:
+        if self.shared_cachedir is None:
+            return None
+        return os.path.join(os.path.expanduser(self.shared_cachedir), self.wrap.get(what + '_hash').lower())
+
+    def get_from_shared_cache(self, what: str, ofname: str) -> bool:
+        shared_path = self.get_shared_cache_path(what)
+        if shared_path is None or not os.path.isfile(shared_path):
+            return False
+        # Prefetching runs on several threads, each needs its own name to
+        # link to, as does every thread adding to the shared cache.
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(ofname))
+        tmpfile = os.path.join(tmpdir, os.path.basename(ofname))
+        try:
+            try:
+                os.link(shared_path, tmpfile)
+            except OSError:
+                shutil.copyfile(shared_path, tmpfile)
+            self.check_hash(what, tmpfile)
+            os.replace(tmpfile, ofname)
+        except (OSError, WrapException) as e:
+            mlog.warning('Ignoring {} in the shared package cache: {}'.format(shared_path, e))
+            return False
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        mlog.log('Using', mlog.bold(self.packagename), what, 'from shared cache.')
+        return True
+
+    def add_to_shared_cache(self, what: str, path: str) -> None:
+        shared_path = self.get_shared_cache_path(what)
+        if shared_path is None or os.path.exists(shared_path):
+            return
+        tmpdir = None  # type: T.Optional[str]
+        try:
+            os.makedirs(os.path.dirname(shared_path), exist_ok=True)
+            tmpdir = tempfile.mkdtemp(dir=os.path.dirname(shared_path))
+            tmpfile = os.path.join(tmpdir, os.path.basename(shared_path))
+            shutil.copyfile(path, tmpfile)
+            os.replace(tmpfile, shared_path)
+        except OSError as e:
+            mlog.debug('Could not add {} to the shared package cache: {}'.format(path, e))
+        finally:
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def fetch(self, what: str) -> str:
+        """Download the source or patch archive into packagecache unless it is there."""
+        cache_path = os.path.join(self.cachedir, self.wrap.get(what + '_filename'))
+        if os.path.exists(cache_path):
+            self.check_hash(what, cache_path)
+            mlog.log('Using', mlog.bold(self.packagename), what, 'from cache.')
+        else:
+            os.makedirs(self.cachedir, exist_ok=True)
+            if not self.get_from_shared_cache(what, cache_path):
+                self.download(what, cache_path)
+        self.add_to_shared_cache(what, cache_path)
+        return cache_path
+
+    def prefetch(self, wraps: T.Iterable[PackageDefinition]) -> None:
+        """Download the archives of wraps that are not extracted yet, in parallel.
+
+        Subprojects are only extracted when they are used, but downloading
+        all archives at once saves waiting for them one after the other.
+        Failures are left to be reported when the subproject is used.
+        """
+        if self.wrap_mode in (WrapMode.nodownload, WrapMode.nofallback):
+            return
+        todo = []  # type: T.List[T.Tuple[PackageDefinition, str]]
+        for wrap in wraps:
+            if not wrap.has_wrap or wrap.type != 'file':
+                continue
+            if os.path.exists(os.path.join(self.subdir_root, wrap.directory)):
+                continue
+            for what in ['source', 'patch']:
+                filename = wrap.values.get(what + '_filename')
+                if what + '_url' in wrap.values and filename and \
+                        not os.path.exists(os.path.join(self.cachedir, filename)):
+                    todo.append((wrap, what))
+        if not todo:
+            return
+
+        def prefetch_one(wrap: PackageDefinition, what: str) -> T.Tuple[str, T.Optional[Exception]]:
+            r = copy.copy(self)
+            r.wrap = wrap
+            r.packagename = wrap.name
+            with mlog.capture_output() as output:
+                try:
+                    r.fetch(what)
+                except (WrapException, OSError) as e:
+                    return output.getvalue(), e
+            return output.getvalue(), None
+
+        with ThreadPoolExecutor() as executor:
+            tasks = [executor.submit(prefetch_one, wrap, what) for wrap, what in todo]
+            for (wrap, what), task in zip(todo, tasks):
+                output, exc = task.result()
+                mlog.debug(output, end='')
+                if exc is not None:
+                    mlog.debug('Could not prefetch {} {}: {}'.format(wrap.name, what, exc))
+
     def get_file_internal(self, what: str) -> str:
         filename = self.wrap.get(what + '_filename')
         if what + '_url' in self.wrap.values:
-            cache_path = os.path.join(self.cachedir, filename)
-
-            if os.path.exists(cache_path):
-                self.check_hash(what, cache_path)
-                mlog.log('Using', mlog.bold(self.packagename), what, 'from cache.')
-                return cache_path
-
-            if not os.path.isdir(self.cachedir):
-                os.mkdir(self.cachedir)
-            self.download(what, cache_path)
-            return cache_path
+            return self.fetch(what)
         else:
             from ..interpreterbase import FeatureNew
             FeatureNew('Local wrap patch files without {}_url'.format(what), '0.55.0').use(self.current_subproject)
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import argparse
+import asyncio
 import time
 import stat
 import subprocess
@@ -25,7 +27,6 @@ import shutil
 import sys
 import unittest
 import platform
-import pickle
 import functools
 import io
 import operator
@@ -34,6 +35,8 @@ import urllib.error
 import urllib.request
 import zipfile
 import hashlib
+import multiprocessing
+import xml.etree.ElementTree as ET
 from itertools import chain
 from unittest import mock
 from configparser import ConfigParser
@@ -51,7 +54,12 @@ import mesonbuild.envconfig
 import mesonbuild.environment
 import mesonbuild.mesonlib
 import mesonbuild.coredata
+import mesonbuild.sectionfile
+import mesonbuild.mtest
+import mesonbuild.astcache
 import mesonbuild.modules.gnome
+import mesonbuild.scripts.coverage
+import mesonbuild.scripts.helperclient
 from mesonbuild.interpreter import Interpreter, ObjectHolder
 from mesonbuild.ast import AstInterpreter
 from mesonbuild.mesonlib import (
@@ -67,7 +75,7 @@ import mesonbuild.dependencies.base
 from mesonbuild.build import Target, ConfigurationData
 import mesonbuild.modules.pkgconfig
 
-from mesonbuild.mtest import TAPParser, TestResult
+from mesonbuild.mtest import TAPParser, TestResult, TestHistory, schedule_tests, shard_tests
 
 from mesonbuild.wrap.wrap import PackageDefinition, WrapException
 
@@ -1292,6 +1300,337 @@ class InternalTests(unittest.TestCase):
 
         self.assertFalse(errors)
 
+    def test_mtest_schedule(self):
+        Test = T.NamedTuple('Test', [('name', str), ('project_name', str), ('suite', T.List[str]),
+                                     ('priority', int), ('is_parallel', bool)])
+        tests = [Test('short', 'p', [], 0, True),
+                 Test('long', 'p', [], 0, True),
+                 Test('serial', 'p', [], 0, False),
+                 Test('new', 'p', [], 0, True),
+                 Test('failing', 'p', [], 0, True),
+                 Test('urgent', 'p', [], 1, True)]
+        durations = {'short': 1.0, 'long': 10.0, 'serial': 2.0, 'failing': 3.0, 'urgent': 0.5}
+
+        def run(**results):
+            return mock.Mock(res=results.get('res', TestResult.OK), duration=results['duration'])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'testhistory.json')
+            history = TestHistory(filename)
+            for t in tests:
+                if t.name in durations:
+                    res = TestResult.FAIL if t.name == 'failing' else TestResult.OK
+                    history.record(t, run(res=res, duration=durations[t.name]))
+            history.save()
+            history = TestHistory(filename)
+            self.assertEqual(history.duration(tests[1]), 10.0)
+            self.assertIsNone(history.duration(tests[3]))
+            self.assertTrue(history.failed(tests[4]))
+            self.assertFalse(history.failed(tests[0]))
+
+            def order(schedule, failed_first):
+                return [t.name for t in schedule_tests(tests, history, schedule, failed_first)]
+
+            # Priority first, then unknown, then the serial tests and longest first
+            self.assertEqual(order('history', False),
+                             ['urgent', 'new', 'serial', 'long', 'failing', 'short'])
+            self.assertEqual(order('history', True),
+                             ['urgent', 'failing', 'new', 'serial', 'long', 'short'])
+            # Without recorded durations the definition order is kept
+            empty = TestHistory(os.path.join(tmpdir, 'none.json'))
+            self.assertEqual([t.name for t in schedule_tests(tests, empty, 'history', False)],
+                             order('definition', False))
+            self.assertEqual(order('definition', False),
+                             ['urgent', 'short', 'long', 'serial', 'new', 'failing'])
+            self.assertEqual(order('definition', True),
+                             ['urgent', 'failing', 'short', 'long', 'serial', 'new'])
+
+            # Interrupted runs are not recorded
+            history.record(tests[1], run(res=TestResult.INTERRUPT, duration=0.1))
+            self.assertEqual(history.duration(tests[1]), 10.0)
+
+            # Corrupted history files are ignored
+            with open(filename, 'w') as f:
+                f.write('{')
+            self.assertEqual(TestHistory(filename).entries, {})
+
+    def test_mtest_shard(self):
+        Test = T.NamedTuple('Test', [('name', str), ('project_name', str), ('suite', T.List[str])])
+        tests = [Test('test{}'.format(i), 'p', ['s']) for i in range(20)]
+
+        def shards(history, count):
+            return [shard_tests(tests, history, i, count) for i in range(1, count + 1)]
+
+        # Without history every test ends up in exactly one shard
+        without = shards(None, 3)
+        self.assertEqual(sorted(t.name for s in without for t in s), sorted(t.name for t in tests))
+        self.assertEqual(without, shards(None, 3))
+        # and the definition order is kept within a shard
+        for s in without:
+            self.assertEqual(s, sorted(s, key=tests.index))
+        self.assertEqual(shards(None, 1), [tests])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            history = TestHistory(os.path.join(tmpdir, 'testhistory.json'))
+            for i, t in enumerate(tests[:10]):
+                history.record(t, mock.Mock(res=TestResult.OK, duration=float(i + 1)))
+            with_history = shards(history, 2)
+            self.assertEqual(sorted(t.name for s in with_history for t in s), sorted(t.name for t in tests))
+            loads = [sum(history.duration(t) or 0 for t in s) for s in with_history]
+            self.assertLessEqual(abs(loads[0] - loads[1]), 1.0)
+
+        for value in ['1/2', '2/2']:
+            self.assertEqual(mesonbuild.mtest.parse_shard(value), tuple(int(i) for i in value.split('/')))
+        for value in ['0/2', '3/2', '1', 'a/b', '1/2/3']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                mesonbuild.mtest.parse_shard(value)
+
+    def test_mutable_interpreter_object(self):
+        class Holder(mesonbuild.interpreterbase.MutableInterpreterObject):
+            pass
+
+        # Every mutable object has to know how to copy its data
+        with self.assertRaises(TypeError):
+            Holder()
+
+    def test_internal_command_imports(self):
+        # Helper scripts run once per build step, they must not import the
+        # modules used to configure a project.
+        code = textwrap.dedent('''\
+            import importlib, sys
+            from mesonbuild import mesonmain
+            for script in ['exe', 'depscan', 'symbolextractor']:
+                importlib.import_module(mesonmain.script_module_name(script))
+            print(' '.join(sorted(m for m in sys.modules if m.startswith('mesonbuild'))))
+            ''')
+        out = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(__file__),
+                                      universal_newlines=True)
+        modules = out.split()
+        self.assertIn('mesonbuild.scripts.meson_exe', modules)
+        for m in ['mesonbuild.build', 'mesonbuild.coredata', 'mesonbuild.environment',
+                  'mesonbuild.interpreter', 'mesonbuild.backend.backends', 'mesonbuild.msetup']:
+            self.assertNotIn(m, modules)
+
+    def test_coverage_line_ranges(self):
+        line_ranges = mesonbuild.scripts.coverage.line_ranges
+        self.assertEqual(line_ranges([]), '')
+        self.assertEqual(line_ranges([3]), '3')
+        self.assertEqual(line_ranges([1, 2, 3, 5, 7, 8]), '1-3,5,7-8')
+
+    def test_cmake_trace_json_streaming(self):
+        from mesonbuild.cmake import CMakeException
+        from mesonbuild.cmake.traceparser import CMakeTraceParser
+        lines = [json.dumps({'version': {'major': 1, 'minor': 2}})]
+
+        def call(cmd, *args):
+            lines.append(json.dumps({'args': list(args), 'cmd': cmd, 'file': '/src/CMakeLists.txt',
+                                     'frame': 1, 'line': len(lines), 'time': 0.0}))
+
+        call('set', 'MESON_PS_DELAYED_CALLS', 'add_library')
+        call('meson_ps_reload_vars')
+        call('add_library', 'foo', 'INTERFACE')
+        call('SET', 'FOO', 'a;b')
+        # Lines of unhandled functions are not even decoded
+        lines.append('{"args":[broken,"cmd":"message"}')
+        call('meson_ps_execute_delayed_calls')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            parser = CMakeTraceParser('3.17', Path(tmpdir))
+            parser.trace_file_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+            parser.parse()
+            self.assertEqual(parser.get_cmake_var('FOO'), ['a', 'b'])
+            self.assertEqual(list(parser.targets), ['foo'])
+            self.assertEqual(parser.stored_commands, [])
+            parser.trace_file_path.write_text('', encoding='utf-8')
+            with self.assertRaises(CMakeException):
+                parser.parse()
+
+    def test_meson_exe_capture(self):
+        from mesonbuild.scripts import meson_exe
+        from mesonbuild.backend.serialisation import ExecutableSerialisation
+        with tempfile.TemporaryDirectory() as tmpdir:
+            capture = os.path.join(tmpdir, 'out.txt')
+
+            def run(code):
+                exe = ExecutableSerialisation([sys.executable, '-c', code], capture=capture)
+                with mock.patch('sys.stdout', io.TextIOWrapper(io.BytesIO())):
+                    ret = meson_exe.run_exe(exe)
+                self.assertEqual(os.listdir(tmpdir), ['out.txt'] if os.path.exists(capture) else [])
+                return ret
+
+            # Larger than a compare chunk
+            code = 'import sys; sys.stdout.write("{}" * 1500000)'
+            with mock.patch.object(meson_exe, 'CHUNK_SIZE', 1000):
+                self.assertEqual(run(code.format('a')), 0)
+                self.assertEqual(os.path.getsize(capture), 1500000)
+                umask = os.umask(0)
+                os.umask(umask)
+                self.assertEqual(stat.S_IMODE(os.stat(capture).st_mode), 0o666 & ~umask)
+                inode = os.stat(capture).st_ino
+                self.assertEqual(run(code.format('a')), 0)
+                self.assertEqual(os.stat(capture).st_ino, inode)
+                self.assertEqual(run(code.format('b')), 0)
+                with open(capture, 'rb') as f:
+                    self.assertEqual(f.read(1), b'b')
+            # Failed commands do not touch the file
+            self.assertEqual(run('import sys; print("c"); sys.exit(1)'), 1)
+            with open(capture, 'rb') as f:
+                self.assertEqual(f.read(1), b'b')
+
+    def test_mtest_output_reader(self):
+        async def read(chunks, **kwargs):
+            stream = asyncio.StreamReader()
+            for c in chunks:
+                stream.feed_data(c)
+            stream.feed_eof()
+            lines = []
+            reader = mesonbuild.mtest.OutputReader(lines.append, **kwargs)
+            await reader.read(stream)
+            return reader.getvalue(), lines
+
+        def run(chunks, **kwargs):
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(read(chunks, **kwargs))
+            finally:
+                loop.close()
+
+        # Lines are passed on however the output is split up
+        out, lines = run([b'ok 1\nok', b' 2\n', b'not ok 3 \xc3', b'\xa4\n1..3'])
+        self.assertEqual(out, 'ok 1\nok 2\nnot ok 3 \xe4\n1..3')
+        self.assertEqual(lines, ['ok 1', 'ok 2', 'not ok 3 \xe4', '1..3'])
+
+        # Only the last lines that fit into max_size are kept
+        chunks = ['line {}\n'.format(i).encode() for i in range(1000)]
+        out, lines = run(chunks, max_size=100)
+        self.assertEqual(len(lines), 1000)
+        kept = out.split('\n', 1)[1]
+        self.assertTrue(kept.startswith('line '))
+        self.assertTrue(kept.endswith('line 999\n'))
+        self.assertLessEqual(len(kept), 100)
+        dropped = len(b''.join(chunks)) - len(kept)
+        self.assertEqual(out.split('\n', 1)[0], '[{} bytes of output were dropped]'.format(dropped))
+
+    def test_mtest_merge_results(self):
+        def write_logs(logdir, results):
+            os.makedirs(logdir)
+            junit = mesonbuild.mtest.JunitBuilder(os.path.join(logdir, 'testlog.junit.xml'))
+            with open(os.path.join(logdir, 'testlog.json'), 'w') as f:
+                for name, res in results:
+                    run = mock.Mock(res=res, results=[], junit=None, project='p', stdo='', stde='',
+                                    starttime=0.0, duration=1.0, returncode=0, env={}, cmd=['x'])
+                    mesonbuild.mtest.write_json_log(f, name, run)
+                    junit.log(name, run)
+            junit.write()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_logs(os.path.join(tmpdir, 'a', 'meson-logs'), [('t1', TestResult.OK), ('t2', TestResult.FAIL)])
+            write_logs(os.path.join(tmpdir, 'b'), [('t3', TestResult.SKIP)])
+            out = os.path.join(tmpdir, 'out')
+            options = argparse.Namespace(wd=out, logbase='testlog',
+                                         merge_results=[os.path.join(tmpdir, 'a'), os.path.join(tmpdir, 'b')])
+            with mock.patch('sys.stdout', io.StringIO()):
+                self.assertEqual(mesonbuild.mtest.merge_results(options), 1)
+
+            with open(os.path.join(out, 'meson-logs', 'testlog.json')) as f:
+                self.assertEqual([json.loads(l)['name'] for l in f], ['t1', 't2', 't3'])
+            root = ET.parse(os.path.join(out, 'meson-logs', 'testlog.junit.xml')).getroot()
+            self.assertEqual(root.attrib, {'tests': '3', 'errors': '0', 'failures': '1'})
+            suites = root.findall('testsuite')
+            self.assertEqual(len(suites), 1)
+            self.assertEqual(suites[0].get('skipped'), '1')
+            self.assertEqual([c.get('name') for c in suites[0].findall('testcase')], ['t1', 't2', 't3'])
+
+    def test_lexer(self):
+        code = "x = [1, 0x1f] # c\nif x != 'a\\'b'\\\n  y += '''m\nl'''\nendif\n"
+        tokens = [(t.tid, t.lineno, t.colno, t.value) for t in mesonbuild.mparser.Lexer(code).lex('f')]
+        self.assertEqual(tokens, [
+            ('id', 1, 0, 'x'), ('assign', 1, 2, None), ('lbracket', 1, 4, None),
+            ('number', 1, 5, 1), ('comma', 1, 6, None), ('number', 1, 8, 31),
+            ('rbracket', 1, 12, None), ('eol', 1, 17, None),
+            ('if', 2, 0, None), ('id', 2, 3, 'x'), ('nequal', 2, 5, None), ('string', 2, 8, "a'b"),
+            ('id', 3, 2, 'y'), ('plusassign', 3, 4, None), ('string', 3, 7, 'm\nl'), ('eol', 4, 4, None),
+            ('endif', 5, 0, None), ('eol', 5, 5, None)])
+        # Errors are reported at the last character of preceding whitespace
+        with self.assertRaises(mesonbuild.mparser.ParseException) as cm:
+            list(mesonbuild.mparser.Lexer('x =   $').lex('f'))
+        self.assertEqual((cm.exception.lineno, cm.exception.colno), (1, 5))
+        with self.assertRaises(mesonbuild.mparser.ParseException) as cm:
+            list(mesonbuild.mparser.Lexer('x = "a"').lex('f'))
+        self.assertEqual((cm.exception.lineno, cm.exception.colno), (1, 4))
+
+    def test_ast_cache(self):
+        code = "project('foo', 'c')\nx = ['a', 'b']\nif x.length() > 1\n  message(x)\nendif\n"
+        printer = mesonbuild.ast.AstPrinter()
+        mesonbuild.mparser.Parser(code, 'meson.build').parse().accept(printer)
+        expected = printer.result
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = mesonbuild.astcache.ASTCache(os.path.join(tmpdir, 'cache'), max_entries=2)
+            filename = os.path.join(tmpdir, 'meson.build')
+            self.assertIsNone(cache.get(filename, code))
+            cache.parse(code, filename)
+            ast = cache.get(filename, code)
+            self.assertIsInstance(ast, mesonbuild.mparser.CodeBlockNode)
+            self.assertEqual(ast.filename, filename)
+            printer = mesonbuild.ast.AstPrinter()
+            ast.accept(printer)
+            self.assertEqual(printer.result, expected)
+
+            # Changed contents and other file names are misses
+            self.assertIsNone(cache.get(filename, code + '\n'))
+            self.assertIsNone(cache.get(os.path.join(tmpdir, 'sub', 'meson.build'), code))
+
+            # Damaged entries are ignored and replaced
+            entry = glob(os.path.join(tmpdir, 'cache', '*'))
+            self.assertEqual(len(entry), 1)
+            with open(entry[0], 'r+b') as f:
+                f.truncate(os.path.getsize(entry[0]) // 2)
+            self.assertIsNone(cache.get(filename, code))
+            cache.parse(code, filename)
+            self.assertIsNotNone(cache.get(filename, code))
+
+            # Files that cause warnings are not cached
+            with mock.patch('mesonbuild.mlog.log_warnings_counter', 0), \
+                    mock.patch('mesonbuild.mlog.warning', side_effect=lambda *a, **k: setattr(mesonbuild.mlog, 'log_warnings_counter', 1)):
+                warncode = "f(a : 1, a : 2)\n"
+                cache.parse(warncode, filename + '.warn')
+            self.assertIsNone(cache.get(filename + '.warn', warncode))
+
+            # Least recently used entries are evicted
+            os.utime(entry[0], (0, 0))
+            for i in range(2):
+                cache.parse(code, os.path.join(tmpdir, str(i), 'meson.build'))
+            self.assertEqual(cache.evict(), 1)
+            self.assertIsNone(cache.get(filename, code))
+
+    def test_link_dep_closure(self):
+        env = get_fake_env()
+
+        def lib(cls, name, **kwargs):
+            return cls(name, 'sub' + name, '', MachineChoice.HOST, [], [], env, kwargs)
+
+        # A diamond through a static library, and a ladder of 40 static
+        # libraries with 2**40 paths to the bottom one
+        d = lib(mesonbuild.build.SharedLibrary, 'd')
+        b = lib(mesonbuild.build.StaticLibrary, 'b', link_with=[d], pic=True)
+        c = lib(mesonbuild.build.SharedLibrary, 'c', link_with=[d])
+        a = lib(mesonbuild.build.SharedLibrary, 'a', link_with=[b, c])
+        self.assertEqual(list(a.get_link_dep_closure()), [b, d, c])
+        self.assertEqual(a.get_dependencies(), [b, d, c])
+        self.assertEqual(a.get_transitive_link_deps(), [d, c])
+        self.assertEqual(a.get_all_link_deps(), [a, d, c])
+        self.assertEqual(list(a.get_link_dep_subdirs()), ['subd', 'subc'])
+        self.assertEqual(list(a.get_link_deps_mapping('/usr', env)),
+                         ['@rpath/libd.dylib', '@rpath/libc.dylib', '@rpath/liba.dylib'])
+
+        rungs = [d, b]
+        for i in range(40):
+            rungs.append(lib(mesonbuild.build.StaticLibrary, 'l{}'.format(i), link_with=rungs[:-3:-1], pic=True))
+        exe = lib(mesonbuild.build.Executable, 'exe', link_with=rungs[-1])
+        self.assertEqual(exe.get_dependencies(), rungs[:1:-1] + [b, d])
+        self.assertEqual(exe.get_transitive_link_deps(), [d])
+        self.assertEqual(list(exe.get_link_dep_subdirs()), ['subd'])
+
 @unittest.skipIf(is_tarball(), 'Skipping because this is a tarball release')
 class DataTests(unittest.TestCase):
 
@@ -1466,6 +1805,8 @@ class DataTests(unittest.TestCase):
         interp = Interpreter(FakeBuild(env), mock=True)
         astint = AstInterpreter('.', '', '')
         self.assertEqual(set(interp.funcs.keys()), set(astint.funcs.keys()))
+        # Without a build directory there is no AST cache to write to
+        self.assertIsNone(interp.ast_cache)
 
     def test_mesondata_is_up_to_date(self):
         from mesonbuild.mesondata import mesondata
@@ -2121,6 +2462,240 @@ class AllPlatformTests(BasePlatformTests):
             self.assertTrue(os.path.isdir(d))
             self.assertTrue(os.path.isabs(d))
 
+    def test_compiler_check_batch(self):
+        env = get_fake_env(bdir=self.builddir)
+        cc = env.detect_c_compiler(MachineChoice.HOST)
+        batch = cc.check_batch(env)
+        batch.add(cc.has_header, 'stdio.h', '', env)
+        batch.add(cc.has_function, 'hfkerhisadf', '', env)
+        batch.add(cc.has_header, 'ouagadougou.h', '', env)
+        self.assertEqual(batch.run(), [(True, False), (False, False), (False, False)])
+        # Everything is in the compiler check cache now
+        self.assertEqual(cc.has_headers(['stdio.h', 'ouagadougou.h'], '', env),
+                         [(True, True), (False, True)])
+        self.assertEqual(cc.has_functions(['hfkerhisadf'], '', env), [(False, True)])
+
+    def test_coalesced_compiler_checks(self):
+        env = get_fake_env(bdir=self.builddir)
+        cc = env.detect_c_compiler(MachineChoice.HOST)
+        if cc.get_argument_syntax() == 'msvc':
+            raise unittest.SkipTest('Relies on __has_include in the preprocessor')
+        cache = env.coredata.compiler_check_cache
+        headers = ['stdio.h', 'stdlib.h', 'ouagadougou.h', 'string.h']
+        self.assertEqual(cc.has_headers(headers, '', env),
+                         [(True, False), (True, False), (False, False), (True, False)])
+        # One preprocessor run plus the recorded result of every has_header()
+        self.assertEqual(len(cache), len(headers) + 1)
+        for h in headers:
+            self.assertEqual(cc.has_header(h, '', env)[1], True)
+        # Only the failing types are checked on their own
+        self.assertEqual(cc.sizeofs(['char', 'struct meson_no_such_type', 'short'], '', env),
+                         [1, -1, cc.sizeof('short', '', env)])
+
+    def test_persistent_check_cache(self):
+        '''
+        Test that compiler checks are shared between build directories
+        through the check_cache option.
+        '''
+        testdir = os.path.join(self.common_test_dir, '33 has header')
+        with tempfile.TemporaryDirectory() as cachedir:
+            out1 = self.init(testdir, extra_args=['--check-cache=' + cachedir])
+            entries = list(Path(cachedir).glob('*/*.json'))
+            self.assertNotEqual(entries, [])
+            # Failed checks, like the one for a missing header, are not kept
+            for e in entries:
+                self.assertEqual(json.loads(e.read_text(encoding='utf-8'))['returncode'], 0)
+            self.new_builddir()
+            out2 = self.init(testdir, extra_args=['--check-cache=' + cachedir])
+            self.assertGreater(out2.count('(cached)'), out1.count('(cached)'))
+            self.assertEqual(len(list(Path(cachedir).glob('*/*.json'))), len(entries))
+            # Evicting keeps only the most recently used entries
+            cache = mesonbuild.compilers.checkcache.CheckCache(cachedir, max_entries=1)
+            self.assertEqual(len(list(Path(cachedir).glob('*/*.json'))), 1)
+            self.assertEqual(cache.evict(), 0)
+
+    def test_sectioned_build_data(self):
+        '''
+        Test that build.dat is loaded one section at a time and that objects
+        shared between sections keep their identity.
+        '''
+        testdir = os.path.join(self.common_test_dir, '2 cpp')
+        self.init(testdir)
+        b = mesonbuild.build.load(self.builddir)
+        self.assertEqual(b._loaded_sections, set())
+        self.assertEqual(b.test_setups, {})
+        self.assertEqual(b._loaded_sections, {'test_setups'})
+        tests = b.get_tests()
+        self.assertNotEqual(tests, [])
+        self.assertIn(tests[0].exe, b.targets.values())
+        self.assertEqual(b._loaded_sections, {'test_setups', 'tests', 'targets', 'environment'})
+        self.assertIs(next(iter(b.targets.values())).environment, b.environment)
+        # Assignments win over sections loaded later
+        b.project_name = 'other'
+        self.assertEqual(b.project_version, 'undefined')
+        self.assertEqual(b.project_name, 'other')
+        with self.assertRaises(AttributeError):
+            b.no_such_attribute
+        cdata = mesonbuild.coredata.load(self.builddir)
+        self.assertNotIn('compiler_check_cache', cdata._loaded_sections)
+        self.assertEqual(cdata.get_builtin_option('backend'), 'ninja')
+        # Sections are still read from the file that was loaded after a
+        # regeneration replaced it
+        b = mesonbuild.build.load(self.builddir)
+        self.assertEqual(b.test_setups, {})
+        self.init(testdir, extra_args=['--reconfigure'])
+        self.assertNotEqual(b.get_tests(), [])
+        self.assertEqual(b.install_scripts, [])
+
+    @skipIfNoExecutable('ninja')
+    def test_backend_subninja(self):
+        '''
+        Test that with backend_subninja the statements of every subdir go to
+        their own file, which is not rewritten when it does not change.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('{!r} backend can\'t split build files'.format(self.backend.name))
+        testdir = os.path.join(self.common_test_dir, '131 include order')
+        self.init(testdir, extra_args=['-Dbackend_subninja=true'])
+        subninja_dir = Path(self.privatedir, 'subninja')
+        mtimes = {p.name: p.stat().st_mtime_ns for p in subninja_dir.iterdir()}
+        self.assertIn('sub4.ninja', mtimes)
+        with open(os.path.join(self.builddir, 'build.ninja'), encoding='utf-8') as f:
+            self.assertIn('subninja meson-private/subninja/sub4.ninja', f.read())
+        self.assertTrue(any('sub4' in c['file'] for c in self.get_compdb()))
+        # Only changes the link rules in build.ninja
+        self.setconf('-Dbackend_max_links=2')
+        self.assertEqual({p.name: p.stat().st_mtime_ns for p in subninja_dir.iterdir()}, mtimes)
+        self.build()
+
+    @skipIfNoExecutable('ninja')
+    def test_backend_subninja_names(self):
+        '''
+        Test that subdirs whose names look like the encoded name of another
+        one get their own Ninja file.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('{!r} backend can\'t split build files'.format(self.backend.name))
+        testdir = os.path.join(self.unit_test_dir, '89 subninja names')
+        self.init(testdir, extra_args=['-Dbackend_subninja=true'])
+        names = sorted(p.name for p in Path(self.privatedir, 'subninja').iterdir())
+        self.assertEqual(names, ['@root.ninja', 'a%40b.ninja', 'a@b.ninja', 'toplevel.ninja'])
+        self.build()
+        for prog in ['prog', 'toplevel/prog_toplevel', 'a@b/prog_at', 'a/b/prog_slash']:
+            self.assertPathExists(os.path.join(self.builddir, prog + exe_suffix))
+
+    def test_compdb_matches_ninja(self):
+        '''
+        Test that the compilation database written by the backend is the one
+        `ninja -t compdb -x` computes, also with response files, and that it
+        can be split per subproject.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('Compiler db not available with {} backend'.format(self.backend.name))
+        ninja = detect_ninja('1.10')
+        if ninja is None:
+            raise unittest.SkipTest('Ninja too old to list outputs in its compiler db')
+        testdir = os.path.join(self.common_test_dir, '113 subdir subproject')
+        for threshold in ['0', str(2 ** 20)]:
+            self.new_builddir()
+            with mock.patch.dict(os.environ, {'MESON_RSP_THRESHOLD': threshold}):
+                self.init(testdir, extra_args=['-Dbackend_compdb_per_subproject=true'])
+                rules = ['c_COMPILER', 'c_COMPILER_RSP']
+                ninja_db = json.loads(subprocess.check_output(ninja + ['-t', 'compdb', '-x'] + rules,
+                                                              cwd=self.builddir, universal_newlines=True))
+            with open(os.path.join(self.builddir, 'compile_commands.json'), encoding='utf-8') as f:
+                self.assertEqual(json.load(f), ninja_db)
+            with open(os.path.join(self.builddir, 'subprojects', 'sub', 'compile_commands.json'), encoding='utf-8') as f:
+                sub_db = json.load(f)
+            self.assertEqual(sub_db, [e for e in ninja_db if 'subprojects' in e['file']])
+            self.assertNotEqual(sub_db, [])
+
+    @skipIfNoExecutable('ninja')
+    def test_backend_generate_jobs(self):
+        '''
+        Test that generating targets in several processes gives the same
+        build statements and introspection data as generating them serially.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('{!r} backend does not generate in parallel'.format(self.backend.name))
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise unittest.SkipTest('Parallel generation needs fork')
+        testdir = os.path.join(self.common_test_dir, '131 include order')
+        results = []
+        for jobs in ['1', '3']:
+            self.new_builddir()
+            self.init(testdir, extra_args=['-Dbackend_generate_jobs=' + jobs])
+            with open(os.path.join(self.builddir, 'build.ninja'), encoding='utf-8') as f:
+                statements = sorted(l.replace(self.builddir, '@BUILDDIR@') for l in f)
+            targets = self.introspect('--targets')
+            for t in targets:
+                t['filename'] = [f.replace(self.builddir, '@BUILDDIR@') for f in t['filename']]
+                for s in t['target_sources']:
+                    s['parameters'] = [a.replace(self.builddir, '@BUILDDIR@') for a in s['parameters']]
+                    s['generated_sources'] = [a.replace(self.builddir, '@BUILDDIR@') for a in s['generated_sources']]
+            results.append((statements, targets))
+            self.build()
+        self.assertEqual(results[0], results[1])
+
+    @skipIfNoExecutable('ninja')
+    def test_backend_helper_server(self):
+        '''
+        Test that with backend_helper_server wrapped commands start a server,
+        which then runs them, and that the server exits once its socket is
+        removed.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('{!r} backend does not use the helper server'.format(self.backend.name))
+        if is_windows():
+            raise unittest.SkipTest('The helper server needs fork and Unix sockets')
+        import fcntl
+        testdir = os.path.join(self.common_test_dir, '110 custom target capture')
+        self.init(testdir, extra_args=['-Dbackend_helper_server=true'])
+        with open(os.path.join(self.builddir, 'build.ninja'), encoding='utf-8') as f:
+            self.assertIn('helperclient.py', f.read())
+        # The first command starts the server and runs on its own
+        self.build()
+        self.assertTrue(os.path.isfile(os.path.join(self.builddir, 'data.dat')))
+        sockpath = os.path.join(self.privatedir, 'helper.sock')
+        for _ in range(100):
+            if os.path.exists(sockpath):
+                break
+            time.sleep(0.1)
+        else:
+            self.fail('The helper server did not start')
+        self.assertEqual(stat.S_IMODE(os.stat(sockpath).st_mode), 0o600)
+        # Running the meson command given for the fallback would fail
+        client = mesonbuild.scripts.helperclient.__file__
+        cmd = [sys.executable, '-S', client, sockpath, '/nonexistent/meson', '--internal',
+               'exe', '--', sys.executable, '-c', 'import os, sys; print(os.environ["HELPER_VAR"]); sys.exit(3)']
+        p = subprocess.run(cmd, cwd=self.builddir, stdout=subprocess.PIPE, universal_newlines=True,
+                           env=dict(os.environ, HELPER_VAR='served'))
+        self.assertEqual(p.returncode, 3)
+        self.assertEqual(p.stdout.strip(), 'served')
+        # Commands of clients that go away are stopped
+        code = 'import time; open("started", "w").close(); time.sleep(2); open("finished", "w").close()'
+        cmd = [sys.executable, '-S', client, sockpath, '/nonexistent/meson', '--internal',
+               'exe', '--', sys.executable, '-c', code]
+        p = subprocess.Popen(cmd, cwd=self.builddir)
+        for _ in range(100):
+            if os.path.exists(os.path.join(self.builddir, 'started')):
+                break
+            time.sleep(0.1)
+        p.kill()
+        p.wait()
+        time.sleep(3)
+        self.assertFalse(os.path.exists(os.path.join(self.builddir, 'finished')))
+        os.unlink(sockpath)
+        with open(os.path.join(self.privatedir, 'helper.lock'), 'w') as lock:
+            for _ in range(100):
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            else:
+                self.fail('The helper server did not exit')
+
     def test_static_library_overwrite(self):
         '''
         Tests that static libraries are never appended to, always overwritten.
@@ -2277,6 +2852,83 @@ class AllPlatformTests(BasePlatformTests):
             self.assertGreater(count, 0, 'Log is missing entry for {}'.format(name))
             self.assertLess(count, 2, 'Log has multiple entries for {}'.format(name))
 
+    def test_install_parallel_copy_modes(self):
+        '''
+        Tests that installing in parallel and with other copy modes prints,
+        logs and installs the same as installing one file after the other.
+        '''
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('{!r} backend can\'t install files'.format(self.backend.name))
+        testdir = os.path.join(self.common_test_dir, '60 install subdir')
+        self.init(testdir)
+        self.build()
+        srcfiles = {p: p.stat().st_mode for p in Path(testdir).rglob('*')}
+
+        def install(*args):
+            destdir = os.path.join(self.builddir, '-'.join(args))
+            out = self._run(self.meson_command + ['install', '--no-rebuild'] + list(args),
+                            workdir=self.builddir, override_envvars={'DESTDIR': destdir})
+            with open(os.path.join(self.builddir, 'meson-logs', 'install-log.txt')) as f:
+                log = f.read()
+            files = sorted((str(p.relative_to(destdir)), p.stat().st_mode) for p in Path(destdir).rglob('*'))
+            return out.replace(destdir, 'DESTDIR'), log.replace(destdir, 'DESTDIR'), files
+
+        expected = install('--num-processes=1')
+        self.assertGreater(len(expected[2]), 10)
+        for args in [('--num-processes=8',),
+                     ('--num-processes=8', '--copy-mode=hardlink'),
+                     ('--num-processes=8', '--copy-mode=reflink')]:
+            self.assertEqual(install(*args), expected)
+        # Hard links must not have changed the permissions of the sources
+        self.assertEqual({p: p.stat().st_mode for p in Path(testdir).rglob('*')}, srcfiles)
+
+    def test_install_incremental(self):
+        if self.backend is not Backend.ninja:
+            raise unittest.SkipTest('{!r} backend can\'t install files'.format(self.backend.name))
+        if shutil.which('strip') is None:
+            raise unittest.SkipTest('strip not found')
+        with tempfile.TemporaryDirectory() as tdir:
+            testdir = os.path.join(tdir, 'src')
+            shutil.copytree(os.path.join(self.common_test_dir, '40 library chain'), testdir)
+            self.init(testdir, extra_args=['-Dstrip=true'])
+            self.build()
+            exe = os.path.join(self.builddir, 'prog' + exe_suffix)
+
+            def install():
+                out = self._run(self.meson_command + ['install', '--no-rebuild', '--incremental'],
+                                workdir=self.builddir, override_envvars={'DESTDIR': self.installdir})
+                with open(os.path.join(self.builddir, 'meson-logs', 'install-log.txt')) as f:
+                    log = f.read()
+                mtimes = {p: p.stat().st_mtime_ns for p in Path(self.installdir).rglob('*') if p.is_file()}
+                return out, log, mtimes
+
+            out, _, mtimes = install()
+            self.assertIn('Stripping target', out)
+            # Nothing changed
+            out, log, mtimes2 = install()
+            self.assertNotIn('Installing', out)
+            self.assertIn('Skipped 1 files', out)
+            self.assertIn(os.path.join(self.installdir, 'usr', 'bin', 'prog' + exe_suffix), log)
+            self.assertEqual(mtimes2, mtimes)
+            # Rebuilt to the same contents
+            os.utime(exe, ns=(0, os.stat(exe).st_mtime_ns + 10 ** 9))
+            out2, log2, mtimes2 = install()
+            self.assertIn('Skipped 1 files', out2)
+            self.assertEqual((log2, mtimes2), (log, mtimes))
+            # Changed after installation
+            installed = next(iter(mtimes))
+            os.utime(installed, ns=(0, mtimes[installed] + 10 ** 9))
+            out2, log2, mtimes2 = install()
+            self.assertIn('Stripping target', out2)
+            self.assertEqual(log2, log)
+            # Rebuilt with other contents
+            with open(os.path.join(testdir, 'main.c'), 'a') as f:
+                f.write('int changed = 1;\n')
+            self.build()
+            out2, log2, mtimes2 = install()
+            self.assertIn('Stripping target', out2)
+            self.assertNotEqual(mtimes2, mtimes)
+
     def test_uninstall(self):
         exename = os.path.join(self.installdir, 'usr/bin/prog' + exe_suffix)
         testdir = os.path.join(self.common_test_dir, '8 install')
@@ -2452,6 +3104,40 @@ class AllPlatformTests(BasePlatformTests):
 
         self.assertFailedTestCount(2, self.mtest_command + ['--no-suite', 'subprjfail:fail', '--no-suite', 'subprjmix:fail'])
 
+    def test_shard_history(self):
+        '''
+        Test that shards only depend on the history passed explicitly, not
+        on the one of the build directory.
+        '''
+        testdir = os.path.join(self.common_test_dir, '17 comparison')
+        self.init(testdir)
+        self.build()
+
+        def shards(*args):
+            return [self._run(self.mtest_command + ['--list', '--shard={}/3'.format(i)] + list(args)).split()
+                    for i in range(1, 4)]
+
+        before = shards()
+        self.run_tests()
+        history = os.path.join(self.logdir, 'testhistory.json')
+        self.assertPathExists(history)
+        self.assertEqual(shards(), before)
+        balanced = shards('--shard-history=' + history)
+        self.assertEqual(sorted(sum(balanced, [])), sorted(sum(before, [])))
+        with self.assertRaises(subprocess.CalledProcessError):
+            self._run(self.mtest_command + ['--shard-history=' + history])
+
+    def test_environment_copy_on_write(self):
+        '''
+        Test that an environment object modified after it was passed to
+        test() changes the test, also when copies of it share its data.
+        '''
+        testdir = os.path.join(self.unit_test_dir, '90 environment copy on write')
+        self.init(testdir)
+        envs = {t['name']: t['env']['VAR'] for t in self.introspect('--tests')}
+        self.assertEqual(envs, {'unshared': 'after', 'original': 'after', 'copy of original': 'before',
+                                'borrower': 'after', 'lender': 'before'})
+
     def test_build_by_default(self):
         testdir = os.path.join(self.common_test_dir, '130 build by default')
         self.init(testdir)
@@ -4010,15 +4696,15 @@ class AllPlatformTests(BasePlatformTests):
     def __reconfigure(self, change_minor=False):
         # Set an older version to force a reconfigure from scratch
         filename = os.path.join(self.privatedir, 'coredata.dat')
-        with open(filename, 'rb') as f:
-            obj = pickle.load(f)
+        obj, _ = mesonbuild.sectionfile.load(filename, mesonbuild.coredata.CoreData)
         if change_minor:
             v = mesonbuild.coredata.version.split('.')
             obj.version = '.'.join(v[0:2] + [str(int(v[2]) + 1)])
         else:
             obj.version = '0.47.0'
+        data = mesonbuild.sectionfile.dumps(obj, {'version': obj.version})
         with open(filename, 'wb') as f:
-            pickle.dump(obj, f)
+            f.write(data)
 
     def test_reconfigure(self):
         testdir = os.path.join(self.unit_test_dir, '48 reconfigure')
@@ -4865,6 +5551,39 @@ class AllPlatformTests(BasePlatformTests):
         except et.DocumentInvalid as e:
             self.fail(e.error_log)
 
+    def test_tap_streaming(self):
+        with tempfile.TemporaryDirectory() as srcdir:
+            with open(os.path.join(srcdir, 'tap.py'), 'w') as f:
+                f.write(textwrap.dedent('''\
+                    import sys
+                    print('1..3')
+                    print('ok 1 first')
+                    print('not ok 2 second')
+                    # Much more output than what is kept for the log
+                    line = '# ' + 'x' * 1000 + '\\n'
+                    for _ in range(20000):
+                        sys.stdout.write(line)
+                    print('ok 3 last')
+                    '''))
+            with open(os.path.join(srcdir, 'meson.build'), 'w') as f:
+                f.write(textwrap.dedent('''\
+                    project('tap streaming')
+                    python = import('python').find_installation()
+                    test('tap', python, args : files('tap.py'), protocol : 'tap')
+                    '''))
+            self.init(srcdir)
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                self._run(self.mtest_command + ['--no-rebuild'])
+            out = cm.exception.output
+            # The failing subtest is reported before the test finishes
+            self.assertLess(out.index('tap subtest 2 second FAIL'), out.index('1/1 tap'))
+            with open(os.path.join(self.logdir, 'testlog.txt'), encoding='utf-8') as f:
+                log = f.read()
+            self.assertRegex(log, r'\[\d+ bytes of output were dropped\]')
+            self.assertIn('ok 3 last', log)
+            self.assertNotIn('ok 1 first', log)
+            self.assertLess(len(log), 2 * mesonbuild.mtest.MAX_OUTPUT_SIZE)
+
     def test_junit_valid_tap(self):
         self._test_junit(os.path.join(self.common_test_dir, '207 tap tests'))
 
@@ -5052,6 +5771,34 @@ class AllPlatformTests(BasePlatformTests):
         self.run_target('coverage-xml')
         self._check_coverage_files(['xml'])
 
+    def test_coverage_single_pass(self):
+        if mesonbuild.environment.detect_msys2_arch():
+            raise unittest.SkipTest('Skipped due to problems with coverage on MSYS2')
+        testdir = os.path.join(self.common_test_dir, '106 generatorcustom')
+        env = get_fake_env(testdir, self.builddir, self.prefix)
+        cc = env.detect_c_compiler(MachineChoice.HOST)
+        if cc.get_id() != 'gcc':
+            raise unittest.SkipTest('Test only applies to GCC')
+        if not mesonbuild.scripts.coverage.gcov_supports_json(['gcov']):
+            raise unittest.SkipTest('gcov without --json-format')
+        self.init(testdir, extra_args=['-Db_coverage=true', '-Dcoverage_single_pass=true'])
+        self.build()
+        self.run_tests()
+        self.run_target('coverage-text')
+        self.run_target('coverage-xml')
+        self._check_coverage_files(['text', 'xml'])
+        covdir = Path(self.builddir, 'meson-logs')
+        self.assertRegex((covdir / 'coverage.txt').read_text(), r'main\.c +2 +2 +100%')
+        root = ET.parse(str(covdir / 'coverage.xml')).getroot()
+        self.assertEqual(root.get('lines-covered'), '2')
+        self.assertEqual([c.get('filename') for c in root.iter('class')], ['main.c'])
+        # Objects whose coverage data did not change are not run again
+        cache = Path(self.privatedir, 'gcov-cache')
+        mtimes = {p.name: p.stat().st_mtime_ns for p in cache.iterdir()}
+        self.assertNotEqual(mtimes, {})
+        self.run_target('coverage-text')
+        self.assertEqual({p.name: p.stat().st_mtime_ns for p in cache.iterdir()}, mtimes)
+
     def test_cross_file_constants(self):
         with temp_filename() as crossfile1, temp_filename() as crossfile2:
             with open(crossfile1, 'w') as f:
@@ -5083,6 +5830,86 @@ class AllPlatformTests(BasePlatformTests):
                              ['--sysroot=/toolchain/sysroot', '-DSOMETHING', '-DSOMETHING_ELSE'])
 
     @unittest.skipIf(is_windows(), 'Directory cleanup fails for some reason')
+    def test_wrap_download_cache(self):
+        import http.server
+        import socketserver
+        testdir = os.path.join(self.unit_test_dir, '74 wrap file url')
+        requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.lstrip('/')
+                requests.append(name)
+                with open(os.path.join(testdir, 'subprojects', name), 'rb') as f:
+                    data = f.read()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+
+        def sha256(name):
+            with open(os.path.join(testdir, 'subprojects', name), 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+
+        server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                cachedir = os.path.join(tmpdir, 'cache')
+                env = {'MESON_PACKAGE_CACHE_DIR': cachedir}
+                srcdirs = [os.path.join(tmpdir, 'src1'), os.path.join(tmpdir, 'src2')]
+                for srcdir in srcdirs:
+                    shutil.copytree(testdir, srcdir)
+                    with open(os.path.join(srcdir, 'subprojects', 'foo.wrap'), 'w') as f:
+                        f.write(textwrap.dedent('''\
+                            [wrap-file]
+                            directory = foo
+                            source_url = {0}foo.tar.xz
+                            source_filename = foo.tar.xz
+                            source_hash = {1}
+                            patch_url = {0}foo-patch.tar.xz
+                            patch_filename = foo-patch.tar.xz
+                            patch_hash = {2}
+                            ''').format(url, sha256('foo.tar.xz'), sha256('foo-patch.tar.xz')))
+                    # Never used, but downloaded by wrap_prefetch
+                    with open(os.path.join(srcdir, 'subprojects', 'unused.wrap'), 'w') as f:
+                        f.write(textwrap.dedent('''\
+                            [wrap-file]
+                            directory = unused
+                            source_url = {}foo-patch.tar.xz
+                            source_filename = unused.tar.xz
+                            source_hash = {}
+                            ''').format(url, sha256('foo-patch.tar.xz')))
+
+                self.init(srcdirs[0], extra_args=['-Dwrap_prefetch=true'], override_envvars=env)
+                self.assertEqual(sorted(requests), ['foo-patch.tar.xz', 'foo-patch.tar.xz', 'foo.tar.xz'])
+                self.assertPathExists(os.path.join(srcdirs[0], 'subprojects', 'packagecache', 'unused.tar.xz'))
+                self.assertPathDoesNotExist(os.path.join(srcdirs[0], 'subprojects', 'unused'))
+                self.assertEqual(sorted(os.listdir(cachedir)), sorted([sha256('foo.tar.xz'), sha256('foo-patch.tar.xz')]))
+
+                # Another source tree gets the files from the shared cache
+                self.new_builddir()
+                out = self.init(srcdirs[1], override_envvars=env)
+                self.assertEqual(len(requests), 3)
+                self.assertIn('Using foo source from shared cache.', out)
+                self.assertIn('Using foo patch from shared cache.', out)
+                # No temporary files are left behind
+                self.assertEqual(sorted(os.listdir(os.path.join(srcdirs[1], 'subprojects', 'packagecache'))),
+                                 ['foo-patch.tar.xz', 'foo.tar.xz'])
+                self.build()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
     def test_wrap_git(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             srcdir = os.path.join(tmpdir, 'src')
@@ -9273,6 +10100,44 @@ class SubprojectsCommandTests(BasePlatformTests):
         self._subprojects_cmd(['update', '--reset'])
         self.assertEqual(self._git_local_commit(subp_name), self._git_remote_commit(subp_name))
 
+    def test_num_processes(self):
+        names = ['sub{}'.format(i) for i in range(4)]
+        for name in names:
+            self._git_create_remote_repo(name)
+            self._wrap_create_git(name)
+
+        def check_grouped(out, command):
+            # The output of every subproject starts with the command and its
+            # name, and is not interleaved with the output of others.
+            out = out.split('WARNING:')[0]
+            blocks = re.split(r'^(?={} )'.format(command), out, flags=re.MULTILINE)[1:]
+            self.assertEqual(sorted(b.split()[1].rstrip('.') for b in blocks), names)
+            blocks = {b.split()[1].rstrip('.'): b for b in blocks}
+            for name, block in blocks.items():
+                for other in names:
+                    if other != name:
+                        self.assertNotIn(other, block)
+
+        out = self._subprojects_cmd(['download', '--num-processes', '4'])
+        check_grouped(out, 'Download')
+        for name in names:
+            self.assertEqual(self._git_local_commit(name), self._git_remote_commit(name))
+
+        for name in names:
+            self._git_create_remote_commit(name, 'master')
+        # One subproject that is not a git repository fails without --reset,
+        # which must not stop the others from being updated.
+        windows_proof_rmtree(str(self.subprojects_dir / names[1]))
+        self._create_project(self.subprojects_dir / names[1])
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self._subprojects_cmd(['update', '--num-processes', '4'])
+        check_grouped(cm.exception.output, 'Updating')
+        self.assertIn('Not a git repository', cm.exception.output)
+        self.assertIn('could have been left in conflict state: ' + names[1], cm.exception.output)
+        for name in names:
+            if name != names[1]:
+                self.assertEqual(self._git_local_commit(name), self._git_remote_commit(name))
+
     @skipIfNoExecutable('true')
     def test_foreach(self):
         self._create_project(self.subprojects_dir / 'sub_file')
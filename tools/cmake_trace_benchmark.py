@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures how long it takes to parse json-v1 CMake traces of growing size.
+
+The synthetic traces look like those of large projects, most of their lines
+are calls of functions the trace parser does not handle, like if() or
+string(), with long expanded arguments. Besides the time to parse, the peak
+memory allocated while parsing is printed. It grows with the variables and
+targets the parser keeps, but stays far below the size of the trace, which
+is never held in memory as a whole. For comparison, the time to decode every
+line of the trace as JSON is printed as well.
+'''
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mesonbuild.cmake.traceparser import CMakeTraceParser  # noqa: E402
+
+UNHANDLED = ['if', 'endif', 'string', 'list', 'get_filename_component', 'foreach', 'endforeach', 'message']
+
+
+def write_trace(path: Path, n: int) -> None:
+    rng = random.Random(n)
+    with path.open('w', encoding='utf-8') as f:
+        f.write(json.dumps({'version': {'major': 1, 'minor': 2}}) + '\n')
+        for i in range(n):
+            if i % 20 == 0:
+                cmd, args = 'set', ['VAR{}'.format(i), ';'.join('/usr/include/dir{}'.format(j) for j in range(20))]
+            elif i % 100 == 1:
+                cmd, args = 'add_library', ['lib{}'.format(i), 'INTERFACE']
+            else:
+                cmd = rng.choice(UNHANDLED)
+                args = ['ARG{}'.format(j) * 5 for j in range(rng.randint(1, 30))]
+            f.write(json.dumps({'args': args, 'cmd': cmd, 'file': '/src/cmake/module{}.cmake'.format(i % 50),
+                                'frame': 2, 'global_frame': 2, 'line': i, 'time': 0.0}) + '\n')
+
+
+def parse(build_dir: Path) -> float:
+    parser = CMakeTraceParser('3.17', build_dir)
+    start = time.perf_counter()
+    parser.parse()
+    return time.perf_counter() - start
+
+
+def decode_all(path: Path) -> float:
+    start = time.perf_counter()
+    with path.open(encoding='utf-8') as f:
+        for line in f:
+            json.loads(line)
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--sizes', type=int, nargs='+', default=[100000, 200000, 400000],
+                        help='Numbers of lines of the generated traces.')
+    options = parser.parse_args()
+
+    for n in options.sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            build_dir = Path(tmpdir)
+            trace = build_dir / 'cmake_trace.txt'
+            write_trace(trace, n)
+            size = trace.stat().st_size
+            tracemalloc.start()
+            elapsed = parse(build_dir)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            # Measured again without the overhead of tracemalloc
+            elapsed = min(elapsed, parse(build_dir))
+            decode = decode_all(trace)
+        print('n = {:8} {:7.1f} MiB trace: parse {:7.3f}s, peak {:7.1f} MiB; decoding every line {:7.3f}s'.format(
+            n, size / 2 ** 20, elapsed, peak / 2 ** 20, decode))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures how the time to configure generated projects scales with their size.
+
+Every benchmark generates a project of n statements of some kind and
+configures it for growing values of n. If the interpreter handles these
+statements in linear time, the time per statement stays about the same.
+'''
+
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+import textwrap
+import time
+import typing as T
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mesonbuild import mesonmain  # noqa: E402
+
+
+def make_project(body: str) -> str:
+    return "project('benchmark')\n" + textwrap.dedent(body)
+
+def gen_plusassign(n: int) -> str:
+    items = ', '.join("'src{}.c'".format(i) for i in range(n))
+    return make_project('''
+        sources = []
+        foreach s : [{}]
+          sources += s
+        endforeach
+        assert(sources.length() == {})
+        '''.format(items, n))
+
+def gen_configuration_data(n: int) -> str:
+    # A large config.h that is passed through many variables before use
+    names = ', '.join("'FEATURE{}'".format(i) for i in range(n))
+    return make_project('''
+        conf = configuration_data()
+        foreach name : [{0}]
+          conf.set('HAVE_' + name, 1, description : 'Define if ' + name + ' is available')
+        endforeach
+        foreach name : [{0}]
+          c = conf
+        endforeach
+        configure_file(output : 'config.h', configuration : c)
+        '''.format(names))
+
+def gen_link_graph(n: int) -> str:
+    # Every library links to the two before it, so there are exponentially
+    # many paths to the first ones. Every other library is a static one.
+    lines = ["add_languages('c')",
+             "src = configure_file(output : 'lib.c', configuration : configuration_data())",
+             "lib0 = shared_library('lib0', src)",
+             "lib1 = static_library('lib1', src, link_with : lib0, pic : true)"]
+    for i in range(2, n):
+        func = 'static_library' if i % 2 else 'shared_library'
+        lines.append("lib{0} = {1}('lib{0}', src, link_with : [lib{2}, lib{3}], pic : true)".format(i, func, i - 1, i - 2))
+    return make_project('\n'.join(lines))
+
+BENCHMARKS = {
+    'configuration_data': gen_configuration_data,
+    'link_graph': gen_link_graph,
+    'plusassign': gen_plusassign,
+}  # type: T.Dict[str, T.Callable[[int], str]]
+
+def configure(code: str) -> float:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        srcdir = Path(tmpdir, 'src')
+        srcdir.mkdir()
+        (srcdir / 'meson.build').write_text(code, encoding='utf-8')
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ret = mesonmain.run(['setup', str(Path(tmpdir, 'build')), str(srcdir)], sys.argv[0])
+        elapsed = time.perf_counter() - start
+    if ret != 0:
+        raise SystemExit('Configuring the generated project failed.')
+    return elapsed
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--sizes', type=int, nargs='+', default=[1000, 2000, 4000, 8000, 16000],
+                        help='Sizes of the generated projects.')
+    parser.add_argument('benchmarks', nargs='*', default=sorted(BENCHMARKS),
+                        help='Benchmarks to run, out of {} (default: all).'.format(', '.join(sorted(BENCHMARKS))))
+    options = parser.parse_args()
+    for name in options.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark {!r}'.format(name))
+
+    # The fixed cost of configuring, subtracted from all measurements
+    base = min(configure(make_project('')) for _ in range(3))
+    for name in options.benchmarks:
+        print('{}:'.format(name))
+        for n in options.sizes:
+            elapsed = configure(BENCHMARKS[name](n)) - base
+            print('  n = {:6} {:8.3f}s {:8.2f}us per statement'.format(n, elapsed, elapsed / n * 1e6))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures how long it takes to lex and to parse a corpus of build files.
+
+By default all meson.build files in "test cases" are used, which must be run
+from the source root. Files that do not parse, of which there are a few on
+purpose, are skipped. The best time of all repetitions is printed.
+'''
+
+import argparse
+import sys
+import time
+import typing as T
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mesonbuild import mlog, mparser  # noqa: E402
+
+
+def load_corpus(dirs: T.List[str]) -> T.List[T.Tuple[str, str]]:
+    corpus = []  # type: T.List[T.Tuple[str, str]]
+    for d in dirs:
+        for f in sorted(Path(d).glob('**/meson.build')):
+            try:
+                code = f.read_text(encoding='utf-8')
+                mparser.Parser(code, str(f)).parse()
+            except (UnicodeDecodeError, mparser.MesonException):
+                continue
+            corpus.append((code, str(f)))
+    return corpus
+
+def best_of(repeat: int, func: T.Callable[[], None]) -> float:
+    times = []  # type: T.List[float]
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def lex_all(corpus: T.List[T.Tuple[str, str]]) -> None:
+    for code, filename in corpus:
+        for _ in mparser.Lexer(code).lex(filename):
+            pass
+
+def parse_all(corpus: T.List[T.Tuple[str, str]]) -> None:
+    for code, filename in corpus:
+        mparser.Parser(code, filename).parse()
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of times every measurement is repeated (default: 5).')
+    parser.add_argument('dirs', nargs='*', default=['test cases'],
+                        help='Directories to search for meson.build files (default: "test cases").')
+    options = parser.parse_args()
+
+    # Some test cases warn on purpose
+    mlog.disable()
+    corpus = load_corpus(options.dirs)
+    if not corpus:
+        raise SystemExit('No build files found in {}.'.format(', '.join(options.dirs)))
+    size = sum(len(code) for code, _ in corpus)
+    tokens = sum(1 for code, filename in corpus for _ in mparser.Lexer(code).lex(filename))
+
+    lex = best_of(options.repeat, lambda: lex_all(corpus))
+    parse = best_of(options.repeat, lambda: parse_all(corpus))
+    print('{} files, {} bytes, {} tokens'.format(len(corpus), size, tokens))
+    print('lex:   {:8.3f}s {:10.0f} tokens/s'.format(lex, tokens / lex))
+    print('parse: {:8.3f}s {:10.0f} bytes/s (including lexing)'.format(parse, size / parse))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 The Meson development team
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures the startup cost of `meson --internal` helper scripts.
+
+For every helper a fresh interpreter imports what `meson --internal <name>`
+imports before running the helper: mesonmain and the script module. The
+number of imported modules, of which those of Meson itself, and the best
+import time of all repetitions are printed.
+'''
+
+import argparse
+import json
+import subprocess
+import sys
+import typing as T
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from mesonbuild import mesonmain  # noqa: E402
+
+DEFAULT_HELPERS = ['exe', 'depscan', 'symbolextractor', 'vcstagger', 'regencheck',
+                   'delsuffix', 'cleantrees', 'depfixer', 'scanbuild', 'coverage']
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from mesonbuild import mesonmain
+import importlib
+importlib.import_module(mesonmain.script_module_name(sys.argv[1]))
+elapsed = time.perf_counter() - start
+print(json.dumps([len(sys.modules),
+                  sum(1 for m in sys.modules if m.split('.')[0] == 'mesonbuild'),
+                  elapsed]))
+'''
+
+def probe(helper: str) -> T.Tuple[int, int, float]:
+    out = subprocess.run([sys.executable, '-c', PROBE, helper], cwd=str(ROOT),
+                         stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    modules, meson_modules, elapsed = json.loads(out)
+    return modules, meson_modules, elapsed
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of times every measurement is repeated (default: 5).')
+    parser.add_argument('helpers', nargs='*', default=DEFAULT_HELPERS,
+                        help='Helpers to measure (default: {}).'.format(', '.join(DEFAULT_HELPERS)))
+    options = parser.parse_args()
+    for helper in options.helpers:
+        if not (ROOT / (mesonmain.script_module_name(helper).replace('.', '/') + '.py')).is_file():
+            parser.error('unknown helper {!r}'.format(helper))
+
+    print('{:16} {:>8} {:>8} {:>10}'.format('helper', 'modules', 'meson', 'time'))
+    for helper in options.helpers:
+        results = [probe(helper) for _ in range(options.repeat)]
+        modules, meson_modules, _ = results[0]
+        elapsed = min(r[2] for r in results)
+        print('{:16} {:8} {:8} {:8.1f}ms'.format(helper, modules, meson_modules, elapsed * 1000))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())